@@ -0,0 +1,98 @@
+"""
+Benchmark for the export backends of the build script.
+
+This script exports the notebooks in the notebooks/ and apps/ directories with each export
+backend of build.py ("subprocess" and "worker"), and compares the time they take. The
+shared environments are created before timing, so only the exports themselves are measured.
+
+The script can be run from the command line with optional arguments:
+    uv run .github/scripts/benchmark.py [--backends subprocess,worker] [--jobs N] [--repeat N]
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "jinja2==3.1.3",
+#     "fire==0.7.0",
+#     "loguru==0.7.0",
+#     "watchfiles==1.1.0",
+#     "brotli==1.1.0",
+#     "pyarrow==21.0.0",
+#     "packaging==25.0"
+# ]
+# ///
+
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import fire
+from loguru import logger
+
+import build
+
+
+def _benchmark_backend(backend: str, jobs: int, repeat: int) -> List[float]:
+    """Export all notebooks and apps with a backend, and measure how long it takes.
+
+    Each round exports into a new temporary directory, so nothing is reused from a previous
+    round. With the worker backend, the workers are stopped after each round, so every round
+    includes starting them.
+
+    Args:
+        backend (str): Export backend, "subprocess" or "worker"
+        jobs (int): Number of notebooks to export in parallel
+        repeat (int): Number of rounds
+
+    Returns:
+        List[float]: Wall time of each round in seconds
+    """
+    env_root = build.ENV_DIR.resolve()
+    times = []
+    for round_number in range(1, repeat + 1):
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            try:
+                for folder, as_app in build.NOTEBOOK_FOLDERS:
+                    build._export(folder, Path(tmp), as_app=as_app, jobs=jobs, env_root=env_root, backend=backend)
+            finally:
+                build._close_workers()
+            times.append(time.perf_counter() - start)
+        logger.info(f"{backend} round {round_number}/{repeat}: {times[-1]:.1f}s")
+    return times
+
+
+def main(backends: Union[str, Tuple[str, ...]] = build.BACKENDS, jobs: int = 1, repeat: int = 3) -> None:
+    """Compare the export backends on the notebooks and apps in this repository.
+
+    Command line arguments:
+        --backends: Backends to compare, separated by commas (default: subprocess,worker)
+        --jobs: Number of notebooks to export in parallel (default: 1)
+        --repeat: Number of rounds per backend (default: 3)
+
+    Returns:
+        None
+    """
+    # fire passes "a,b" as a tuple, but a single backend as a string
+    backends = backends.split(",") if isinstance(backends, str) else list(backends)
+
+    # Create the shared environments up front, so they are not part of the measurements
+    notebooks = [nb for folder, _ in build.NOTEBOOK_FOLDERS if folder.exists() for nb in build._notebook_files(folder)]
+    for nb in notebooks:
+        build._shared_environment(nb, build.ENV_DIR.resolve())
+
+    results = {backend: _benchmark_backend(backend, jobs, repeat) for backend in backends}
+
+    lines = [f"{'Backend':<12}  {'Mean (s)':>8}  {'Min (s)':>8}  {'Per notebook (s)':>16}"]
+    for backend, times in results.items():
+        lines.append(
+            f"{backend:<12}  {statistics.mean(times):>8.1f}  {min(times):>8.1f}  "
+            f"{statistics.mean(times) / max(1, len(notebooks)):>16.2f}"
+        )
+    logger.info(f"Exported {len(notebooks)} notebooks {repeat} time(s) with {jobs} job(s):\n" + "\n".join(lines))
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
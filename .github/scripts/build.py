@@ -6,9 +6,12 @@ an index.html file that lists all the notebooks. It handles both regular noteboo
 (from the notebooks/ directory) and apps (from the apps/ directory).
 
 The script can be run from the command line with optional arguments:
-    uv run .github/scripts/build.py [--output-dir OUTPUT_DIR]
+    uv run .github/scripts/build.py [--output-dir OUTPUT_DIR] [--jobs N] [--watch]
 
 The exported files will be placed in the specified output directory (default: _site).
+A build manifest (build-manifest.json) is kept in the output directory, so notebooks
+that have not changed since the previous build are not exported again. The time, peak
+memory and output size of every export is written to build-report.json.
 """
 
 # /// script
@@ -16,85 +19,3157 @@ The exported files will be placed in the specified output directory (default: _s
 # dependencies = [
 #     "jinja2==3.1.3",
 #     "fire==0.7.0",
-#     "loguru==0.7.0"
+#     "loguru==0.7.0",
+#     "watchfiles==1.1.0",
+#     "brotli==1.1.0",
+#     "pyarrow==21.0.0",
+#     "packaging==25.0"
 # ]
 # ///
 
+import ast
+import base64
+import builtins
+import cProfile
+import email.parser
+import glob
+import graphlib
+import gzip
+import hashlib
+import html
+import html.parser
+import io
+import json
+import os
+import posixpath
+import pstats
+import queue
+import re
+import shutil
 import subprocess
-from typing import List, Union
+import sys
+import tempfile
+import threading
+import time
+import tokenize
+import tomllib
+import urllib.parse
+import urllib.request
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Tuple, Union
 from pathlib import Path
 
+import brotli
 import jinja2
 import fire
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import watchfiles
 
 from loguru import logger
+from packaging.requirements import Requirement
+from packaging.specifiers import SpecifierSet
+from packaging.utils import canonicalize_name
+from packaging.version import InvalidVersion, Version
 
-def _export_html_wasm(notebook_path: Path, output_dir: Path, as_app: bool = False) -> bool:
+# The shared loader the notebooks read their datasets with, for reading CSV files the same way.
+# No bytecode is written, as it would be exported with the rest of public/.
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "notebooks" / "public"))
+sys.dont_write_bytecode = True
+import dataloader  # noqa: E402
+
+# Name of the build manifest kept in the output directory
+MANIFEST_FILE = "build-manifest.json"
+
+# Name of the build report (time, memory and size of every export) in the output directory
+REPORT_FILE = "build-report.json"
+
+# Name of the cProfile output written by --profile in the output directory
+PROFILE_FILE = "build-profile.prof"
+
+# Folders with notebooks to export, and whether they are exported as apps
+NOTEBOOK_FOLDERS: List[Tuple[Path, bool]] = [(Path("notebooks"), False), (Path("apps"), True)]
+
+# Precompressed sidecars are only kept when they are at most this fraction of the original size
+MAX_COMPRESSION_RATIO = 0.95
+
+# Formats that are usually compressed already. They are probed before compressing them fully.
+COMPRESSED_SUFFIXES = {".br", ".gif", ".gz", ".jpeg", ".jpg", ".parquet", ".png", ".webp", ".whl", ".woff2", ".zip"}
+
+# Suffixes of the precompressed sidecars written next to the files in the output directory
+SIDECAR_SUFFIXES = (".gz", ".br")
+
+# Files at least this large are compressed with a lower brotli quality (quality 11 is very slow
+# on large files), and are scheduled one by one rather than in batches
+LARGE_FILE_BYTES = 1_000_000
+
+# Defaults for rewriting public/*.parquet files, see [tool.marimo-build.parquet] in pyproject.toml
+PARQUET_ROW_GROUP_SIZE = 100_000
+PARQUET_COMPRESSION_LEVEL = 9
+
+# String columns with at most this share of distinct values are dictionary encoded
+PARQUET_DICTIONARY_MAX_RATIO = 0.5
+
+# Name of the manifest written into the folder of a partitioned dataset, and the file name
+# used for the partition of rows without a value for the partition key
+PARTITION_MANIFEST_FILE = "manifest.json"
+PARTITION_NULL_VALUE = "__HIVE_DEFAULT_PARTITION__"
+
+# Elements whose content the HTML minifier leaves as it is (except the notebook code in <marimo-code>)
+RAW_TEXT_REGEX = re.compile(r"(<(script|style|pre|textarea|template|marimo-code)\b[^>]*>)(.*?)(</\2\s*>)", re.S | re.I)
+
+# Elements that flow inline with the text around them, so whitespace between two of them shows as a
+# space. The HTML minifier keeps one space there, and removes the whitespace next to any other tag.
+PHRASING_ELEMENTS = frozenset({
+    "a", "abbr", "audio", "b", "bdi", "bdo", "br", "button", "canvas", "cite", "code", "data", "del", "dfn", "em",
+    "embed", "i", "iframe", "img", "input", "ins", "kbd", "label", "map", "mark", "math", "meter", "object", "output",
+    "picture", "progress", "q", "ruby", "s", "samp", "select", "small", "span", "strong", "sub", "sup", "svg", "time",
+    "u", "var", "video", "wbr",
+})
+
+# The name of the tag at the start of a string, e.g. "span" in "</span>"
+TAG_NAME_REGEX = re.compile(r"</?([a-zA-Z][\w-]*)")
+
+# Sections of the user config embedded in the pages that only the editor uses, left out of apps
+RUN_MODE_UNUSED_CONFIG = ("ai", "completion", "formatting", "keymap", "language_servers", "save", "server", "snippets")
+
+# How long running a notebook for its output snapshot (--snapshot) may take
+SNAPSHOT_TIMEOUT_S = 600
+
+# Shows the output snapshot embedded in a page (a <template id="marimo-snapshot"> with an element
+# per cell output) above the notebook. The output of a cell is removed when the kernel in the browser
+# has rendered its own, and the rest 10 seconds after the first one, for cells that render nothing.
+SNAPSHOT_SCRIPT = """(() => {
+  const template = document.getElementById("marimo-snapshot");
+  const root = document.getElementById("root");
+  if (!template || !root) return;
+  const snapshot = document.createElement("div");
+  snapshot.className = "marimo-snapshot";
+  snapshot.inert = true;
+  snapshot.append(template.content.cloneNode(true));
+  root.before(snapshot);
+  const total = snapshot.children.length;
+  let timer = null;
+  let scheduled = false;
+  const done = () => {
+    snapshot.remove();
+    observer.disconnect();
+    clearTimeout(timer);
+  };
+  const update = () => {
+    scheduled = false;
+    for (const output of [...snapshot.children]) {
+      const rendered = document.getElementById(`output-${output.dataset.cellId}`);
+      if (rendered && (rendered.childElementCount || rendered.textContent.trim())) output.remove();
+    }
+    if (!snapshot.children.length) done();
+    else if (snapshot.children.length < total && timer === null) timer = setTimeout(done, 10000);
+  };
+  const observer = new MutationObserver(() => {
+    if (!scheduled) {
+      scheduled = true;
+      requestAnimationFrame(update);
+    }
+  });
+  observer.observe(root, { childList: true, subtree: true, characterData: true });
+})();"""
+
+# Layout of the output snapshot, close to that of the notebook in medium width
+SNAPSHOT_STYLE = ".marimo-snapshot{max-width:1110px;margin:0 auto;padding:2rem 1rem}.marimo-snapshot>div{margin-bottom:1rem}"
+
+# Where the exported pages download the pyodide runtime from, and the files every page loads from there
+PYODIDE_CDN_URL = "https://cdn.jsdelivr.net/pyodide/v{version}/full/"
+PYODIDE_RUNTIME_FILES = ("pyodide.js", "pyodide.asm.js", "pyodide.asm.wasm", "python_stdlib.zip")
+
+# Lock file with the pyodide packages, downloaded by the pages for their marimo version
+PYODIDE_LOCK_URL = "https://wasm.marimo.app/pyodide-lock.json?v={marimo_version}&pyodide=v{pyodide_version}"
+
+# Folder in the output directory with the pyodide lock files precomputed for the notebooks
+LOCKS_DIR = "locks"
+
+# Values of the environment markers of requirements (e.g. 'sys_platform == "win32"') in pyodide that
+# don't depend on its version. The Python and Emscripten versions come from the lock file of the page.
+PYODIDE_MARKERS = {
+    "implementation_name": "cpython", "platform_python_implementation": "CPython", "os_name": "posix",
+    "sys_platform": "emscripten", "platform_system": "Emscripten", "platform_machine": "wasm32", "platform_version": "#1",
+}
+
+# Data files larger than this are not prefetched when the link to a notebook is hovered
+PREFETCH_MAX_BYTES = 10_000_000
+
+# Folder in the output directory with the wheels mirrored from --wheel-dir
+WHEELS_DIR = "wheels"
+
+# Name of the service worker written into the output directory, and registered by the index
+SERVICE_WORKER_FILE = "sw.js"
+
+# Source of the service worker. __BUILD__ is replaced by the content hashes of this build: "runtime"
+# (precached on install, then served from the cache), "data" (public/ files, served from the cache
+# and revalidated in the background), "immutable" (URL prefixes with content-hashed or versioned
+# files, cached the first time they are loaded), "wheels" (file names of mirrored wheels, and
+# their path on this site, which is loaded instead when a page requests one from anywhere else) and
+# "locks" (the pyodide lock file precomputed for each page, loaded instead of the one the pyodide
+# worker of the page requests). The worker is matched to its page when the page starts it. On
+# activation, cached files that changed or are gone since the build that cached them are removed.
+SERVICE_WORKER_SCRIPT = """// Generated by build.py, do not edit
+const BUILD = __BUILD__;
+const CACHE = "marimo-site";
+const HASH_HEADER = "X-Build-Hash";
+
+const absolute = (table) => Object.fromEntries(
+  Object.entries(table).map(([url, hash]) => [new URL(url, self.location).href, hash]),
+);
+const RUNTIME = absolute(BUILD.runtime);
+const DATA = absolute(BUILD.data);
+const IMMUTABLE = BUILD.immutable.map((prefix) => new URL(prefix, self.location).href);
+const WHEELS = absolute(BUILD.wheels);
+const LOCKS = Object.fromEntries(
+  Object.entries(BUILD.locks).map(([page, lock]) => [new URL(page, self.location).href, new URL(lock, self.location).href]),
+);
+
+// Query parameter with the page that started a web worker, added to the URL of the worker script
+const PAGE_PARAM = "marimo-page";
+
+async function store(cache, url, response, hash) {
+  const headers = new Headers(response.headers);
+  headers.set(HASH_HEADER, hash);
+  const body = await response.blob();
+  await cache.put(url, new Response(body, { status: response.status, statusText: response.statusText, headers }));
+}
+
+async function fetchAndStore(cache, request, hash) {
+  const response = await fetch(request);
+  if (response.ok) {
+    await store(cache, request.url, response.clone(), hash);
+  }
+  return response;
+}
+
+async function cacheFirst(request, hash) {
+  const cache = await caches.open(CACHE);
+  const cached = await cache.match(request.url);
+  return cached ?? fetchAndStore(cache, request, hash);
+}
+
+// The pages start their web worker from the same script. A page with a precomputed lock file gets
+// it from a URL that names the page instead, so the worker's request for the lock file can be
+// answered with the lock file of that page, from the URL of the worker, however many pages are open.
+async function startWorker(event) {
+  const url = new URL(event.request.url);
+  if (!url.searchParams.has(PAGE_PARAM)) {
+    const client = await self.clients.get(event.clientId);
+    const page = client?.url.split(/[?#]/)[0];
+    if (page in LOCKS) {
+      url.searchParams.set(PAGE_PARAM, page);
+      return Response.redirect(url.href, 302);
+    }
+  }
+  url.searchParams.delete(PAGE_PARAM);
+  const script = url.href;
+  if (script in RUNTIME || IMMUTABLE.some((prefix) => script.startsWith(prefix))) {
+    return cacheFirst(new Request(script), RUNTIME[script] ?? "immutable");
+  }
+  return fetch(script);
+}
+
+// The lock file of the page that started the worker a request comes from, if it has one
+async function pageLock(clientId) {
+  const client = clientId ? await self.clients.get(clientId) : undefined;
+  const page = client ? new URL(client.url).searchParams.get(PAGE_PARAM) : null;
+  return page === null ? undefined : LOCKS[page];
+}
+
+// Refresh a cached file with a conditional request, which only downloads it again if it changed
+async function revalidate(cache, request, cached, hash) {
+  const etag = cached.headers.get("ETag");
+  const response = await fetch(request.url, etag ? { headers: { "If-None-Match": etag } } : {});
+  if (response.ok) {
+    await store(cache, request.url, response, hash);
+  }
+}
+
+self.addEventListener("install", (event) => {
+  event.waitUntil((async () => {
+    const cache = await caches.open(CACHE);
+    // Only download the runtime files that are not cached with the same hash already
+    await Promise.all(Object.entries(RUNTIME).map(async ([url, hash]) => {
+      const cached = await cache.match(url);
+      if (!cached || cached.headers.get(HASH_HEADER) !== hash) {
+        await fetchAndStore(cache, new Request(url, { mode: "cors", credentials: "omit" }), hash).catch(() => {});
+      }
+    }));
+    await self.skipWaiting();
+  })());
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil((async () => {
+    const cache = await caches.open(CACHE);
+    for (const request of await cache.keys()) {
+      const expected = RUNTIME[request.url] ?? DATA[request.url];
+      const immutable = IMMUTABLE.some((prefix) => request.url.startsWith(prefix));
+      if (expected === undefined && !immutable) {
+        await cache.delete(request);
+      } else if (expected !== undefined) {
+        const cached = await cache.match(request);
+        if (!cached || cached.headers.get(HASH_HEADER) !== expected) {
+          await cache.delete(request);
+        }
+      }
+    }
+    await self.clients.claim();
+  })());
+});
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET" || request.headers.has("range")) {
+    return;
+  }
+  const url = request.url;
+  const local = url.endsWith(".whl") ? WHEELS[decodeURIComponent(url.split("/").pop())] : undefined;
+  const hasLocks = Object.keys(LOCKS).length > 0;
+  if (request.destination === "worker" && hasLocks) {
+    event.respondWith(startWorker(event));
+  } else if (hasLocks && url.split("?")[0].endsWith("/pyodide-lock.json")) {
+    // The lock files precomputed by the build are loaded from this site instead of from marimo
+    event.respondWith((async () => {
+      const lock = await pageLock(event.clientId);
+      return lock === undefined ? fetch(request) : cacheFirst(new Request(lock), "immutable");
+    })());
+  } else if (local !== undefined && local !== url) {
+    // Wheels mirrored by the build are loaded from this site instead of from the CDN or PyPI
+    event.respondWith(cacheFirst(new Request(local), "immutable"));
+  } else if (url in RUNTIME || IMMUTABLE.some((prefix) => url.startsWith(prefix))) {
+    // Cache first: these files only change together with their URL or hash
+    event.respondWith(cacheFirst(request, RUNTIME[url] ?? "immutable"));
+  } else if (url in DATA) {
+    // Stale while revalidate: answer from the cache, and refresh the cached copy in the background
+    event.respondWith((async () => {
+      const cache = await caches.open(CACHE);
+      const cached = await cache.match(url);
+      if (cached && cached.headers.get(HASH_HEADER) === DATA[url]) {
+        event.waitUntil(revalidate(cache, request, cached, DATA[url]).catch(() => {}));
+        return cached;
+      }
+      return fetchAndStore(cache, request, DATA[url]);
+    })());
+  }
+});
+"""
+
+# Directory with the shared export environments, one per distinct set of PEP 723 dependencies
+ENV_DIR = Path(".marimo-envs")
+
+# How long a shared environment with unpinned requirements (e.g. "marimo" or "polars>=1.0") is
+# reused before they are upgraded to their latest matching releases. Fully pinned environments
+# are reused for good.
+ENV_MAX_AGE_S = 24 * 60 * 60
+
+# Export backends: a marimo subprocess per notebook, or long-lived workers with marimo imported
+BACKENDS = ("subprocess", "worker")
+
+# What to do with notebooks whose dataflow is broken: stop the build, log a warning, or not check at all
+VALIDATION_MODES = ("error", "warn", "off")
+
+# How often the peak RSS of an export subprocess and its descendants is read on Linux, see _run_measured()
+PEAK_RSS_POLL_S = 0.05
+
+# Names every cell can use without another cell defining them
+BUILTIN_NAMES = frozenset(dir(builtins)) | {"__file__"}
+
+# Source of an export worker. It imports the marimo CLI once, then runs one CLI command per line
+# of JSON on stdin, and answers each with a line of JSON on the original stdout. Anything the
+# command prints to stdout goes to stderr, and stdin is replaced so the command can't read requests.
+# The peak RSS of each command is measured by resetting the peak of the process before it (Linux
+# can, through /proc/self/clear_refs). Elsewhere the worker's lifetime peak can't be reset, and the
+# growth of that peak during the command is reported instead.
+WORKER_SCRIPT = """
+import json, os, sys, traceback
+requests = os.fdopen(os.dup(0), "r")
+responses = os.fdopen(os.dup(1), "w")
+os.dup2(2, 1)
+null = os.open(os.devnull, os.O_RDONLY)
+os.dup2(null, 0)
+sys.stdin = open(os.devnull)
+from marimo._cli.cli import main as cli
+try:
+    import resource
+except ImportError:
+    resource = None
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+def peak_rss(reset):
+    if reset:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:"))
+    if resource is None:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+responses.write(json.dumps({"ok": True}) + "\\n")
+responses.flush()
+for line in requests:
+    request = json.loads(line)
+    reset = reset_peak_rss()
+    before = 0 if reset else peak_rss(reset)
+    try:
+        cli.main(args=request["args"], standalone_mode=False)
+        response = {"ok": True}
+    except SystemExit as e:
+        response = {"ok": e.code in (0, None), "error": f"exit code {e.code}"}
+    except BaseException:
+        response = {"ok": False, "error": traceback.format_exc()}
+    response["peak_rss"] = peak_rss(reset) - before
+    responses.write(json.dumps(response) + "\\n")
+    responses.flush()
+"""
+
+# Paths into a public/ folder in string literals, e.g. "public/logo.png" or
+# "notebooks/public/enheter_alle.parquet": the folder prefix and the path inside public/
+PUBLIC_PATH_REGEX = re.compile(r"((?:[\w.-]+/)*)public/([\w.-]+(?:/[\w.-]+)*)")
+
+# Code put in front of the import of a module from the notebook's public/ folder in an exported
+# page (see _bootstrap_public_modules()). Locally the module is found through the pythonpath in
+# [tool.marimo.runtime] in pyproject.toml, but the browser has to download it into the file
+# system of pyodide first.
+PUBLIC_MODULE_BOOTSTRAP = """\
+if __import__("sys").platform == "emscripten":
+    # Added by the build: download public/{module}.py, so it can be imported in the browser
+    from pyodide.http import open_url as _open_url
+    _public = __import__("pathlib").Path("public").resolve()
+    _public.mkdir(exist_ok=True)
+    (_public / "{module}.py").write_text(
+        _open_url(str(__import__("marimo").notebook_location() / "public" / "{module}.py")).read(), encoding="utf-8"
+    )
+    if str(_public) not in __import__("sys").path:
+        __import__("sys").path.insert(0, str(_public))
+"""
+
+# Units accepted in size budgets, e.g. "50 MB"
+SIZE_UNITS = {"b": 1, "kb": 10**3, "mb": 10**6, "gb": 10**9, "kib": 2**10, "mib": 2**20, "gib": 2**30}
+
+# PyPI JSON API, used to look up the download size of pure Python packages
+PYPI_JSON_URL = "https://pypi.org/pypi/{name}/json"
+
+# How long the size of the latest release of an unpinned package is reused before it is looked up
+# again. The sizes of wheel files and pinned releases don't change, and are kept for good.
+PACKAGE_SIZE_MAX_AGE_S = 24 * 60 * 60
+
+# How long --watch waits for more changes before rebuilding, so a burst of saves gives one rebuild
+WATCH_DEBOUNCE_MS = 1000
+
+# Regex for inline script metadata blocks (PEP 723), e.g. "# /// script ... # ///"
+PEP723_REGEX = r"(?m)^# /// (?P<type>[a-zA-Z0-9-]+)$\s(?P<content>(^#(| .*)$\s)+)^# ///$"
+
+
+def _read_script_metadata(source: str) -> str:
+    """Extract the PEP 723 "script" block from the source of a notebook.
+
+    Args:
+        source (str): Source code of the notebook
+
+    Returns:
+        str: The content of the "# /// script" block, or an empty string if there is none
+    """
+    for match in re.finditer(PEP723_REGEX, source):
+        if match.group("type") == "script":
+            return match.group("content")
+    return ""
+
+
+def _script_metadata_toml(source: str) -> dict:
+    """Parse the PEP 723 "script" block of a notebook as TOML.
+
+    Args:
+        source (str): Source code of the notebook
+
+    Returns:
+        dict: The parsed metadata, or an empty dict if there is none or it is invalid
+    """
+    content = _read_script_metadata(source)
+    toml_text = "".join(line[2:] if line.startswith("# ") else line[1:] for line in content.splitlines(keepends=True))
+    try:
+        return tomllib.loads(toml_text)
+    except tomllib.TOMLDecodeError as e:
+        logger.warning(f"Invalid script metadata: {e}")
+        return {}
+
+
+def _load_build_config(pyproject: Path = Path("pyproject.toml")) -> dict:
+    """Load the [tool.marimo-build] table from pyproject.toml.
+
+    Args:
+        pyproject (Path, optional): Path to pyproject.toml. Defaults to the one in the current directory.
+
+    Returns:
+        dict: The build configuration, or an empty dict if there is none
+    """
+    try:
+        with open(pyproject, "rb") as f:
+            return tomllib.load(f).get("tool", {}).get("marimo-build", {})
+    except FileNotFoundError:
+        return {}
+    except tomllib.TOMLDecodeError as e:
+        logger.warning(f"Invalid {pyproject}: {e}")
+        return {}
+
+
+def _parse_size(size: Union[int, str]) -> int:
+    """Parse a size like 1024, "500 kB" or "1.5MiB" into a number of bytes.
+
+    Args:
+        size (Union[int, str]): The size, as a number of bytes or a string with a unit
+
+    Returns:
+        int: The size in bytes
+
+    Raises:
+        ValueError: If the size can't be parsed
+    """
+    if isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([a-zA-Z]*)\s*", size)
+    if not match or match.group(2).lower() not in SIZE_UNITS | {"": 1}:
+        raise ValueError(f"Invalid size: {size!r}")
+    return int(float(match.group(1)) * SIZE_UNITS.get(match.group(2).lower(), 1))
+
+
+def _parse_requirement(requirement: str) -> Tuple[str, str | None]:
+    """Split a requirement like "polars==1.30.0" into a normalized name and pinned version.
+
+    Args:
+        requirement (str): The requirement, as written in the PEP 723 header
+
+    Returns:
+        Tuple[str, str | None]: The normalized package name, and the pinned version if any
+    """
+    match = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[[^\]]*\])?\s*(?:==\s*([^\s;,]+))?", requirement)
+    if not match:
+        return requirement.strip().lower(), None
+    return re.sub(r"[-_.]+", "-", match.group(1)).lower(), match.group(3)
+
+
+def _dependency_set(notebook_path: Path) -> Tuple[str, ...]:
+    """Get the normalized set of dependencies of a notebook from its PEP 723 header.
+
+    Notebooks with the same dependency set can be exported in the same environment. The set
+    includes the Python version requirement, and always includes marimo, which runs the export.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        Tuple[str, ...]: Sorted requirements without whitespace, with lowercase package names
+    """
+    metadata = _script_metadata_toml(notebook_path.read_text(encoding="utf-8"))
+    requirements = set()
+    for requirement in metadata.get("dependencies", []):
+        name, _ = _parse_requirement(requirement)
+        requirements.add(name + re.sub(r"\s+", "", requirement)[len(name):].lower())
+    if not any(_parse_requirement(requirement)[0] == "marimo" for requirement in requirements):
+        requirements.add("marimo")
+    python = metadata.get("requires-python")
+    return tuple(sorted(requirements)) + ((f"python{python.replace(' ', '')}",) if python else ())
+
+
+def _create_environment(dependencies: Tuple[str, ...], env_dir: Path) -> Path | None:
+    """Create a virtual environment with the given dependencies, or reuse it from a previous build.
+
+    An environment whose requirements are not all pinned with "==" is reused for ENV_MAX_AGE_S
+    after it was created or last refreshed. After that its requirements are upgraded, so new
+    releases are picked up. If the upgrade fails, the environment is reused as it is.
+
+    Args:
+        dependencies (Tuple[str, ...]): Dependency set, as returned by _dependency_set()
+        env_dir (Path): Directory of the environment
+
+    Returns:
+        Path | None: Path to the marimo executable in the environment, or None if it could not be created
+    """
+    marimo_bin = env_dir / ("Scripts" if os.name == "nt" else "bin") / "marimo"
+    done_marker = env_dir / ".complete"
+    python = [dep[len("python"):] for dep in dependencies if dep.startswith("python")]
+    requirements = [dep for dep in dependencies if not dep.startswith("python")]
+    refresh = done_marker.exists()
+    if refresh:
+        pinned = all("==" in requirement for requirement in requirements)
+        if pinned or time.time() - done_marker.stat().st_mtime < ENV_MAX_AGE_S:
+            logger.debug(f"Reusing environment {env_dir}")
+            return marimo_bin
+        logger.info(f"Upgrading the unpinned requirements of environment {env_dir}")
+    else:
+        logger.info(f"Creating environment {env_dir} with {', '.join(requirements)}")
+    try:
+        if not refresh:
+            shutil.rmtree(env_dir, ignore_errors=True)
+            subprocess.run(
+                ["uv", "venv", "--quiet", str(env_dir)] + (["--python", python[0]] if python else []),
+                capture_output=True, text=True, check=True,
+            )
+        subprocess.run(
+            ["uv", "pip", "install", "--quiet"] + (["--upgrade"] if refresh else []) + ["--python", str(env_dir)]
+            + requirements,
+            capture_output=True, text=True, check=True,
+        )
+        done_marker.touch()
+        return marimo_bin
+    except (subprocess.CalledProcessError, OSError) as e:
+        error = e.stderr if isinstance(e, subprocess.CalledProcessError) else e
+        if refresh:
+            logger.warning(f"Could not upgrade environment {env_dir}, reusing it as it is: {error}")
+            return marimo_bin
+        logger.warning(f"Could not create environment {env_dir}, falling back to --sandbox: {error}")
+    return None
+
+
+def _environment_python(marimo_bin: Path) -> Path:
+    """Find the Python executable of the environment a marimo executable was installed in.
+
+    The export workers have to run in the notebook's environment, not in the one running the
+    build, so they can't use sys.executable itself. The environment's interpreter is named like
+    it, though: python, or python.exe on Windows.
+
+    Args:
+        marimo_bin (Path): Path to the marimo executable, as returned by _create_environment()
+
+    Returns:
+        Path: Path to the Python executable next to it
+    """
+    return marimo_bin.with_name("python" + Path(sys.executable).suffix)
+
+
+# Shared environments created during this build, and a lock per dependency set while creating them
+_environments: dict = {}
+_environment_locks: dict = {}
+_environment_locks_lock = threading.Lock()
+
+
+def _shared_environment(notebook_path: Path, env_root: Path) -> Path | None:
+    """Get the shared export environment for a notebook, creating it on first use.
+
+    Notebooks with the same dependency set share one environment, so each distinct set is
+    resolved and installed only once, even when several notebooks are exported in parallel.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+        env_root (Path): Directory with the shared environments
+
+    Returns:
+        Path | None: Path to the marimo executable in the environment, or None if it could not be created
+    """
+    dependencies = _dependency_set(notebook_path)
+    key = hashlib.sha256("\n".join(dependencies).encode("utf-8")).hexdigest()[:16]
+    with _environment_locks_lock:
+        lock = _environment_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _environments:
+            _environments[key] = _create_environment(dependencies, env_root / key)
+    return _environments[key]
+
+
+class _ExportWorker:
+    """A long-lived Python process with marimo imported, which runs marimo CLI commands.
+
+    Starting `marimo export` for every notebook pays for interpreter startup and the marimo
+    import each time. A worker pays that once, and then runs the export commands in-process.
+    """
+
+    def __init__(self, python: Path) -> None:
+        """Start a worker and wait until marimo is imported.
+
+        Args:
+            python (Path): Python executable of the environment with marimo installed
+
+        Raises:
+            RuntimeError: If the worker could not be started
+        """
+        self.python = python
+        self.process = subprocess.Popen(
+            [str(python), "-c", WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        if not self._read_response().get("ok"):
+            raise RuntimeError(f"Could not start export worker for {python}")
+
+    def _read_response(self) -> dict:
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Export worker for {self.python} exited with status {self.process.poll()}")
+        return json.loads(line)
+
+    def run(self, args: List[str]) -> dict:
+        """Run a marimo CLI command in the worker.
+
+        Args:
+            args (List[str]): Arguments of the marimo command, e.g. ["export", "html-wasm", ...]
+
+        Returns:
+            dict: "ok" (bool), "error" (str) if it failed, and "peak_rss" (int, bytes) of the
+                  command, see WORKER_SCRIPT
+
+        Raises:
+            RuntimeError: If the worker died
+        """
+        self.process.stdin.write(json.dumps({"args": args}) + "\n")
+        self.process.stdin.flush()
+        return self._read_response()
+
+    def close(self) -> None:
+        """Stop the worker."""
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+# Idle export workers per environment, and the number of workers started per environment
+_idle_workers: dict = {}
+_started_workers: dict = {}
+_workers_lock = threading.Lock()
+
+
+def _run_in_worker(python: Path, args: List[str], max_workers: int) -> dict:
+    """Run a marimo CLI command in an export worker for an environment.
+
+    An idle worker for the environment is reused if there is one. Otherwise a new worker is
+    started, up to max_workers per environment, after which the command waits for a worker
+    to become idle. A worker that fails or dies is stopped rather than reused.
+
+    Args:
+        python (Path): Python executable of the environment with marimo installed
+        args (List[str]): Arguments of the marimo command
+        max_workers (int): Maximum number of workers for the environment
+
+    Returns:
+        dict: The response of the worker, see _ExportWorker.run()
+
+    Raises:
+        RuntimeError: If no worker could be started, or the worker died
+    """
+    with _workers_lock:
+        idle = _idle_workers.setdefault(python, queue.Queue())
+        start_new = idle.empty() and _started_workers.get(python, 0) < max_workers
+        if start_new:
+            _started_workers[python] = _started_workers.get(python, 0) + 1
+    try:
+        worker = _ExportWorker(python) if start_new else idle.get()
+    except Exception:
+        with _workers_lock:
+            _started_workers[python] -= 1
+        raise
+
+    try:
+        response = worker.run(args)
+    except Exception:
+        worker.close()
+        with _workers_lock:
+            _started_workers[python] -= 1
+        raise
+    if response["ok"]:
+        idle.put(worker)
+    else:
+        # The failed command may have left marimo in a bad state, so don't reuse the worker
+        worker.close()
+        with _workers_lock:
+            _started_workers[python] -= 1
+    return response
+
+
+def _close_workers() -> None:
+    """Stop all idle export workers."""
+    with _workers_lock:
+        for python, idle in _idle_workers.items():
+            while not idle.empty():
+                idle.get().close()
+                _started_workers[python] -= 1
+
+
+def _marimo_version() -> str:
+    """Get the version of marimo used by `uvx marimo` for the exports.
+
+    Returns:
+        str: The marimo version, or "unknown" if it could not be determined
+    """
+    try:
+        result = subprocess.run(["uvx", "marimo", "--version"], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning(f"Could not determine marimo version: {e}")
+        return "unknown"
+
+
+def _cache_key(
+    notebook_path: Path, as_app: bool, marimo_version: str, asset_digests: dict | None = None, snapshot: bool = False
+) -> str:
+    """Compute the cache key for exporting a notebook.
+
+    The key changes whenever the notebook source, its PEP 723 header, the export mode, the
+    marimo version used for the export, the content of a public/ asset it uses, or whether an
+    output snapshot is embedded changes.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+        as_app (bool): Whether the notebook is exported as an app (run mode)
+        marimo_version (str): Version of marimo used for the export
+        asset_digests (dict, optional): Digests of assets from previous builds, see _asset_digest()
+        snapshot (bool, optional): Whether an output snapshot is embedded in the page. Defaults to False.
+
+    Returns:
+        str: Hex digest identifying the export
+    """
+    source = notebook_path.read_text(encoding="utf-8")
+    digest = hashlib.sha256()
+    assets = [
+        f"{path}={_asset_digest(path, asset_digests if asset_digests is not None else {})}"
+        for path in _referenced_assets(notebook_path)
+    ]
+    # Only part of the key with a snapshot, so the keys of earlier builds stay valid without one
+    options = ["snapshot"] if snapshot else []
+    for part in (source, _read_script_metadata(source), f"as_app={as_app}", f"marimo={marimo_version}", *assets, *options):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _load_manifest(output_dir: Path) -> dict:
+    """Load the build manifest from the output directory.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+
+    Returns:
+        dict: The manifest, or an empty manifest if none exists or it can't be read
+    """
+    manifest_path = output_dir / MANIFEST_FILE
+    try:
+        manifest = json.loads(manifest_path.read_text())
+        if isinstance(manifest.get("notebooks"), dict):
+            return manifest
+        logger.warning(f"Ignoring malformed build manifest {manifest_path}")
+    except FileNotFoundError:
+        logger.debug(f"No build manifest found at {manifest_path}")
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read build manifest {manifest_path}: {e}")
+    return {"notebooks": {}}
+
+
+def _save_manifest(output_dir: Path, manifest: dict) -> None:
+    """Write the build manifest to the output directory.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): The manifest to save
+    """
+    manifest_path = output_dir / MANIFEST_FILE
+    manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    logger.debug(f"Saved build manifest to {manifest_path}")
+
+
+def _process_tree_peaks(pid: int, peaks: dict) -> None:
+    """Record the peak RSS of a process and its descendants so far, from /proc (Linux only).
+
+    Args:
+        pid (int): ID of the process
+        peaks (dict): Peak RSS in bytes by process ID, updated with the current values
+    """
+    pending = [pid]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                # VmHWM is the peak of the process itself, and is missing once it has exited
+                hwm = next((int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:")), 0)
+            peaks[pid] = max(peaks.get(pid, 0), hwm)
+            for task in Path(f"/proc/{pid}/task").iterdir():
+                pending += [int(child) for child in (task / "children").read_text().split()]
+        except (OSError, ValueError):
+            continue
+
+
+def _run_measured(cmd: List[str]) -> Tuple[subprocess.CompletedProcess, float, int]:
+    """Run a command, measuring its wall time and peak memory.
+
+    The peak resident set size (RSS) is the largest peak of the child process and its descendants
+    (e.g. the python process started by uvx). On Linux it is read from the VmHWM of each process in
+    /proc every PEAK_RSS_POLL_S while the command runs, which only misses growth in the last poll
+    interval. Elsewhere it is taken from the resource usage reported when the child is reaped,
+    which can include the RSS of the build process when it forked the child. On platforms
+    without os.wait4 the peak RSS is reported as 0.
+
+    Args:
+        cmd (List[str]): The command to run
+
+    Returns:
+        Tuple[subprocess.CompletedProcess, float, int]: The completed process, the wall time in
+        seconds and the peak RSS in bytes
+
+    Raises:
+        subprocess.CalledProcessError: If the command exits with a non-zero status
+    """
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(cmd, stdout=stdout, stderr=stderr)
+        if Path("/proc/self/status").exists():
+            # ru_maxrss starts at the RSS the child inherited with fork(), so the children are measured directly
+            peaks: dict = {}
+            while True:
+                _process_tree_peaks(process.pid, peaks)
+                try:
+                    process.wait(timeout=PEAK_RSS_POLL_S)
+                    break
+                except subprocess.TimeoutExpired:
+                    continue
+            peak_rss = max(peaks.values(), default=0)
+        elif hasattr(os, "wait4"):
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+            peak_rss = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+        else:
+            process.wait()
+            peak_rss = 0
+        wall_time = time.perf_counter() - start
+
+        stdout.seek(0)
+        stderr.seek(0)
+        result = subprocess.CompletedProcess(
+            cmd,
+            process.returncode,
+            stdout.read().decode(errors="replace"),
+            stderr.read().decode(errors="replace"),
+        )
+    result.check_returncode()
+    return result, wall_time, peak_rss
+
+
+def _asset_references(notebook_path: Path) -> List[Path]:
+    """Find the public/ assets a notebook refers to, by statically analysing its code.
+
+    Three kinds of references are found: path expressions joined with "/" that go through "public",
+    like `mo.notebook_location() / "public" / "penguins.csv"`, string literals containing a
+    path into a public/ folder, like 'notebooks/public/enheter_alle.parquet' or
+    '<img src="public/logo.png">', and imports of a module in the notebook's public/ folder, like
+    `import dataloader`. A path with a folder prefix that exists (relative to the
+    current directory) resolves into that folder, any other path into the notebook's own public/ folder.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        List[Path]: The referenced assets, sorted by path. They don't necessarily exist.
+    """
+    try:
+        tree = ast.parse(notebook_path.read_text(encoding="utf-8"), filename=str(notebook_path))
+    except SyntaxError as e:
+        logger.warning(f"Could not parse {notebook_path} to find the assets it uses: {e}")
+        return []
+
+    references = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+            # Flatten a / "public" / "file" chain into its operands
+            operands = []
+            while isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+                operands.insert(0, node.right)
+                node = node.left
+            operands.insert(0, node)
+            names = [op.value if isinstance(op, ast.Constant) and isinstance(op.value, str) else None for op in operands]
+            if "public" in names:
+                rest = names[names.index("public") + 1:]
+                if rest and None not in rest:
+                    references.add(("", "/".join(rest)))
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            for match in PUBLIC_PATH_REGEX.finditer(node.value):
+                references.add((match.group(1), match.group(2).rstrip(".")))
+        elif module := _public_module(node, notebook_path):
+            references.add(("", f"{module}.py"))
+
+    assets = set()
+    for prefix, rest in references:
+        folder = Path(prefix) if prefix and Path(prefix).is_dir() else notebook_path.parent
+        assets.add(folder / "public" / rest)
+    return sorted(assets)
+
+
+def _public_module(node: ast.AST, notebook_path: Path) -> str | None:
+    """Get the module a statement imports from the notebook's public/ folder.
+
+    Args:
+        node (ast.AST): A statement of the notebook
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        str | None: The name of the module, if the statement is an import of a module that
+        exists in the public/ folder next to the notebook
+    """
+    if isinstance(node, ast.Import):
+        names = [alias.name for alias in node.names]
+    elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+        names = [node.module]
+    else:
+        return None
+    for name in names:
+        module = name.split(".")[0]
+        if (notebook_path.parent / "public" / f"{module}.py").is_file():
+            return module
+    return None
+
+
+def _referenced_assets(notebook_path: Path) -> List[Path]:
+    """Find the existing public/ assets a notebook refers to, see _asset_references().
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        List[Path]: The referenced files, sorted by path
+    """
+    return [path for path in _asset_references(notebook_path) if path.is_file()]
+
+
+def _asset_digest(path: Path, asset_digests: dict) -> str:
+    """Get the SHA-256 digest of an asset, reusing the digest from a previous build if the file is unchanged.
+
+    Args:
+        path (Path): Path to the asset
+        asset_digests (dict): Digests by path, with the size and modification time they were computed for
+
+    Returns:
+        str: Hex digest of the asset content
+    """
+    stat = path.stat()
+    entry = asset_digests.get(str(path))
+    if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": _file_digest(path)}
+        asset_digests[str(path)] = entry
+    return entry["sha256"]
+
+
+def _is_app_decorator(decorator: ast.expr, names: Tuple[str, ...]) -> bool:
+    """Check if a decorator is app.<name> or app.<name>(...), e.g. @app.cell(hide_code=True).
+
+    Args:
+        decorator (ast.expr): The decorator
+        names (Tuple[str, ...]): The accepted names
+
+    Returns:
+        bool: True if the decorator is one of the names on app
+    """
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    return (
+        isinstance(decorator, ast.Attribute) and decorator.attr in names
+        and isinstance(decorator.value, ast.Name) and decorator.value.id == "app"
+    )
+
+
+def _bound_names(statements: List[ast.stmt], nested: bool) -> set:
+    """Get the names that statements bind: assignments, imports, definitions, loop targets and so on.
+
+    Args:
+        statements (List[ast.stmt]): The statements
+        nested (bool): Whether to include the names bound in nested scopes (functions, classes,
+                       lambdas and comprehensions), e.g. their arguments and local variables
+
+    Returns:
+        set: The bound names
+    """
+    names = set()
+    nodes: list = list(statements)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names if alias.name != "*")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            names.add(node.rest)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        scope = (
+            ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda,
+            ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp,
+        )
+        if nested or not isinstance(node, scope):
+            nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def _notebook_problems(notebook_path: Path) -> List[str]:
+    """Check the dataflow between the cells of a notebook, without running it.
+
+    Every cell, the setup block (`with app.setup:`) and every @app.function and
+    @app.class_definition is parsed with ast. What each defines and uses is compared across
+    the notebook, the way marimo does when it runs it. A name that no cell defines, a name
+    defined by more than one cell, and cells that depend on each other in a cycle are reported.
+    Names bound anywhere in a cell, also in a nested function, count as defined by the cell, so
+    unusual scoping is not reported rather than reported wrongly.
+
+    Args:
+        notebook_path (Path): Path to the notebook
+
+    Returns:
+        List[str]: The problems, as "path:line: message", or an empty list if there are none
+    """
+    try:
+        module = ast.parse(notebook_path.read_text(encoding="utf-8"), filename=str(notebook_path))
+    except SyntaxError as e:
+        return [f"{notebook_path}:{e.lineno}: syntax error: {e.msg}"]
+
+    # What each cell (by line) defines for other cells, and the names it uses that it doesn't define itself
+    defines: dict = {}
+    uses: dict = {}
+    for node in module.body:
+        if isinstance(node, ast.With) and any(
+            _is_app_decorator(item.context_expr, ("setup",)) for item in node.items
+        ):
+            body, scanned, exported = node.body, node.body, _bound_names(node.body, nested=False)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and any(
+            _is_app_decorator(decorator, ("cell",)) for decorator in node.decorator_list
+        ):
+            body, scanned = node.body, node.body
+            exported = {name for name in _bound_names(node.body, nested=False) if not name.startswith("_")}
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and any(
+            _is_app_decorator(decorator, ("function", "class_definition")) for decorator in node.decorator_list
+        ):
+            # The decorator refers to the app, which is not something a cell defines
+            body, exported = [node], {node.name}
+            scanned = [*node.body, *(node.bases if isinstance(node, ast.ClassDef) else [node.args])]
+        else:
+            continue
+        loaded = {
+            child.id for statement in scanned for child in ast.walk(statement)
+            if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load)
+        }
+        defines[node.lineno] = exported
+        uses[node.lineno] = loaded - _bound_names(body, nested=True) - BUILTIN_NAMES
+
+    problems = []
+    definer: dict = {}
+    for line, names in defines.items():
+        for name in sorted(names):
+            if name in definer:
+                problems.append(f"{notebook_path}:{line}: {name!r} is also defined by the cell at line {definer[name]}")
+            else:
+                definer[name] = line
+    for line, names in uses.items():
+        for name in sorted(names - definer.keys()):
+            problems.append(f"{notebook_path}:{line}: {name!r} is used, but no cell defines it")
+
+    graph = {line: {definer[name] for name in names if name in definer and definer[name] != line} for line, names in uses.items()}
+    try:
+        graphlib.TopologicalSorter(graph).prepare()
+    except graphlib.CycleError as e:
+        cycle = " -> ".join(str(line) for line in e.args[1])
+        problems.append(f"{notebook_path}:{e.args[1][0]}: the cells at lines {cycle} depend on each other in a cycle")
+    return problems
+
+
+def _validate_notebooks(notebooks: List[Path], mode: str, report: dict | None = None) -> set:
+    """Check the dataflow of notebooks with _notebook_problems(), and log what is wrong.
+
+    Args:
+        notebooks (List[Path]): The notebooks to check
+        mode (str): "error" to log the problems as errors, or "warn" to log them as warnings
+        report (dict, optional): Build report. If given, the problems are added to it under "validation".
+
+    Returns:
+        set: The notebooks with problems
+    """
+    start = time.perf_counter()
+    problems = {nb: _notebook_problems(nb) for nb in notebooks}
+    invalid = {nb for nb, found in problems.items() if found}
+    for nb in sorted(invalid):
+        logger.log("ERROR" if mode == "error" else "WARNING", f"Broken dataflow in {nb}:\n" + "\n".join(problems[nb]))
+    if report is not None:
+        report["validation"] = {str(nb): problems[nb] for nb in sorted(invalid)}
+    logger.info(
+        f"Validated {len(notebooks)} notebooks in {(time.perf_counter() - start) * 1000:.0f} ms, "
+        f"{len(invalid)} with problems"
+    )
+    return invalid
+
+
+def _snapshot_outputs(static_page: str) -> List[Tuple[str, str]]:
+    """Get the cell outputs from a page exported with `marimo export html`, as HTML.
+
+    Such a page has the state of the notebook after running it in `window.__MARIMO_STATIC__`,
+    with the output of every cell as base64 of the URL-encoded JSON message. The state is
+    assigned to `window.__MARIMO_STATIC__.notebookState` by marimo 0.13, and is a "notebookState"
+    property of the object passed to `Object.defineProperty()` by newer versions, so it is found
+    by its key. HTML outputs (markdown, tables and other UI elements, charts made with
+    mo.ui.altair_chart) are used as they are, Vega-Lite specs are shown with the <marimo-vega>
+    element, and text and images are wrapped in HTML. Errors, console output and empty outputs
+    are left out.
+
+    Args:
+        static_page (str): The page exported with `marimo export html`
+
+    Returns:
+        List[Tuple[str, str]]: The cell ID and HTML of each output, in the order of the cells
+
+    Raises:
+        ValueError: If the page has no notebook state that can be read
+    """
+    version = re.search(r"<marimo-version data-version=['\"]([\w.+-]+)['\"]", static_page)
+    version = version.group(1) if version else "unknown"
+    match = re.search(r"""(?:\.notebookState\s*=|["']?notebookState["']?\s*:)\s*(?=\{)""", static_page)
+    if match is None:
+        raise ValueError(f"no notebook state found in the page exported by marimo {version}")
+    try:
+        state, _ = json.JSONDecoder().raw_decode(static_page, match.end())
+    except ValueError as e:
+        raise ValueError(f"can't read the notebook state in the page exported by marimo {version}: {e}") from e
+    outputs = []
+    for cell_id in state["cellIds"]:
+        encoded = state["cellOutputs"].get(cell_id)
+        if not encoded:
+            continue
+        output = encoded if isinstance(encoded, dict) else json.loads(
+            urllib.parse.unquote(base64.b64decode(encoded).decode("utf-8"))
+        )
+        data, mimetype = output.get("data"), output.get("mimetype", "")
+        if output.get("channel") != "output" or not data:
+            continue
+        if mimetype == "text/html":
+            markup = data
+        elif mimetype == "text/plain":
+            markup = f"<pre>{html.escape(data)}</pre>"
+        elif mimetype.startswith("image/"):
+            markup = f'<img src="{html.escape(data)}" alt="">'
+        elif mimetype.startswith("application/vnd.vegalite"):
+            spec = html.escape(data if isinstance(data, str) else json.dumps(data))
+            markup = f"<marimo-vega data-spec='{spec}' data-chart-selection='false' data-field-selection='false'></marimo-vega>"
+        else:
+            continue
+        outputs.append((cell_id, markup))
+    return outputs
+
+
+def _embed_snapshot(page: str, outputs: List[Tuple[str, str]]) -> str:
+    """Embed an output snapshot in an exported page, with SNAPSHOT_SCRIPT to show it.
+
+    The outputs are put in a <template>, so they are not part of the page until the script adds
+    them, and the minifier leaves them alone.
+
+    Args:
+        page (str): The exported page
+        outputs (List[Tuple[str, str]]): The cell ID and HTML of each output, see _snapshot_outputs()
+
+    Returns:
+        str: The page with the snapshot, or the page as it was if there are no outputs
+    """
+    end = page.rfind("</body>")
+    if not outputs or end == -1:
+        return page
+    template = '<template id="marimo-snapshot">' + "".join(
+        f'<div data-cell-id="{html.escape(cell_id)}">{markup}</div>' for cell_id, markup in outputs
+    ) + "</template>"
+    return page[:end] + template + f"<style>{SNAPSHOT_STYLE}</style><script>{SNAPSHOT_SCRIPT}</script>" + page[end:]
+
+
+def _add_snapshot(notebook_path: Path, output_file: Path, marimo_bin: Path | None) -> float:
+    """Run a notebook with `marimo export html`, and embed its outputs in its exported page.
+
+    The page then shows the outputs right away, while the kernel in the browser starts and runs
+    the notebook again. A notebook that fails to run keeps the outputs of the cells that worked,
+    and if nothing can be shown, the page is left as it was.
+
+    Args:
+        notebook_path (Path): Path to the notebook
+        output_file (Path): The page exported with `marimo export html-wasm`
+        marimo_bin (Path | None): marimo in the shared environment of the notebook, or None to run it in a sandbox
+
+    Returns:
+        float: Time it took in seconds
+    """
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        static_file = Path(tmp) / "snapshot.html"
+        args = ["export", "html", str(notebook_path), "-o", str(static_file)]
+        cmd = [str(marimo_bin)] + args if marimo_bin is not None else ["uvx", "marimo"] + args[:2] + ["--sandbox"] + args[2:]
+        try:
+            # marimo exits with an error when a cell fails, but still writes the outputs of the others
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=SNAPSHOT_TIMEOUT_S)
+            if not static_file.exists():
+                raise RuntimeError(result.stderr.strip() or f"exited with {result.returncode}")
+            outputs = _snapshot_outputs(static_file.read_text(encoding="utf-8"))
+        except (subprocess.TimeoutExpired, RuntimeError, OSError, ValueError) as e:
+            logger.warning(f"Could not render an output snapshot of {notebook_path}: {e}")
+            return time.perf_counter() - start
+    output_file.write_text(_embed_snapshot(output_file.read_text(encoding="utf-8"), outputs), encoding="utf-8")
+    elapsed = time.perf_counter() - start
+    logger.info(f"Embedded a snapshot of {len(outputs)} outputs in {output_file} in {elapsed:.1f}s")
+    return elapsed
+
+
+def _export_html_wasm(
+    notebook_path: Path,
+    output_dir: Path,
+    as_app: bool = False,
+    manifest: dict | None = None,
+    marimo_version: str = "unknown",
+    report: dict | None = None,
+    env_root: Path | None = None,
+    backend: str = "subprocess",
+    max_workers: int = 1,
+    snapshot: bool = False,
+) -> bool:
     """Export a single marimo notebook to HTML/WebAssembly format.
 
-    This function takes a marimo notebook (.py file) and exports it to HTML/WebAssembly format.
-    If as_app is True, the notebook is exported in "run" mode with code hidden, suitable for
-    applications. Otherwise, it's exported in "edit" mode, suitable for interactive notebooks.
+    This function takes a marimo notebook (.py file) and exports it to HTML/WebAssembly format.
+    If as_app is True, the notebook is exported in "run" mode with code hidden, suitable for
+    applications. Otherwise, it's exported in "edit" mode, suitable for interactive notebooks.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file) to export
+        output_dir (Path): Directory where the exported HTML file will be saved
+        as_app (bool, optional): Whether to export as an app (run mode) or notebook (edit mode).
+                                Defaults to False.
+        manifest (dict, optional): Build manifest. If given, the export is skipped when the
+                                   notebook's cache key matches the previous build and its HTML
+                                   file still exists, and the manifest is updated after the export.
+        marimo_version (str, optional): Version of marimo, used as part of the cache key.
+        report (dict, optional): Build report. If given, the wall time, peak RSS, HTML size and
+                                 referenced asset size of the export is added to it.
+        env_root (Path, optional): Directory with shared environments. If given, the notebook is
+                                   exported in the environment shared by all notebooks with the same
+                                   dependencies, instead of in its own sandbox.
+        backend (str, optional): "subprocess" to run marimo for the export, or "worker" to send the
+                                 export to a long-lived worker in the shared environment. The worker
+                                 backend falls back to a subprocess if the worker fails, or if there
+                                 is no shared environment. Defaults to "subprocess".
+        max_workers (int, optional): Maximum number of workers per environment. Defaults to 1.
+        snapshot (bool, optional): Whether to run the notebook once and embed its outputs in the
+                                   page, see _add_snapshot(). Defaults to False.
+
+    Returns:
+        bool: True if export succeeded (or was reused from the previous build), False otherwise
+    """
+    # Convert .py extension to .html for the output file
+    output_path: Path = notebook_path.with_suffix(".html")
+    output_file: Path = output_dir / output_path
+
+    def _record(cached: bool, wall_time: float = 0.0, peak_rss: int = 0) -> None:
+        # Add the measurements of this export to the report (keyed per notebook, so thread safe)
+        if report is not None:
+            report["notebooks"][str(notebook_path)] = {
+                "as_app": as_app,
+                "cached": cached,
+                "wall_time_s": round(wall_time, 3),
+                "peak_rss_bytes": peak_rss,
+                "html_bytes": output_file.stat().st_size,
+                "asset_bytes": sum(path.stat().st_size for path in _referenced_assets(notebook_path)),
+            }
+
+    # Reuse the previous export if nothing that affects it has changed
+    key: str | None = None
+    if manifest is not None:
+        key = _cache_key(notebook_path, as_app, marimo_version, manifest.setdefault("asset_digests", {}), snapshot)
+        entry = manifest["notebooks"].get(str(notebook_path), {})
+        if entry.get("key") == key and output_file.exists():
+            logger.info(f"Skipping {notebook_path}, unchanged since the previous build")
+            _record(cached=True)
+            return True
+
+    # Arguments for marimo export
+    args: List[str] = ["export", "html-wasm"]
+
+    # Configure export mode based on whether it's an app or a notebook
+    if as_app:
+        logger.info(f"Exporting {notebook_path} to {output_path} as app")
+        args.extend(["--mode", "run", "--no-show-code"])  # Apps run in "run" mode with hidden code
+    else:
+        logger.info(f"Exporting {notebook_path} to {output_path} as notebook")
+        args.extend(["--mode", "edit"])  # Notebooks run in "edit" mode
+
+    # Add notebook path and output file to the arguments
+    args.extend([str(notebook_path), "-o", str(output_file)])
+
+    # Run marimo in the shared environment for the notebook's dependencies if there is one,
+    # or in a sandbox created just for this notebook otherwise
+    marimo_bin = _shared_environment(notebook_path, env_root) if env_root is not None else None
+    if marimo_bin is not None:
+        cmd: List[str] = [str(marimo_bin)] + args
+    else:
+        cmd = ["uvx", "marimo"] + args[:2] + ["--sandbox"] + args[2:]
+
+    try:
+        # Ensure the output directory exists
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+
+        response: dict | None = None
+        if backend == "worker" and marimo_bin is not None:
+            # Send the export to a warm worker, falling back to a subprocess if that fails
+            start = time.perf_counter()
+            try:
+                response = _run_in_worker(_environment_python(marimo_bin), args, max_workers)
+                if not response["ok"]:
+                    logger.warning(f"Export worker failed for {notebook_path}, retrying in a subprocess: {response['error']}")
+                    response = None
+            except (RuntimeError, OSError, ValueError) as e:
+                logger.warning(f"Export worker failed for {notebook_path}, retrying in a subprocess: {e}")
+            wall_time = time.perf_counter() - start
+            peak_rss = response.get("peak_rss", 0) if response else 0
+
+        if response is None:
+            # Run marimo export command
+            logger.debug(f"Running command: {cmd}")
+            _, wall_time, peak_rss = _run_measured(cmd)
+
+        logger.info(
+            f"Successfully exported {notebook_path} in {wall_time:.1f}s (peak RSS {peak_rss / 1e6:.0f} MB)"
+        )
+        page = output_file.read_text(encoding="utf-8")
+        bootstrapped = _bootstrap_public_modules(page, notebook_path)
+        if bootstrapped != page:
+            output_file.write_text(bootstrapped, encoding="utf-8")
+
+        # Show the outputs of a run at build time until the kernel in the browser has its own
+        if snapshot:
+            wall_time += _add_snapshot(notebook_path, output_file, marimo_bin)
+        _record(cached=False, wall_time=wall_time, peak_rss=peak_rss)
+
+        # Record the export in the manifest (each notebook has its own key, so this is thread safe)
+        if manifest is not None:
+            manifest["notebooks"][str(notebook_path)] = {
+                "key": key,
+                "as_app": as_app,
+                "html_path": str(output_path),
+                "assets": [str(path) for path in _asset_references(notebook_path)],
+                "wall_time_s": round(wall_time, 3),
+            }
+        return True
+    except subprocess.CalledProcessError as e:
+        # Handle marimo export errors
+        logger.error(f"Error exporting {notebook_path}:")
+        logger.error(f"Command output: {e.stderr}")
+    except Exception as e:
+        # Handle unexpected errors
+        logger.error(f"Unexpected error exporting {notebook_path}: {e}")
+
+    # Forget the previous export, so a failed notebook is retried on the next build
+    if manifest is not None:
+        manifest["notebooks"].pop(str(notebook_path), None)
+    return False
+
+
+def _file_digest(path: Path) -> str:
+    """Compute the SHA-256 digest of a file without loading it into memory.
+
+    Args:
+        path (Path): Path to the file
+
+    Returns:
+        str: Hex digest of the file content
+    """
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _encode_code(code: str) -> str:
+    """Encode notebook code for the <marimo-code> element of a page, escaping as little as possible.
+
+    marimo percent-encodes the whole notebook, which makes every space and newline three bytes.
+    The frontend reads the element with decodeURIComponent() on its textContent or innerHTML, so
+    only the characters that those change, and "%" itself, have to be escaped.
+
+    Args:
+        code (str): The notebook code
+
+    Returns:
+        str: The encoded code
+    """
+    return re.sub(r"[%&<>\r\xa0]", lambda match: urllib.parse.quote(match.group()), code)
+
+
+def _bootstrap_public_modules(page: str, notebook_path: Path) -> str:
+    """Make the modules a notebook imports from its public/ folder importable in its exported page.
+
+    The public/ folder is exported next to the page, but is not on the file system of pyodide,
+    so PUBLIC_MODULE_BOOTSTRAP is put in front of each import of such a module in the notebook
+    code of the page. It downloads the module when the notebook runs in the browser, and does
+    nothing elsewhere, so a notebook downloaded from the page still runs locally.
+
+    Args:
+        page (str): The exported page
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        str: The page, with the notebook code changed if it imports such modules
+    """
+    match = re.search(r"(<marimo-code\b[^>]*>)(.*?)(</marimo-code\s*>)", page, re.S | re.I)
+    if match is None:
+        return page
+    code = urllib.parse.unquote(match.group(2))
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return page
+    lines = code.splitlines(keepends=True)
+    imports = [
+        (node.lineno - 1, node.col_offset, module)
+        for node in ast.walk(tree)
+        if (module := _public_module(node, notebook_path))
+        # Only statements on a line of their own can get code in front of them
+        and not lines[node.lineno - 1][:node.col_offset].strip()
+    ]
+    if not imports:
+        return page
+    for line, indent, module in sorted(imports, reverse=True):
+        prefix = lines[line][:indent]
+        bootstrap = PUBLIC_MODULE_BOOTSTRAP.format(module=module)
+        lines.insert(line, "".join(prefix + row if row.strip() else row for row in bootstrap.splitlines(keepends=True)))
+    return page[:match.start(2)] + _encode_code("".join(lines)) + page[match.end(2):]
+
+
+def _strip_cell_comments(code: str) -> str:
+    """Remove the lines with only a comment from the cells of a notebook.
+
+    Top-level comments, like the PEP 723 header, are kept. The code is only changed if it
+    still parses to the same syntax tree.
+
+    Args:
+        code (str): The notebook code
+
+    Returns:
+        str: The code without comment lines in cells
+    """
+    lines = code.splitlines(keepends=True)
+    try:
+        comments = {
+            token.start[0] - 1
+            for token in tokenize.generate_tokens(io.StringIO(code).readline)
+            if token.type == tokenize.COMMENT and token.start[1] > 0
+            and not lines[token.start[0] - 1][: token.start[1]].strip()
+        }
+        stripped = "".join(line for number, line in enumerate(lines) if number not in comments)
+        if ast.dump(ast.parse(stripped)) == ast.dump(ast.parse(code)):
+            return stripped
+    except (SyntaxError, tokenize.TokenError):
+        pass
+    return code
+
+
+def _minify_markup(markup: str, as_app: bool) -> str:
+    """Minify HTML markup without raw text elements: comments, whitespace between tags, and the
+    JSON config of the marimo elements. Whitespace between two inline elements (see
+    PHRASING_ELEMENTS) becomes a single space, as it shows on the page.
+
+    Args:
+        markup (str): The markup
+        as_app (bool): Whether the page is an app, whose config can leave out the editor settings
+
+    Returns:
+        str: The minified markup
+    """
+    def compact_config(tag: re.Match) -> str:
+        def compact(attribute: re.Match) -> str:
+            try:
+                config = json.loads(html.unescape(attribute.group(2)))
+            except ValueError:
+                return attribute.group(0)
+            if tag.group(1) == "marimo-user-config" and attribute.group(1) == "data-config" and as_app:
+                config = {key: value for key, value in config.items() if key not in RUN_MODE_UNUSED_CONFIG}
+            value = json.dumps(config, separators=(",", ":")).replace("&", "&amp;").replace("'", "&#x27;")
+            return f"{attribute.group(1)}='{value}'"
+
+        return re.sub(r"(data-config|data-overrides)='([^']*)'", compact, tag.group(0))
+
+    def collapse(space: re.Match) -> str:
+        before = TAG_NAME_REGEX.match(markup, markup.rfind("<", 0, space.start()))
+        after = TAG_NAME_REGEX.match(markup, space.end() - 1)
+        inline = all(tag is not None and tag.group(1).lower() in PHRASING_ELEMENTS for tag in (before, after))
+        return "> <" if inline else "><"
+
+    markup = re.sub(r"<!--(?!\[if).*?-->", "", markup, flags=re.S)
+    markup = re.sub(r">\s+<", collapse, markup)
+    markup = re.sub(r"^\s+(?=<)|(?<=>)\s+$", "", markup)
+    return re.sub(r"<(marimo-user-config|marimo-app-config)\b[^>]*>", compact_config, markup)
+
+
+def _minify_html(page: str, as_app: bool) -> str:
+    """Minify an exported page.
+
+    Comments and whitespace between tags are removed, the embedded JSON is compacted, and the
+    notebook code is encoded with _encode_code(). In apps, which run with their code hidden
+    (--no-show-code), the comment lines in the cells are removed as well. Scripts and styles are
+    left as they are.
+
+    Args:
+        page (str): The exported page
+        as_app (bool): Whether the page is an app, exported in run mode
+
+    Returns:
+        str: The minified page
+    """
+    parts = []
+    position = 0
+    for match in RAW_TEXT_REGEX.finditer(page):
+        open_tag, tag, content, close_tag = match.groups()
+        parts.append(_minify_markup(page[position:match.start()], as_app))
+        if tag.lower() == "marimo-code":
+            code = urllib.parse.unquote(content)
+            if as_app and re.search(r"""data-show-code=["']false["']""", open_tag):
+                code = _strip_cell_comments(code)
+            content = _encode_code(code)
+        parts.append(open_tag + content + close_tag)
+        position = match.end()
+    parts.append(_minify_markup(page[position:], as_app))
+    return "".join(parts)
+
+
+class _PageStructure(html.parser.HTMLParser):
+    """Collects what a browser makes of a page: its elements with their attributes, the text of
+    scripts, styles and other elements, and the syntax tree of the notebook code. Whitespace
+    between elements, comments and the editor settings of apps (see RUN_MODE_UNUSED_CONFIG) are
+    left out, as _minify_html() removes them, except for the space between two inline elements.
+    """
+
+    def __init__(self, as_app: bool) -> None:
+        """Create an empty structure.
+
+        Args:
+            as_app (bool): Whether the page is an app, exported in run mode
+        """
+        super().__init__()
+        self.as_app = as_app
+        self.items: list = []
+        self.tag: str | None = None
+        self.last_tag: str | None = None
+        self.text: List[str] = []
+
+    def _flush(self, next_tag: str | None = None) -> None:
+        text = "".join(self.text)
+        self.text = []
+        if self.tag == "marimo-code":
+            code = urllib.parse.unquote(text).strip()
+            try:
+                self.items.append(("code", ast.dump(ast.parse(code))))
+            except SyntaxError:
+                self.items.append(("code", code))
+        elif text.strip():
+            self.items.append(("text", text.strip()))
+        elif text and self.last_tag in PHRASING_ELEMENTS and next_tag in PHRASING_ELEMENTS:
+            self.items.append(("text", " "))
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        self._flush(tag)
+        attributes = {}
+        for name, value in attrs:
+            if name in ("data-config", "data-overrides") and value:
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+                if tag == "marimo-user-config" and name == "data-config" and self.as_app and isinstance(value, dict):
+                    value = {key: item for key, item in value.items() if key not in RUN_MODE_UNUSED_CONFIG}
+            attributes[name] = value
+        self.items.append(("start", tag, attributes))
+        self.tag = self.last_tag = tag
+
+    def handle_endtag(self, tag: str) -> None:
+        self._flush(tag)
+        self.items.append(("end", tag))
+        self.tag = None
+        self.last_tag = tag
+
+    def handle_data(self, data: str) -> None:
+        self.text.append(data)
+
+    def handle_decl(self, decl: str) -> None:
+        self._flush()
+        self.items.append(("decl", decl))
+        self.last_tag = None
+
+
+def _page_structure(page: str, as_app: bool) -> list:
+    """Get the structure of a page, to check that minifying it didn't change what it does.
+
+    Args:
+        page (str): The page
+        as_app (bool): Whether the page is an app, exported in run mode
+
+    Returns:
+        list: The structure collected by _PageStructure
+    """
+    parser = _PageStructure(as_app)
+    parser.feed(page)
+    parser.close()
+    parser._flush()
+    return parser.items
+
+
+def _minify_pages(output_dir: Path, manifest: dict, report: dict) -> None:
+    """Minify the exported pages with _minify_html().
+
+    A minified page is only kept if it has the same structure as the exported one (see
+    _page_structure()), so the page still boots the same way. Pages that are still the result of
+    the previous build are skipped.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): Build manifest, updated with a "minified" section
+        report (dict): Build report, updated with a "minified" section
+    """
+    previous = manifest.get("minified", {})
+    minified: dict = {}
+    changed = 0
+    for entry in manifest["notebooks"].values():
+        page = output_dir / entry["html_path"]
+        if not page.exists():
+            continue
+        if entry["html_path"] in previous and previous[entry["html_path"]]["sha256"] == _file_digest(page):
+            minified[entry["html_path"]] = previous[entry["html_path"]]
+            continue
+        source = page.read_text(encoding="utf-8")
+        result = _minify_html(source, entry["as_app"])
+        if _page_structure(result, entry["as_app"]) != _page_structure(source, entry["as_app"]):
+            logger.warning(f"Minifying {page} changed its structure, keeping the exported page")
+            continue
+        page.write_text(result, encoding="utf-8")
+        minified[entry["html_path"]] = {
+            "size_before": len(source.encode("utf-8")),
+            "size_after": len(result.encode("utf-8")),
+            "sha256": _file_digest(page),
+        }
+        changed += 1
+    manifest["minified"] = dict(sorted(minified.items()))
+    report["minified"] = {
+        path: {key: value for key, value in stats.items() if key != "sha256"} for path, stats in manifest["minified"].items()
+    }
+    if not minified:
+        return
+
+    width = max([len("Page")] + [len(path) for path in minified])
+    lines = [f"{'Page':<{width}}  {'Before (kB)':>11}  {'After (kB)':>10}  {'Saved (kB)':>10}"]
+    for path, stats in manifest["minified"].items():
+        lines.append(
+            f"{path:<{width}}  {stats['size_before'] / 1e3:>11.1f}  {stats['size_after'] / 1e3:>10.1f}  "
+            f"{(stats['size_before'] - stats['size_after']) / 1e3:>10.1f}"
+        )
+    saved = sum(stats["size_before"] - stats["size_after"] for stats in minified.values())
+    logger.info(f"Minified {changed} page(s), {len(minified)} in total, saving {saved / 1e3:.1f} kB:\n" + "\n".join(lines))
+
+
+def _convert_csv(path: Path, target: Path, frozen_schema: pa.Schema | None) -> pa.Schema:
+    """Convert a CSV file to Parquet, so it doesn't have to be parsed as text in the browser.
+
+    The CSV is read with the same options as the read_columnar() fallback in the notebooks (see
+    dataloader.csv_convert_options()). The column types are inferred the first time, like polars
+    does (empty values are null).
+    Later conversions read the CSV with the frozen types of the first one, so a notebook never
+    gets a column with a different type. If the CSV no longer fits the frozen types, they are
+    inferred again.
+
+    Args:
+        path (Path): Path to the CSV file
+        target (Path): Path to write the Parquet file to
+        frozen_schema (pa.Schema | None): Column types of a previous conversion, if any
+
+    Returns:
+        pa.Schema: The column types of the written file
+    """
+    if frozen_schema is not None:
+        try:
+            table = pa_csv.read_csv(path, convert_options=dataloader.csv_convert_options(frozen_schema))
+            if table.schema.names != frozen_schema.names:
+                raise pa.ArrowInvalid(f"expected the columns {frozen_schema.names}, got {table.schema.names}")
+        except pa.ArrowInvalid as e:
+            logger.warning(f"{path} no longer fits its frozen column types, inferring them again: {e}")
+            frozen_schema = None
+    if frozen_schema is None:
+        table = pa_csv.read_csv(path, convert_options=dataloader.csv_convert_options())
+    tmp_path = target.with_name(f".{target.name}.tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, target)
+    return table.schema
+
+
+def _convert_csv_assets(output_dir: Path, manifest: dict, report: dict) -> None:
+    """Write a Parquet copy next to every exported public/*.csv file, see _convert_csv().
+
+    The copy has the same name with a .parquet suffix, and is read by the read_columnar()
+    loader in the notebooks, which falls back to the CSV. CSV files are skipped if a file with
+    that name is exported already, and if they are unchanged since the copy was written. The
+    frozen column types are kept in the manifest.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): Build manifest, updated with a "columnar" section
+        report (dict): Build report, updated with a "columnar" section
+    """
+    previous = manifest.get("columnar", {})
+    columnar: dict = {}
+    for path in sorted(output_dir.rglob("public/**/*.csv")):
+        rel_path = str(path.relative_to(output_dir))
+        target = path.with_suffix(".parquet")
+        entry = previous.get(rel_path)
+        if target.exists() and entry is None:
+            logger.warning(f"Not converting {rel_path}, {target.name} is an asset of its own")
+            continue
+        digest = _file_digest(path)
+        if entry is not None and entry["sha256"] == digest and target.exists():
+            columnar[rel_path] = entry
+            continue
+
+        frozen_schema = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(entry["schema"]))) if entry else None
+        try:
+            schema = _convert_csv(path, target, frozen_schema)
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Could not convert {rel_path} to Parquet: {e}")
+            continue
+        columnar[rel_path] = {
+            "sha256": digest,
+            "parquet": str(target.relative_to(output_dir)),
+            "schema": base64.b64encode(schema.serialize().to_pybytes()).decode("ascii"),
+            "dtypes": {field.name: str(field.type) for field in schema},
+        }
+        logger.info(f"Converted {rel_path} to Parquet: {path.stat().st_size / 1e3:.0f} kB -> {target.stat().st_size / 1e3:.0f} kB")
+
+    manifest["columnar"] = columnar
+    report["columnar"] = {
+        rel_path: {
+            "csv_bytes": (output_dir / rel_path).stat().st_size,
+            "parquet_bytes": (output_dir / entry["parquet"]).stat().st_size,
+        }
+        for rel_path, entry in columnar.items()
+    }
+
+
+def _read_time(path: Path, rounds: int = 3) -> float:
+    """Measure how long it takes to read a Parquet file, as the best of a few rounds.
+
+    Args:
+        path (Path): Path to the Parquet file
+        rounds (int, optional): Number of times to read the file. Defaults to 3.
+
+    Returns:
+        float: Shortest read time in seconds
+    """
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        pq.read_table(path)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _optimize_parquet(path: Path, sort_by: List[str], row_group_size: int, compression_level: int) -> dict:
+    """Rewrite a Parquet file in a layout that is cheaper to download and read in the browser.
+
+    The file is written with zstd compression, row groups of a fixed size, a page index and
+    statistics, and dictionary encoding for string columns with few distinct values, optionally
+    sorted so readers can skip row groups by their statistics. The rewritten file replaces the
+    original only if it reads back to the same table and is not larger, otherwise the original is kept.
+
+    Args:
+        path (Path): Path to the Parquet file, rewritten in place
+        sort_by (List[str]): Columns to sort the rows by, may be empty
+        row_group_size (int): Number of rows per row group
+        compression_level (int): zstd compression level
+
+    Returns:
+        dict: Size ("size_before", "size_after") and read time ("read_before_s", "read_after_s")
+        of the file before and after, and whether the rewritten file was kept ("optimized")
+    """
+    table = pq.read_table(path)
+    ordering = [(column, "ascending") for column in sort_by]
+    if ordering:
+        table = table.sort_by(ordering)
+    dictionary_columns = [
+        field.name for field, column in zip(table.schema, table.columns)
+        if pa.types.is_dictionary(field.type)
+        or (
+            (pa.types.is_string(field.type) or pa.types.is_large_string(field.type))
+            and pc.count_distinct(column).as_py() <= PARQUET_DICTIONARY_MAX_RATIO * len(column)
+        )
+    ]
+
+    stats = {"size_before": path.stat().st_size, "read_before_s": _read_time(path)}
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        pq.write_table(
+            table,
+            tmp_path,
+            row_group_size=row_group_size,
+            compression="zstd",
+            compression_level=compression_level,
+            use_dictionary=dictionary_columns,
+            write_statistics=True,
+            write_page_index=True,
+            sorting_columns=pq.SortingColumn.from_ordering(table.schema, ordering) if ordering else None,
+        )
+        stats["optimized"] = tmp_path.stat().st_size <= stats["size_before"] and pq.read_table(tmp_path).equals(table)
+        if stats["optimized"]:
+            os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    stats["size_after"] = path.stat().st_size
+    stats["read_after_s"] = _read_time(path) if stats["optimized"] else stats["read_before_s"]
+    return stats
+
+
+def _optimize_assets(output_dir: Path, manifest: dict, report: dict, config: dict, jobs: int = 1) -> None:
+    """Rewrite the exported public/*.parquet files with _optimize_parquet().
+
+    Only the copies in the output directory are rewritten, the files in the repository stay as
+    they are and remain the fallback. Files that are still the result of the previous build are
+    skipped, and so are partitions written by _partition_assets(). Files with the same content
+    are rewritten once. The settings are read from
+    [tool.marimo-build.parquet] in pyproject.toml: "row-group-size", "compression-level", and
+    "sort-by", a table of column lists keyed by the asset path (e.g. "notebooks/public/data.parquet").
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): Build manifest, updated with a "parquet" section
+        report (dict): Build report, updated with a "parquet" section
+        config (dict): The build configuration from pyproject.toml
+        jobs (int, optional): Number of processes to rewrite files with. Defaults to 1.
+    """
+    settings = config.get("parquet", {})
+    row_group_size = settings.get("row-group-size", PARQUET_ROW_GROUP_SIZE)
+    compression_level = settings.get("compression-level", PARQUET_COMPRESSION_LEVEL)
+    previous = manifest.get("parquet", {})
+    optimized: dict = {}
+    to_optimize: dict = {}
+    copies: dict = {}
+
+    for path in sorted(output_dir.rglob("public/**/*.parquet")):
+        # The partitions of a partitioned file are written from the rewritten file
+        if (path.parent / PARTITION_MANIFEST_FILE).exists():
+            continue
+        rel_path = str(path.relative_to(output_dir))
+        digest = _file_digest(path)
+        if rel_path in previous and previous[rel_path]["sha256"] == digest:
+            optimized[rel_path] = previous[rel_path]
+        elif digest in to_optimize:
+            copies[path] = to_optimize[digest]
+        else:
+            to_optimize[digest] = path
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {
+            path: executor.submit(
+                _optimize_parquet, path, settings.get("sort-by", {}).get(str(path.relative_to(output_dir)), []),
+                row_group_size, compression_level,
+            )
+            for path in to_optimize.values()
+        }
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                logger.warning(f"Could not optimize {path}, keeping the original: {e}")
+
+    # Files with the same content get the same rewritten file
+    for copy, path in copies.items():
+        if path in results:
+            if results[path]["optimized"]:
+                shutil.copy2(path, copy)
+            results[copy] = results[path]
+
+    for path, stats in results.items():
+        optimized[str(path.relative_to(output_dir))] = {**stats, "sha256": _file_digest(path)}
+    manifest["parquet"] = dict(sorted(optimized.items()))
+    report["parquet"] = {
+        path: {key: value for key, value in stats.items() if key != "sha256"} for path, stats in manifest["parquet"].items()
+    }
+    if not optimized:
+        return
+
+    width = max([len("Asset")] + [len(path) for path in optimized])
+    lines = [f"{'Asset':<{width}}  {'Before (MB)':>11}  {'After (MB)':>10}  {'Read before (s)':>15}  {'Read after (s)':>14}"]
+    for path, stats in manifest["parquet"].items():
+        lines.append(
+            f"{path:<{width}}  {stats['size_before'] / 1e6:>11.2f}  {stats['size_after'] / 1e6:>10.2f}  "
+            f"{stats['read_before_s']:>15.3f}  {stats['read_after_s']:>14.3f}"
+            + ("" if stats["optimized"] else "  (kept original)")
+        )
+    logger.info(f"Optimized {len(results)} Parquet file(s), {len(optimized)} in total:\n" + "\n".join(lines))
+
+
+def _column_stats(column: pa.ChunkedArray) -> dict | None:
+    """Get the minimum and maximum of a column, as JSON values.
+
+    Args:
+        column (pa.ChunkedArray): The column
+
+    Returns:
+        dict | None: "min" and "max" of the column (None if it only has nulls), or None if the
+        column type has no order, like lists and structs
+    """
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    if not (
+        pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_boolean(column.type)
+        or pa.types.is_string(column.type) or pa.types.is_large_string(column.type) or pa.types.is_temporal(column.type)
+    ):
+        return None
+    min_max = pc.min_max(column).as_py()
+    # Dates and timestamps are written in ISO format, which sorts like the values themselves
+    return {key: value.isoformat() if hasattr(value, "isoformat") else value for key, value in min_max.items()}
+
+
+def _partition_parquet(path: Path, key: str) -> dict:
+    """Split a Parquet file into one file per value of a column, and describe them in a manifest.
+
+    The partitions are written into a folder named after the file (data.parquet -> data/), one
+    file per value (data/kommune=0301.parquet), and the manifest (data/manifest.json) lists the
+    file, value, row count, size and the minimum and maximum of every column of each partition,
+    so readers can fetch only the partitions a filter needs. The file itself is kept.
+
+    Args:
+        path (Path): Path to the Parquet file
+        key (str): Column to partition by
+
+    Returns:
+        dict: The manifest
+    """
+    table = pq.read_table(path)
+    folder = path.with_suffix("")
+    shutil.rmtree(folder, ignore_errors=True)
+    folder.mkdir()
+
+    column = table[key]
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    partitions = []
+    for value in sorted(pc.unique(column).to_pylist(), key=lambda value: (value is None, str(value))):
+        rows = table.filter(pc.is_null(column) if value is None else pc.equal(column, pa.scalar(value, column.type)))
+        name = PARTITION_NULL_VALUE if value is None else urllib.parse.quote(str(value), safe="")
+        partition_path = folder / f"{key}={name}.parquet"
+        pq.write_table(rows, partition_path, compression="zstd", write_statistics=True)
+        stats = {field.name: _column_stats(rows[field.name]) for field in rows.schema}
+        partitions.append({
+            "path": partition_path.name,
+            "value": value.isoformat() if hasattr(value, "isoformat") else value,
+            "rows": rows.num_rows,
+            "bytes": partition_path.stat().st_size,
+            "stats": {name: column_stats for name, column_stats in stats.items() if column_stats is not None},
+        })
+
+    manifest = {
+        "source": path.name,
+        "key": key,
+        "rows": table.num_rows,
+        "columns": {field.name: str(field.type) for field in table.schema},
+        "partitions": partitions,
+    }
+    (folder / PARTITION_MANIFEST_FILE).write_text(json.dumps(manifest, indent=2, ensure_ascii=False))
+    return manifest
+
+
+def _partition_assets(output_dir: Path, manifest: dict, report: dict, config: dict) -> None:
+    """Partition the exported Parquet files listed in [tool.marimo-build.partitions], see _partition_parquet().
+
+    The table in pyproject.toml maps the path of a Parquet asset to the column to partition it
+    by, e.g. "notebooks/public/data.parquet" = "kommune". Files that are unchanged since they
+    were partitioned are skipped.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): Build manifest, updated with a "partitions" section
+        report (dict): Build report, updated with a "partitions" section
+        config (dict): The build configuration from pyproject.toml
+    """
+    previous = manifest.get("partitions", {})
+    partitioned: dict = {}
+    for rel_path, key in sorted(config.get("partitions", {}).items()):
+        path = output_dir / rel_path
+        if not path.is_file():
+            logger.debug(f"Not partitioning {rel_path}, it is not in the output directory")
+            continue
+        digest = _file_digest(path)
+        entry = previous.get(rel_path)
+        if (
+            entry is not None and entry["sha256"] == digest and entry["key"] == key
+            and (path.with_suffix("") / PARTITION_MANIFEST_FILE).exists()
+        ):
+            partitioned[rel_path] = entry
+            continue
+        try:
+            dataset = _partition_parquet(path, key)
+        except (pa.ArrowException, KeyError, OSError) as e:
+            logger.warning(f"Could not partition {rel_path} by {key}: {e}")
+            continue
+        partitioned[rel_path] = {
+            "sha256": digest,
+            "key": key,
+            "partitions": len(dataset["partitions"]),
+            "rows": dataset["rows"],
+            "largest_bytes": max((partition["bytes"] for partition in dataset["partitions"]), default=0),
+        }
+        logger.info(
+            f"Partitioned {rel_path} by {key} into {len(dataset['partitions'])} files, "
+            f"the largest is {partitioned[rel_path]['largest_bytes'] / 1e6:.2f} MB"
+        )
+
+    manifest["partitions"] = partitioned
+    report["partitions"] = {rel_path: {k: v for k, v in entry.items() if k != "sha256"} for rel_path, entry in partitioned.items()}
+
+
+def _write_report(output_dir: Path, report: dict) -> None:
+    """Write the build report and log a summary table, slowest exports first.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        report (dict): The build report
+    """
+    report_path = output_dir / REPORT_FILE
+    report_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+    logger.info(f"Saved build report to {report_path}")
+
+    rows = sorted(report["notebooks"].items(), key=lambda item: item[1]["wall_time_s"], reverse=True)
+    width = max([len("Notebook")] + [len(path) for path, _ in rows])
+    lines = [f"{'Notebook':<{width}}  {'Time (s)':>8}  {'Peak RSS (MB)':>13}  {'HTML (kB)':>9}  {'Assets (kB)':>11}"]
+    for path, stats in rows:
+        time_text = "cached" if stats["cached"] else f"{stats['wall_time_s']:.1f}"
+        lines.append(
+            f"{path:<{width}}  {time_text:>8}  {stats['peak_rss_bytes'] / 1e6:>13.0f}  "
+            f"{stats['html_bytes'] / 1e3:>9.0f}  {stats['asset_bytes'] / 1e3:>11.0f}"
+        )
+    logger.info("Build report:\n" + "\n".join(lines))
+
+
+def _worth_compressing(path: Path) -> bool:
+    """Check whether a file is likely to shrink when compressed.
+
+    Files in formats that are usually compressed already are probed by quickly compressing
+    their first megabyte. Other files are always worth trying.
+
+    Args:
+        path (Path): Path to the file
+
+    Returns:
+        bool: False if the file is empty or is not expected to shrink
+    """
+    if path.stat().st_size == 0:
+        return False
+    if path.suffix.lower() not in COMPRESSED_SUFFIXES:
+        return True
+    with open(path, "rb") as f:
+        sample = f.read(1_000_000)
+    return len(gzip.compress(sample, compresslevel=1)) <= MAX_COMPRESSION_RATIO * len(sample)
+
+
+def _compress_file(path: Path) -> dict:
+    """Write .gz and .br sidecars next to a file, keeping only those that make it smaller.
+
+    Args:
+        path (Path): Path to the file
+
+    Returns:
+        dict: Size of the original file ("size") and of each kept sidecar ("gzip", "br")
+    """
+    data = path.read_bytes()
+    sizes = {"size": len(data)}
+    for encoding, suffix, compress in (
+        ("gzip", ".gz", lambda raw: gzip.compress(raw, compresslevel=9, mtime=0)),
+        ("br", ".br", lambda raw: brotli.compress(raw, quality=11 if len(raw) < LARGE_FILE_BYTES else 9)),
+    ):
+        sidecar = path.with_name(path.name + suffix)
+        compressed = compress(data)
+        if len(compressed) <= MAX_COMPRESSION_RATIO * len(data):
+            sidecar.write_bytes(compressed)
+            sizes[encoding] = len(compressed)
+        else:
+            sidecar.unlink(missing_ok=True)
+    return sizes
+
+
+def _remove_sidecars(output_dir: Path, rel_paths) -> int:
+    """Delete the .gz and .br sidecars written next to some files in the output directory.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        rel_paths: Paths of the files, relative to the output directory
+
+    Returns:
+        int: Number of sidecars deleted
+    """
+    removed = 0
+    for rel_path in rel_paths:
+        for suffix in SIDECAR_SUFFIXES:
+            sidecar = output_dir / (rel_path + suffix)
+            if sidecar.is_file():
+                sidecar.unlink()
+                removed += 1
+    return removed
+
+
+def _compress_site(output_dir: Path, manifest: dict, jobs: int = 1) -> None:
+    """Write precompressed .gz and .br sidecars for the files in the output directory.
+
+    Static file servers can serve the sidecars directly to clients that accept gzip or brotli.
+    Sidecars that are newer than their file are reused. The files are compressed in parallel in
+    a process pool. The sizes are recorded in the manifest. The sidecars of the previous build
+    whose file was removed, or is no longer worth compressing, are deleted, so a server never
+    serves them in place of the file.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): Build manifest, updated with a "compressed" section
+        jobs (int, optional): Number of processes to compress files with. Defaults to 1.
+    """
+    previous = manifest.get("compressed", {})
+    compressed: dict = {}
+    to_compress: List[Path] = []
+    skip_names = {MANIFEST_FILE, REPORT_FILE, PROFILE_FILE}
+
+    for path in sorted(output_dir.rglob("*")):
+        if not path.is_file() or path.suffix in SIDECAR_SUFFIXES or path.name in skip_names:
+            continue
+        # Reuse the sidecars from the previous build if the file has not changed since
+        rel_path = str(path.relative_to(output_dir))
+        sidecars = [path.with_name(path.name + suffix) for suffix in SIDECAR_SUFFIXES]
+        existing = [sidecar for sidecar in sidecars if sidecar.exists()]
+        if rel_path in previous and existing and all(
+            sidecar.stat().st_mtime >= path.stat().st_mtime for sidecar in existing
+        ):
+            compressed[rel_path] = previous[rel_path]
+            continue
+        if _worth_compressing(path):
+            to_compress.append(path)
+
+    # Compress the files in a process pool. The large files are submitted one by one and first,
+    # so they are spread over the workers, and the many small files follow in batches.
+    paths = sorted(to_compress, key=lambda path: path.stat().st_size, reverse=True)
+    large = [path for path in paths if path.stat().st_size >= LARGE_FILE_BYTES]
+    small = paths[len(large):]
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = dict(zip(large, executor.map(_compress_file, large)))
+        results.update(zip(small, executor.map(_compress_file, small, chunksize=16)))
+
+    for path, sizes in results.items():
+        if len(sizes) > 1:
+            compressed[str(path.relative_to(output_dir))] = sizes
+    manifest["compressed"] = dict(sorted(compressed.items()))
+    removed = _remove_sidecars(output_dir, [rel_path for rel_path in previous if rel_path not in compressed])
+    if removed:
+        logger.info(f"Deleted {removed} sidecar(s) of removed or incompressible files")
+
+    original = sum(sizes["size"] for sizes in compressed.values())
+    smallest = sum(min(sizes.get("gzip", sizes["size"]), sizes.get("br", sizes["size"])) for sizes in compressed.values())
+    logger.info(
+        f"Precompressed {len(results)} file(s), {len(compressed)} with sidecars: "
+        f"{original / 1e6:.1f} MB -> {smallest / 1e6:.1f} MB"
+    )
+
+
+def _download_size(url: str, cache: dict) -> int | None:
+    """Look up the size of a file with a HEAD request, e.g. of a wheel on the pyodide CDN.
+
+    Args:
+        url (str): URL of the file
+        cache (dict): Sizes looked up in previous builds, keyed by URL, updated with this one
+
+    Returns:
+        int | None: The size in bytes, or None if it can't be looked up
+    """
+    if url in cache:
+        return cache[url]["size"]
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=10) as response:
+            size = int(response.headers["Content-Length"])
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        # Not cached, so the next build tries again
+        logger.debug(f"Could not look up the size of {url}: {e}")
+        return None
+    cache[url] = {"size": size}
+    return size
+
+
+def _package_size(
+    name: str, version: str | None, config: dict, cache: dict, lock: dict | None = None, counted: set | None = None
+) -> int | None:
+    """Look up the download size of a package, with the packages it depends on.
+
+    Sizes configured in [tool.marimo-build.package-sizes] take precedence. A package in the
+    pyodide lock file of the page is counted with the packages it depends on in the lock file,
+    by the size of their wheels (on the pyodide CDN, or on PyPI for the packages of a precomputed
+    lock file, see _page_lock()). Other packages are installed with micropip, and are counted by the size of their
+    pure Python wheel on PyPI.
+
+    Args:
+        name (str): Normalized package name
+        version (str | None): Pinned version, or None for the latest version
+        config (dict): The build configuration from pyproject.toml
+        cache (dict): Sizes looked up in previous builds, updated with the new lookups
+        lock (dict | None, optional): The packages of the lock file the page loads, see
+                                      _page_lock(). Defaults to None.
+        counted (set | None, optional): Wheels already counted for the page, which are not counted
+                                        again and are updated with those of the package. Defaults to None.
+
+    Returns:
+        int | None: The size in bytes, or None if it is unknown
+    """
+    configured = config.get("package-sizes", {})
+    if name in configured:
+        return _parse_size(configured[name])
+
+    counted = set() if counted is None else counted
+    if lock is not None and name in lock:
+        files, pending = [], [name]
+        while pending:
+            package = lock.get(pending.pop())
+            if package is not None and package["url"] not in counted and package["url"] not in files:
+                files.append(package["url"])
+                pending += package["depends"]
+        sizes = [_download_size(url, cache) for url in files]
+        if None in sizes:
+            return None
+        counted.update(files)
+        return sum(sizes)
+
+    key = f"{name}=={version or 'latest'}"
+    entry = cache.get(key)
+    if entry is not None and (version or time.time() - entry["checked"] < PACKAGE_SIZE_MAX_AGE_S):
+        return entry["size"]
+    try:
+        with urllib.request.urlopen(PYPI_JSON_URL.format(name=name), timeout=10) as response:
+            project = json.load(response)
+        files = project["releases"][version] if version else project["urls"]
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug(f"Could not look up the size of {key} on PyPI: {e}")
+        return None
+    sizes = [file["size"] for file in files if file["filename"].endswith("-none-any.whl")]
+    if not sizes:
+        return None
+    cache[key] = {"size": min(sizes), "checked": round(time.time())}
+    return cache[key]["size"]
+
+
+def _page_lock(output_dir: Path, html_path: str, manifest: dict, downloads: dict) -> dict | None:
+    """Get the packages of the pyodide lock file an exported page loads.
+
+    That is the lock file precomputed for the page (see _precompute_locks()), or else the lock
+    file of marimo, which is downloaded once per build.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        html_path (str): Path of the exported page, relative to the output directory
+        manifest (dict): Build manifest, whose notebook entries have the "lock" of their page
+        downloads (dict): Lock files downloaded earlier in the build, keyed by URL
+
+    Returns:
+        dict | None: The URL of the wheel ("url") and the normalized names of the packages it
+        depends on ("depends") of each package, by normalized name, or None if the lock file is
+        not available
+    """
+    pyodide_version = _pyodide_version((output_dir / html_path).parent / "assets")
+    if pyodide_version is None:
+        return None
+    lock_path = manifest["notebooks"].get(str(Path(html_path).with_suffix(".py")), {}).get("lock")
+    lock_url = _page_lock_url(output_dir, html_path)
+    if lock_path is not None:
+        lock = json.loads((output_dir / lock_path).read_text(encoding="utf-8"))
+    elif lock_url is not None:
+        if lock_url not in downloads:
+            try:
+                with urllib.request.urlopen(lock_url, timeout=30) as response:
+                    downloads[lock_url] = json.load(response)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not download {lock_url} to look up package sizes: {e}")
+                downloads[lock_url] = None
+        lock = downloads[lock_url]
+    else:
+        lock = None
+    if lock is None:
+        return None
+    # pyodide resolves the file names in the lock file against the CDN it is loaded from
+    cdn_url = PYODIDE_CDN_URL.format(version=pyodide_version)
+    return {
+        canonicalize_name(name): {
+            "url": urllib.parse.urljoin(cdn_url, package["file_name"]),
+            "depends": [canonicalize_name(dependency) for dependency in package.get("depends", [])],
+        }
+        for name, package in lock.get("packages", {}).items()
+    }
+
+
+def _page_breakdown(notebook_path: Path, output_dir: Path, config: dict, manifest: dict, downloads: dict) -> dict:
+    """Work out what a browser downloads to open an exported notebook.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+        output_dir (Path): Directory where the exported files are saved
+        config (dict): The build configuration from pyproject.toml
+        manifest (dict): Build manifest, whose "package_sizes" section caches package sizes, and whose
+                         "columnar" section lists the Parquet copies of CSV files
+        downloads (dict): Lock files downloaded earlier in the build, see _page_lock()
+
+    Returns:
+        dict: Sizes in bytes of the exported HTML ("html"), of each referenced public/ asset
+        ("assets", as exported) and of each declared dependency with the packages it depends on
+        ("packages", None if unknown). A package needed by several dependencies is counted once.
+        marimo itself is part of the WebAssembly runtime, and is not counted as a dependency.
+    """
+    metadata = _script_metadata_toml(notebook_path.read_text(encoding="utf-8"))
+    cache = manifest.setdefault("package_sizes", {})
+    html_path = str(notebook_path.with_suffix(".html"))
+    lock = _page_lock(output_dir, html_path, manifest, downloads)
+    counted: set = set()
+    packages = {}
+    for requirement in metadata.get("dependencies", []):
+        name, version = _parse_requirement(requirement)
+        if name == "marimo":
+            continue
+        packages[requirement] = _package_size(name, version, config, cache, lock, counted)
+    # Count the Parquet copy of a CSV file instead of the CSV itself, as that is what gets loaded
+    columnar = manifest.get("columnar", {})
+    exported = {
+        path: output_dir / columnar[str(path)]["parquet"] if str(path) in columnar else output_dir / path
+        for path in _referenced_assets(notebook_path)
+    }
+    return {
+        "html": (output_dir / html_path).stat().st_size,
+        "assets": {
+            str(path): (exported_path if exported_path.is_file() else path).stat().st_size
+            for path, exported_path in exported.items()
+        },
+        "packages": packages,
+    }
+
+
+def _check_budgets(output_dir: Path, manifest: dict, report: dict, config: dict) -> bool:
+    """Check the total download size of every exported page against its budget.
+
+    The budget of a notebook is taken from [tool.marimo-build] in its PEP 723 header, from
+    [tool.marimo-build.budgets] in pyproject.toml (keyed by notebook path), or from the default
+    "budget" in [tool.marimo-build] in pyproject.toml. Notebooks without a budget are not checked.
+    The totals are added to the report, and pages over budget are logged with a breakdown. A
+    package whose size can't be found is reported with a warning, as the total of its page is
+    then too low, and should be added to [tool.marimo-build.package-sizes].
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): Build manifest, listing the exported notebooks
+        report (dict): Build report, updated with the payload of each page
+        config (dict): The build configuration from pyproject.toml
+
+    Returns:
+        bool: True if every page is within its budget
+    """
+    within_budget = True
+    downloads: dict = {}
+    # Sizes cached by earlier versions of the build, as bare numbers, are looked up again
+    manifest["package_sizes"] = {
+        key: value for key, value in manifest.get("package_sizes", {}).items() if isinstance(value, dict)
+    }
+    for path, entry in sorted(manifest["notebooks"].items()):
+        notebook_path = Path(path)
+        metadata = _script_metadata_toml(notebook_path.read_text(encoding="utf-8"))
+        budget = (
+            metadata.get("tool", {}).get("marimo-build", {}).get("budget")
+            or config.get("budgets", {}).get(path)
+            or config.get("budget")
+        )
+        breakdown = _page_breakdown(notebook_path, output_dir, config, manifest, downloads)
+        unknown = [requirement for requirement, size in breakdown["packages"].items() if size is None]
+        if unknown:
+            logger.warning(
+                f"Unknown download size of {', '.join(unknown)} in {path}, so its total is too low. "
+                "Set the size in [tool.marimo-build.package-sizes] in pyproject.toml."
+            )
+        total = (
+            breakdown["html"]
+            + sum(breakdown["assets"].values())
+            + sum(size or 0 for size in breakdown["packages"].values())
+        )
+        report["notebooks"].setdefault(path, {})["payload_bytes"] = total
+        if budget is None:
+            continue
+
+        limit = _parse_size(budget)
+        report["notebooks"][path]["budget_bytes"] = limit
+        if total <= limit:
+            logger.debug(f"{path} downloads {total / 1e6:.1f} MB, within its budget of {limit / 1e6:.1f} MB")
+            continue
+
+        within_budget = False
+        lines = [f"  {entry['html_path']}: {breakdown['html'] / 1e6:.2f} MB"]
+        lines += [f"  {asset}: {size / 1e6:.2f} MB" for asset, size in breakdown["assets"].items()]
+        lines += [
+            f"  {requirement}: " + (f"{size / 1e6:.2f} MB" if size is not None else "unknown size")
+            for requirement, size in breakdown["packages"].items()
+        ]
+        logger.error(
+            f"{path} downloads {total / 1e6:.1f} MB, over its budget of {limit / 1e6:.1f} MB:\n" + "\n".join(lines)
+        )
+    return within_budget
+
+
+def _notebook_files(folder: Path) -> List[Path]:
+    """Find the notebooks in a folder and its subfolders.
+
+    Python files in public/ folders are not notebooks, but files the notebooks load (such as
+    notebooks/public/dataloader.py), and are exported with the rest of public/.
+
+    Args:
+        folder (Path): The folder, e.g. notebooks/
+
+    Returns:
+        List[Path]: The notebooks, sorted to get a deterministic order
+    """
+    return sorted(path for path in folder.rglob("*.py") if "public" not in path.relative_to(folder).parts[:-1])
+
+
+def _display_data(notebook_path: Path) -> dict:
+    """Get the data used by the index template for a notebook.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        dict: Dictionary with "display_name" and "html_path" for the notebook
+    """
+    return {
+        "display_name": (notebook_path.stem.replace("_", " ").title()),
+        "html_path": str(notebook_path.with_suffix(".html")),
+    }
+
+
+def _pyodide_version(assets_dir: Path) -> str | None:
+    """Find the pyodide version the marimo frontend in an export loads.
+
+    The version is a constant in the bundled web worker, which builds the CDN URL from it.
+
+    Args:
+        assets_dir (Path): The assets/ folder of an export
+
+    Returns:
+        str | None: The version, e.g. "0.27.5", or None if it can't be found
+    """
+    for worker in sorted(assets_dir.glob("worker-*.js")):
+        source = worker.read_text(encoding="utf-8", errors="replace")
+        match = re.search(r"`v\$\{([\w$]+)\}`", source)
+        if match:
+            version = re.search(rf"(?<![\w$]){re.escape(match.group(1))}=\"(\d+\.\d+\.\d+)\"", source)
+            if version:
+                return version.group(1)
+    return None
+
+
+def _page_lock_url(output_dir: Path, html_path: str) -> str | None:
+    """Get the URL of the pyodide lock file an exported page loads.
 
     Args:
-        notebook_path (Path): Path to the marimo notebook (.py file) to export
-        output_dir (Path): Directory where the exported HTML file will be saved
-        as_app (bool, optional): Whether to export as an app (run mode) or notebook (edit mode).
-                                Defaults to False.
+        output_dir (Path): Directory where the exported files are saved
+        html_path (str): Path of the exported page, relative to the output directory
 
     Returns:
-        bool: True if export succeeded, False otherwise
+        str | None: The URL, for the marimo and pyodide versions of the page, or None if they can't be found
     """
-    # Convert .py extension to .html for the output file
-    output_path: Path = notebook_path.with_suffix(".html")
+    page = output_dir / html_path
+    pyodide_version = _pyodide_version(page.parent / "assets")
+    if pyodide_version is None:
+        return None
+    marimo_version = re.search(
+        r"<marimo-version data-version=['\"]([\w.+-]+)['\"]", page.read_text(encoding="utf-8", errors="replace")
+    )
+    if marimo_version is None:
+        return None
+    return PYODIDE_LOCK_URL.format(marimo_version=marimo_version.group(1), pyodide_version=pyodide_version)
 
-    # Base command for marimo export
-    cmd: List[str] = ["uvx", "marimo", "export", "html-wasm", "--sandbox"]
 
-    # Configure export mode based on whether it's an app or a notebook
-    if as_app:
-        logger.info(f"Exporting {notebook_path} to {output_path} as app")
-        cmd.extend(["--mode", "run", "--no-show-code"])  # Apps run in "run" mode with hidden code
-    else:
-        logger.info(f"Exporting {notebook_path} to {output_path} as notebook")
-        cmd.extend(["--mode", "edit"])  # Notebooks run in "edit" mode
+def _page_resources(output_dir: Path, html_path: str, manifest: dict) -> Tuple[List[dict], List[dict]]:
+    """Work out what a browser downloads when it opens an exported page, for resource hints in the index.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        html_path (str): Path of the exported page, relative to the output directory
+        manifest (dict): Build manifest, with the "columnar" and "partitions" sections
+
+    Returns:
+        Tuple[List[dict], List[dict]]: The runtime resources shared by pages (the marimo frontend
+        bundle and the pyodide runtime), and the resources of this page (the page itself, the pyodide
+        lock file and its data). Each resource has an "href" relative to the index, an "as" destination
+        and a "crossorigin" flag, and runtime resources also have a "rel".
+    """
+    page = output_dir / html_path
+    source = page.read_text(encoding="utf-8", errors="replace")
+    base = posixpath.dirname(html_path)
+    runtime = []
+    for tag, attrs in re.findall(r"<(script|link)\b([^>]*)>", source):
+        attributes = dict(re.findall(r"([\w-]+)=[\"']([^\"']*)[\"']", attrs))
+        href = attributes.get("src" if tag == "script" else "href", "")
+        if not href.startswith("./assets/"):
+            continue
+        if tag == "script":
+            destination = "script"
+        elif attributes.get("rel") == "stylesheet":
+            destination = "style"
+        elif attributes.get("rel") == "preload":
+            destination = attributes.get("as", "fetch")
+        else:
+            continue
+        runtime.append({
+            "rel": "prefetch",
+            "href": posixpath.normpath(posixpath.join(base, href)),
+            "as": destination,
+            # Module scripts and fonts are fetched in CORS mode, and the hint has to match to be reused
+            "crossorigin": re.search(r"\bcrossorigin\b", attrs) is not None,
+        })
+
+    resources = [{"href": html_path, "as": "document", "crossorigin": False}]
+    pyodide_version = _pyodide_version(page.parent / "assets")
+    if pyodide_version is not None:
+        cdn_url = PYODIDE_CDN_URL.format(version=pyodide_version)
+        runtime.append({"rel": "preconnect", "href": "https://cdn.jsdelivr.net", "as": None, "crossorigin": True})
+        runtime += [
+            {"rel": "prefetch", "href": cdn_url + name, "as": "fetch", "crossorigin": True}
+            for name in PYODIDE_RUNTIME_FILES
+        ]
+
+    # The lock file precomputed for the notebook, which the service worker answers the page's request with
+    lock = manifest.get("notebooks", {}).get(str(Path(html_path).with_suffix(".py")), {}).get("lock")
+    lock_url = _page_lock_url(output_dir, html_path)
+    if lock is not None:
+        resources.append({"href": lock, "as": "fetch", "crossorigin": False})
+    elif lock_url is not None:
+        resources.append({"href": lock_url, "as": "fetch", "crossorigin": True})
+
+    # The data the notebook loads: the Parquet copy of a CSV file, and the manifest of a partitioned file
+    columnar = manifest.get("columnar", {})
+    partitions = manifest.get("partitions", {})
+    for path in _referenced_assets(Path(html_path).with_suffix(".py")):
+        if str(path) in partitions:
+            path = path.with_suffix("") / PARTITION_MANIFEST_FILE
+        elif str(path) in columnar:
+            path = Path(columnar[str(path)]["parquet"])
+        if (output_dir / path).is_file() and (output_dir / path).stat().st_size <= PREFETCH_MAX_BYTES:
+            resources.append({"href": path.as_posix(), "as": "fetch", "crossorigin": False})
+    return runtime, resources
+
+
+def _wheel_info(path: Path) -> Tuple[str, str, bool] | None:
+    """Get the package name and version of a wheel from its file name.
+
+    Args:
+        path (Path): Path to the wheel, e.g. "polars-1.18.0-cp312-cp312-pyodide_2024_0_wasm32.whl"
+
+    Returns:
+        Tuple[str, str, bool] | None: The normalized package name, the version, and whether pyodide
+        can install the wheel (pure Python, or built for pyodide), or None if the name is not valid
+    """
+    parts = path.stem.split("-")
+    if len(parts) < 5:
+        return None
+    platform = parts[-1]
+    return re.sub(r"[-_.]+", "-", parts[0]).lower(), parts[1], platform == "any" or "pyodide" in platform or "emscripten" in platform
+
 
+def _wheel_requirements(path: Path) -> List[str]:
+    """Get the requirements of a wheel from its metadata, leaving out those of extras.
+
+    Args:
+        path (Path): Path to the wheel
+
+    Returns:
+        List[str]: The Requires-Dist entries
+    """
+    with zipfile.ZipFile(path) as wheel:
+        metadata_file = next((name for name in wheel.namelist() if name.endswith(".dist-info/METADATA")), None)
+        if metadata_file is None:
+            return []
+        metadata = email.parser.Parser().parsestr(wheel.read(metadata_file).decode("utf-8", errors="replace"))
+    return [requirement for requirement in metadata.get_all("Requires-Dist") or [] if "extra" not in requirement.partition(";")[2]]
+
+
+def _mirror_wheels(output_dir: Path, wheel_dir: Path, manifest: dict) -> None:
+    """Copy the wheels the exported notebooks need from a local directory into the output directory.
+
+    The packages in the PEP 723 header of each notebook, and the packages they require, are
+    looked up in the wheel directory (e.g. filled from the pyodide distribution and PyPI).
+    Wheels pyodide can't install are ignored. A pinned version only matches that version, and
+    otherwise every version in the directory is mirrored, as the lock file of the page decides
+    which one it loads.
+    Each wheel is stored once in the WHEELS_DIR folder, however many notebooks use it, and
+    wheels no longer needed are removed. The pages load the mirrored wheels through the service
+    worker, which answers their requests to the CDN and PyPI with these files.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        wheel_dir (Path): Directory with the wheels to mirror
+        manifest (dict): Build manifest, updated with a "wheels" section
+    """
+    available: dict = {}
+    for path in sorted(wheel_dir.glob("*.whl")):
+        info = _wheel_info(path)
+        if info is not None and info[2]:
+            available.setdefault(info[0], []).append((info[1], path))
+
+    wheels: dict = {}
+    requirements: dict = {}
+    missing = set()
+    for notebook_path in sorted(manifest["notebooks"]):
+        if not Path(notebook_path).exists():
+            continue
+        metadata = _script_metadata_toml(Path(notebook_path).read_text(encoding="utf-8"))
+        pending = [_parse_requirement(requirement) for requirement in metadata.get("dependencies", [])]
+        seen = set()
+        while pending:
+            name, version = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            candidates = [path for wheel_version, path in available.get(name, []) if version in (None, wheel_version)]
+            if not candidates:
+                missing.add(f"{name}=={version}" if version else name)
+            for path in candidates:
+                wheels.setdefault(path.name, {"path": path, "notebooks": set()})["notebooks"].add(notebook_path)
+                if path not in requirements:
+                    requirements[path] = _wheel_requirements(path)
+                pending.extend(_parse_requirement(requirement) for requirement in requirements[path])
+
+    target_dir = output_dir / WHEELS_DIR
+    if wheels:
+        target_dir.mkdir(parents=True, exist_ok=True)
+    for name, wheel in wheels.items():
+        target = target_dir / name
+        if not target.exists() or target.stat().st_size != wheel["path"].stat().st_size:
+            shutil.copy2(wheel["path"], target)
+    if target_dir.exists():
+        for path in target_dir.iterdir():
+            # Precompressed sidecars go together with their wheel
+            if (path.stem if path.suffix in SIDECAR_SUFFIXES else path.name) not in wheels:
+                path.unlink()
+
+    manifest["wheels"] = {
+        name: {"size": wheel["path"].stat().st_size, "notebooks": sorted(wheel["notebooks"])}
+        for name, wheel in sorted(wheels.items())
+    }
+    if missing:
+        logger.info(f"No wheels in {wheel_dir} for {', '.join(sorted(missing))}, the pages load them from the CDN or PyPI")
+    total = sum(wheel["size"] for wheel in manifest["wheels"].values())
+    saved = sum(wheel["size"] * (len(wheel["notebooks"]) - 1) for wheel in manifest["wheels"].values())
+    logger.info(
+        f"Mirrored {len(wheels)} wheels ({total / 1e6:.1f} MB) into {target_dir}, "
+        f"saving {saved / 1e6:.1f} MB by storing the wheels shared by notebooks once"
+    )
+
+
+def _lock_marker_environment(info: dict) -> dict:
+    """Get the values of the environment markers in the pyodide runtime a lock file is for.
+
+    Args:
+        info (dict): The "info" of the lock file, e.g. {"platform": "emscripten_3_1_58", "python": "3.12.7", ...}
+
+    Returns:
+        dict: The marker values, without "extra"
+
+    Raises:
+        ValueError: If the lock file doesn't tell the Python or Emscripten version
+    """
     try:
-        # Create full output path and ensure directory exists
-        output_file: Path = output_dir / notebook_path.with_suffix(".html")
-        output_file.parent.mkdir(parents=True, exist_ok=True)
+        python = info["python"]
+        emscripten = info["platform"].removeprefix("emscripten_").replace("_", ".")
+    except (KeyError, AttributeError) as e:
+        raise ValueError(f"The lock file has no Python or Emscripten version: {e}") from e
+    return {
+        **PYODIDE_MARKERS, "python_version": ".".join(python.split(".")[:2]), "python_full_version": python,
+        "implementation_version": python, "platform_release": emscripten,
+    }
 
-        # Add notebook path and output file to command
-        cmd.extend([str(notebook_path), "-o", str(output_file)])
 
-        # Run marimo export command
-        logger.debug(f"Running command: {cmd}")
-        subprocess.run(cmd, capture_output=True, text=True, check=True)
-        logger.info(f"Successfully exported {notebook_path}")
-        return True
-    except subprocess.CalledProcessError as e:
-        # Handle marimo export errors
-        logger.error(f"Error exporting {notebook_path}:")
-        logger.error(f"Command output: {e.stderr}")
-        return False
-    except Exception as e:
-        # Handle unexpected errors
-        logger.error(f"Unexpected error exporting {notebook_path}: {e}")
-        return False
+def _is_pure_python_wheel(filename: str) -> bool:
+    """Check whether a wheel is pure Python 3, from the tags in its file name.
+
+    Args:
+        filename (str): File name of the wheel, e.g. "altair-4.2.0-py3-none-any.whl"
+
+    Returns:
+        bool: Whether the wheel installs on any Python 3 platform, pyodide included
+    """
+    tags = filename.removesuffix(".whl").split("-")
+    return (
+        filename.endswith(".whl") and len(tags) >= 5 and tags[-2:] == ["none", "any"]
+        and any(tag.startswith("py3") for tag in tags[-3].split("."))
+    )
+
+
+def _wheel_contents(data: bytes) -> Tuple[List[str], List[str]]:
+    """Get the requirements and the top-level import names of a wheel.
+
+    The import names are read from top_level.txt, or else from the files the wheel installs.
+
+    Args:
+        data (bytes): The wheel
+
+    Returns:
+        Tuple[List[str], List[str]]: The Requires-Dist entries, extras included, and the import names
+
+    Raises:
+        ValueError: If the wheel has no metadata
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as wheel:
+        names = wheel.namelist()
+        dist_info = next((name.split("/")[0] for name in names if re.fullmatch(r"[^/]+\.dist-info/METADATA", name)), None)
+        if dist_info is None:
+            raise ValueError("The wheel has no METADATA")
+        metadata = email.parser.Parser().parsestr(wheel.read(f"{dist_info}/METADATA").decode("utf-8", errors="replace"))
+        if f"{dist_info}/top_level.txt" in names:
+            imports = wheel.read(f"{dist_info}/top_level.txt").decode("utf-8").split()
+        else:
+            imports = [
+                name.split("/")[0].removesuffix(".py") for name in names
+                if name.endswith(".py") and not name.split("/")[0].endswith((".dist-info", ".data"))
+            ]
+    return metadata.get_all("Requires-Dist") or [], sorted(set(imports))
+
+
+def _pypi_release(name: str, specifier: SpecifierSet, projects: dict) -> Tuple[dict | None, int]:
+    """Find the release of a package on PyPI that micropip would install, and download its wheel.
+
+    This is the newest version that satisfies the specifier and has a pure Python wheel that is
+    not yanked. The wheel is checked against its sha256, and its requirements and import names
+    are read from it.
+
+    Args:
+        name (str): Normalized package name
+        specifier (SpecifierSet): Version specifier, e.g. ">=3.0" (empty for any version)
+        projects (dict): Metadata of the projects looked up on PyPI so far, by name
+
+    Returns:
+        Tuple[dict | None, int]: The release (the project "name", "version", the "url" and "sha256"
+        of the wheel, its "requires_dist" and "imports"), or None if there is none, and the number of
+        metadata requests made to the PyPI JSON API. The download of the wheel is not counted, as
+        the page downloads it either way.
+
+    Raises:
+        ValueError: If the newest matching version is a pre-release, or the wheel doesn't match its sha256
+    """
+    requests = 0
+    if name not in projects:
+        with urllib.request.urlopen(PYPI_JSON_URL.format(name=name), timeout=10) as response:
+            projects[name] = json.load(response)
+        requests += 1
+    project = projects[name]
+
+    candidates = {}
+    for version, files in project["releases"].items():
+        try:
+            parsed = Version(version)
+        except InvalidVersion:
+            continue
+        wheels = [file for file in files if not file.get("yanked") and _is_pure_python_wheel(file["filename"])]
+        if wheels:
+            candidates[parsed] = (version, wheels[0])
+    matching = list(specifier.filter(candidates))
+    if not matching:
+        return None, requests
+    newest = max(matching)
+    if newest.is_prerelease:
+        # Only installed when nothing else matches, which micropip may not do the same way
+        raise ValueError(f"Only the pre-release {newest} of {name} matches {specifier}")
+    version, wheel = candidates[newest]
+
+    # Mirrors of PyPI may give the URL relative to the API
+    url = urllib.parse.urljoin(PYPI_JSON_URL.format(name=name), wheel["url"])
+    with urllib.request.urlopen(url, timeout=30) as response:
+        data = response.read()
+    if hashlib.sha256(data).hexdigest() != wheel["digests"]["sha256"]:
+        raise ValueError(f"{wheel['filename']} doesn't match its sha256 on PyPI")
+    requires_dist, imports = _wheel_contents(data)
+    return {
+        "name": project["info"]["name"], "version": version, "url": url, "sha256": wheel["digests"]["sha256"],
+        "requires_dist": requires_dist, "imports": imports,
+    }, requests
+
+
+def _resolve_lock(dependencies: List[str], base_packages: dict, environment: dict) -> Tuple[dict, int]:
+    """Resolve the packages micropip would install for a notebook into entries for a pyodide lock file.
+
+    This is the work micropip does in the browser: the dependencies that are not in the lock
+    file of the page already are looked up on PyPI, together with their requirements (and those
+    of the extras asked for), taking the newest version that pyodide can install. Like micropip,
+    the first version picked for a package is kept. The resolution has to be exact, as pyodide
+    trusts the lock file, so it fails instead of guessing: when a later requirement doesn't
+    allow the version picked (which would need backtracking), a marker can't be evaluated, a
+    package has no pure Python wheel, or a requirement conflicts with the lock file of the page.
+
+    Args:
+        dependencies (List[str]): Requirements from the PEP 723 header of the notebook
+        base_packages (dict): The "packages" of the lock file the page loads
+        environment (dict): Values of the environment markers in pyodide (see _lock_marker_environment())
+
+    Returns:
+        Tuple[dict, int]: Lock entries for the resolved packages, by name, and the number of
+        metadata requests made to PyPI (see _pypi_release())
+
+    Raises:
+        ValueError: If the packages can't be resolved exactly
+        OSError: If PyPI can't be reached
+    """
+    base = {canonicalize_name(key): (key, package) for key, package in base_packages.items()}
+    projects: dict = {}
+    resolved: dict = {}
+    requirements: dict = {}
+    extras: dict = {}
+    depends: dict = {}
+    requests = 0
+    pending = [(Requirement(requirement), "the notebook") for requirement in dependencies]
+    while pending:
+        requirement, parent = pending.pop(0)
+        name = canonicalize_name(requirement.name)
+        if requirement.url:
+            raise ValueError(f"{requirement} (from {parent}) is not on PyPI")
+        if name in base:
+            version = base[name][1]["version"]
+            if not requirement.specifier.contains(version, prereleases=True):
+                raise ValueError(f"{requirement} (from {parent}) conflicts with {name} {version} in the lock file")
+            if requirement.extras:
+                raise ValueError(f"The extras of {requirement} (from {parent}) are not in the lock file")
+            continue
+        if name in resolved:
+            version = resolved[name]["version"]
+            if not requirement.specifier.contains(version, prereleases=True):
+                raise ValueError(f"{requirement} (from {parent}) conflicts with {name} {version}, picked earlier")
+        else:
+            release, count = _pypi_release(name, requirement.specifier, projects)
+            requests += count
+            if release is None:
+                raise ValueError(f"No pure Python wheel on PyPI for {requirement} (from {parent})")
+            resolved[name] = {
+                "name": release["name"], "version": release["version"], "file_name": release["url"],
+                "install_dir": "site", "sha256": release["sha256"], "package_type": "package",
+                "imports": release["imports"], "depends": [], "unvendored_tests": False, "shared_library": False,
+            }
+            requirements[name] = [Requirement(dependency) for dependency in release["requires_dist"]]
+            extras[name], depends[name] = set(), set()
+
+        # The requirements of the package, and of each extra asked for the first time
+        for extra in sorted({"", *(canonicalize_name(extra) for extra in requirement.extras)} - extras[name]):
+            extras[name].add(extra)
+            for dependency in requirements[name]:
+                if dependency.marker is None:
+                    applies = not extra
+                else:
+                    try:
+                        applies = dependency.marker.evaluate({**environment, "extra": extra})
+                    except ValueError as e:
+                        raise ValueError(f"Can't evaluate the marker of {dependency} (from {name}): {e}") from e
+                if applies:
+                    depends[name].add(canonicalize_name(dependency.name))
+                    pending.append((dependency, f"{name} {resolved[name]['version']}"))
+
+    for name, entry in resolved.items():
+        entry["depends"] = sorted(base[dependency][0] if dependency in base else dependency for dependency in depends[name])
+    return resolved, requests
+
+
+def _precompute_locks(output_dir: Path, manifest: dict, report: dict) -> None:
+    """Resolve the dependencies of every notebook at build time, into a pyodide lock file for its page.
+
+    When a notebook needs packages that are not in the pyodide lock file of marimo, the page
+    installs them with micropip, which looks them up on PyPI and solves their requirements
+    in the browser on every visit. Instead, the build resolves them once per dependency set
+    (see _resolve_lock()) and writes a lock file with the packages of the marimo lock file
+    and the resolved ones, which pyodide loads directly. The lock files are named by their
+    content hash and stored in the LOCKS_DIR folder, and the service worker answers the
+    request of a page for the marimo lock file with its own. A notebook whose packages can't
+    be resolved exactly gets no lock file, and its page installs them with micropip as before.
+
+    The resolutions are kept in the manifest, so they are only done again when a dependency
+    set changes. Each lock file is reported with the number of PyPI metadata requests micropip
+    no longer makes for the page, and with the time the resolution took at build time.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): Build manifest, whose "locks" section keeps the resolutions, and whose
+                         notebook entries get the "lock" of their page
+        report (dict): Build report, updated with a "locks" section
+    """
+    cache = manifest.get("locks", {})
+    locks: dict = {}
+    base_locks: dict = {}
+    for notebook_path, entry in sorted(manifest["notebooks"].items()):
+        entry.pop("lock", None)
+        lock_url = _page_lock_url(output_dir, entry["html_path"]) if (output_dir / entry["html_path"]).is_file() else None
+        metadata = _script_metadata_toml(Path(notebook_path).read_text(encoding="utf-8"))
+        dependencies = sorted(
+            requirement for requirement in metadata.get("dependencies", []) if _parse_requirement(requirement)[0] != "marimo"
+        )
+        if lock_url is None or not dependencies:
+            continue
+        key = hashlib.sha256(json.dumps([lock_url, dependencies]).encode()).hexdigest()[:16]
+
+        if key not in locks:
+            cached = cache.get(key)
+            if cached is not None and (cached["path"] is None or (output_dir / cached["path"]).is_file()):
+                locks[key] = cached
+            else:
+                if lock_url not in base_locks:
+                    try:
+                        with urllib.request.urlopen(lock_url, timeout=30) as response:
+                            base_locks[lock_url] = json.load(response)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Could not download {lock_url}, the pages will solve their dependencies themselves: {e}")
+                        base_locks[lock_url] = None
+                base = base_locks[lock_url]
+                if base is None:
+                    continue
+                start = time.perf_counter()
+                try:
+                    resolved, requests = _resolve_lock(
+                        dependencies, base["packages"], _lock_marker_environment(base.get("info", {}))
+                    )
+                except ValueError as e:
+                    # Kept in the manifest, so it is only tried again when the dependencies change
+                    logger.warning(f"No lock file for {notebook_path}, the page installs its packages with micropip: {e}")
+                    locks[key] = {"path": None, "packages": {}, "error": str(e)}
+                    continue
+                except OSError as e:
+                    logger.warning(f"Could not reach PyPI for {notebook_path}, the page installs its packages with micropip: {e}")
+                    continue
+                resolve_time = time.perf_counter() - start
+                path = None
+                if resolved:
+                    content = json.dumps({**base, "packages": {**resolved, **base["packages"]}}, separators=(",", ":"))
+                    path = f"{LOCKS_DIR}/{hashlib.sha256(content.encode()).hexdigest()[:16]}.json"
+                    (output_dir / LOCKS_DIR).mkdir(parents=True, exist_ok=True)
+                    (output_dir / path).write_text(content, encoding="utf-8")
+                locks[key] = {
+                    "path": path, "packages": {package["name"]: package["version"] for package in resolved.values()},
+                    "metadata_requests": requests, "resolve_s": round(resolve_time, 3),
+                }
+        if key in locks and locks[key]["path"] is not None:
+            entry["lock"] = locks[key]["path"]
+            report.setdefault("locks", {})[notebook_path] = {
+                "lock": locks[key]["path"], "packages": locks[key]["packages"],
+                "metadata_requests": locks[key]["metadata_requests"], "resolve_s": locks[key]["resolve_s"],
+            }
+
+    # Remove the lock files of earlier builds, with their precompressed sidecars
+    used = {lock["path"] for lock in locks.values() if lock["path"] is not None}
+    if (output_dir / LOCKS_DIR).exists():
+        for path in (output_dir / LOCKS_DIR).iterdir():
+            if f"{LOCKS_DIR}/{path.stem if path.suffix in SIDECAR_SUFFIXES else path.name}" not in used:
+                path.unlink()
+    manifest["locks"] = locks
+
+    saved = report.get("locks", {})
+    if saved:
+        logger.info(
+            f"Precomputed {len(used)} pyodide lock file(s) for {len(saved)} notebook(s):\n" + "\n".join(
+                f"  {path}: {len(stats['packages'])} packages from PyPI, saving {stats['metadata_requests']} "
+                f"metadata requests (resolved in {stats['resolve_s']:.1f}s at build time)"
+                for path, stats in sorted(saved.items())
+            )
+        )
+
+
+def _write_service_worker(output_dir: Path, manifest: dict) -> None:
+    """Write the service worker that caches the runtime and data of the site in the browser.
+
+    The service worker gets the content hash of every runtime file the pages load (see
+    _page_resources()) and of every file in the exported public/ folders, so a new deploy only
+    evicts and downloads the files that changed. Files in the assets/ folders of the exports and
+    in the pyodide CDN folder have content hashes or versions in their URL, and are cached as
+    they are loaded. See SERVICE_WORKER_SCRIPT.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        manifest (dict): Build manifest, with the "notebooks" section
+    """
+    runtime: dict = {}
+    immutable: set = set()
+    for entry in manifest["notebooks"].values():
+        html_path = entry["html_path"]
+        if not (output_dir / html_path).is_file():
+            continue
+        page_runtime, _ = _page_resources(output_dir, html_path, manifest)
+        immutable.add(posixpath.join(posixpath.dirname(html_path), "assets") + "/")
+        for resource in page_runtime:
+            if resource["rel"] != "prefetch":
+                continue
+            if resource["href"].startswith("https://"):
+                # Versioned CDN URLs, whose content never changes
+                runtime[resource["href"]] = resource["href"]
+                immutable.add(posixpath.dirname(resource["href"]) + "/")
+            else:
+                runtime[resource["href"]] = _file_digest(output_dir / resource["href"])[:16]
+
+    # Wheels that micropip installs from PyPI have content-addressed URLs too, and so do the
+    # mirrored wheels, whose file names include their version
+    immutable.add("https://files.pythonhosted.org/packages/")
+    wheels = {name: f"{WHEELS_DIR}/{name}" for name in manifest.get("wheels", {})}
+    if wheels:
+        immutable.add(f"{WHEELS_DIR}/")
 
+    # The lock files are named by their content hash
+    locks = {
+        entry["html_path"]: entry["lock"] for entry in manifest["notebooks"].values()
+        if "lock" in entry and (output_dir / entry["lock"]).is_file()
+    }
+    if locks:
+        immutable.add(f"{LOCKS_DIR}/")
 
-def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[dict] | None = None, apps_data: List[dict] | None = None) -> None:
+    data = {
+        path.relative_to(output_dir).as_posix(): _file_digest(path)[:16]
+        for public_dir in output_dir.rglob("public") if public_dir.is_dir()
+        for path in public_dir.rglob("*") if path.is_file() and path.suffix not in SIDECAR_SUFFIXES
+    }
+
+    build = {
+        "runtime": dict(sorted(runtime.items())), "data": dict(sorted(data.items())), "immutable": sorted(immutable),
+        "wheels": wheels, "locks": dict(sorted(locks.items())),
+    }
+    script = SERVICE_WORKER_SCRIPT.replace("__BUILD__", json.dumps(build, indent=2))
+    (output_dir / SERVICE_WORKER_FILE).write_text(script, encoding="utf-8")
+    logger.info(
+        f"Wrote {SERVICE_WORKER_FILE}, caching {len(runtime)} runtime files and {len(data)} data files"
+        + (f", loading {len(wheels)} mirrored wheels" if wheels else "")
+        + (f", and answering {len(locks)} pages with their precomputed lock file" if locks else "")
+    )
+
+
+def _generate_index(
+    output_dir: Path,
+    template_file: Path,
+    notebooks_data: List[dict] | None = None,
+    apps_data: List[dict] | None = None,
+    manifest: dict | None = None,
+    service_worker: bool = False,
+) -> None:
     """Generate an index.html file that lists all the notebooks.
 
     This function creates an HTML index page that displays links to all the exported
     notebooks. The index page includes the marimo logo and displays each notebook
-    with a formatted title and a link to open it.
+    with a formatted title and a link to open it. Each notebook gets the list of resources
+    its page loads ("resources"), and the template gets the runtime resources shared by
+    all pages ("runtime"), so it can add resource hints for them, and the path of the
+    service worker to register ("service_worker", None if there is none).
 
     Args:
         notebooks_data (List[dict]): List of dictionaries with data for notebooks
         apps_data (List[dict]): List of dictionaries with data for apps
         output_dir (Path): Directory where the index.html file will be saved
         template_file (Path, optional): Path to the template file. If None, uses the default template.
+        manifest (dict, optional): Build manifest, used to find the data files of the notebooks
+        service_worker (bool, optional): Whether the index should register the service worker. Defaults to False.
 
     Returns:
         None
@@ -107,6 +3182,18 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
     # Ensure the output directory exists
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    # Collect the resources of every page, and the runtime resources they share. The notebooks/
+    # and apps/ exports have their own copy of the frontend bundle, with the same hashed file
+    # names, and only one copy is worth prefetching.
+    runtime: List[dict] = []
+    for entry in (notebooks_data or []) + (apps_data or []):
+        if not (output_dir / entry["html_path"]).is_file():
+            entry["resources"] = []
+            continue
+        page_runtime, entry["resources"] = _page_resources(output_dir, entry["html_path"], manifest or {})
+        names = {posixpath.basename(resource["href"]) for resource in runtime}
+        runtime += [resource for resource in page_runtime if posixpath.basename(resource["href"]) not in names]
+
     try:
         # Set up Jinja2 environment and load template
         template_dir = template_file.parent
@@ -118,7 +3205,12 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
         template = env.get_template(template_name)
 
         # Render the template with notebook and app data
-        rendered_html = template.render(notebooks=notebooks_data, apps=apps_data)
+        rendered_html = template.render(
+            notebooks=notebooks_data,
+            apps=apps_data,
+            runtime=runtime,
+            service_worker=SERVICE_WORKER_FILE if service_worker else None,
+        )
 
         # Write the rendered HTML to the index.html file
         with open(index_path, "w") as f:
@@ -133,17 +3225,42 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
         logger.error(f"Error rendering template: {e}")
 
 
-def _export(folder: Path, output_dir: Path, as_app: bool=False) -> List[dict]:
+def _export(
+    folder: Path,
+    output_dir: Path,
+    as_app: bool=False,
+    jobs: int = 1,
+    manifest: dict | None = None,
+    marimo_version: str = "unknown",
+    report: dict | None = None,
+    env_root: Path | None = None,
+    backend: str = "subprocess",
+    only: set | None = None,
+    snapshot: bool = False,
+) -> List[dict]:
     """Export all marimo notebooks in a folder to HTML/WebAssembly format.
 
     This function finds all Python files in the specified folder and exports them
     to HTML/WebAssembly format using the export_html_wasm function. It returns a
     list of dictionaries containing the data needed for the template.
 
+    The exports are spread across a pool of `jobs` worker threads. Each worker mostly
+    waits on its `uvx marimo export` subprocess, so threads are sufficient. The returned
+    list keeps the (sorted) order of the notebooks, regardless of which export finishes first.
+
     Args:
         folder (Path): Path to the folder containing marimo notebooks
         output_dir (Path): Directory where the exported HTML files will be saved
         as_app (bool, optional): Whether to export as apps (run mode) or notebooks (edit mode).
+        jobs (int, optional): Number of notebooks to export in parallel. Defaults to 1.
+        manifest (dict, optional): Build manifest used to skip unchanged notebooks.
+        marimo_version (str, optional): Version of marimo, used as part of the cache key.
+        report (dict, optional): Build report that the measurements of each export are added to.
+        env_root (Path, optional): Directory with shared environments, one per dependency set.
+        backend (str, optional): Export backend, "subprocess" or "worker". Defaults to "subprocess".
+        only (set, optional): If given, only the notebooks in this set are exported, e.g. the
+                              notebooks of one shard. Defaults to all notebooks in the folder.
+        snapshot (bool, optional): Whether to embed an output snapshot in the pages. Defaults to False.
 
     Returns:
         List[dict]: List of dictionaries with "display_name" and "html_path" for each notebook
@@ -153,31 +3270,595 @@ def _export(folder: Path, output_dir: Path, as_app: bool=False) -> List[dict]:
         logger.warning(f"Directory not found: {folder}")
         return []
 
-    # Find all Python files recursively in the folder
-    notebooks = list(folder.rglob("*.py"))
-    logger.debug(f"Found {len(notebooks)} Python files in {folder}")
+    # Find all notebooks recursively in the folder, sorted to get a deterministic order
+    notebooks = _notebook_files(folder)
+    logger.debug(f"Found {len(notebooks)} notebooks in {folder}")
 
     # Exit if no notebooks were found
     if not notebooks:
         logger.warning(f"No notebooks found in {folder}!")
         return []
 
-    # For each successfully exported notebook, add its data to the notebook_data list
-    notebook_data = [
-        {
-            "display_name": (nb.stem.replace("_", " ").title()),
-            "html_path": str(nb.with_suffix(".html")),
+    if only is not None:
+        notebooks = [nb for nb in notebooks if nb in only]
+        if not notebooks:
+            logger.info(f"No notebooks from {folder} in this shard")
+            return []
+
+    # Export the notebooks in a worker pool, keeping track of the result of each one by index
+    jobs = max(1, min(jobs, len(notebooks)))
+    logger.info(f"Exporting {len(notebooks)} files from {folder} using {jobs} job(s)")
+    succeeded: List[bool] = [False] * len(notebooks)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                _export_html_wasm,
+                nb,
+                output_dir,
+                as_app=as_app,
+                manifest=manifest,
+                marimo_version=marimo_version,
+                report=report,
+                env_root=env_root,
+                backend=backend,
+                max_workers=jobs,
+                snapshot=snapshot,
+            ): index
+            for index, nb in enumerate(notebooks)
         }
-        for nb in notebooks
-        if _export_html_wasm(nb, output_dir, as_app=as_app)
-    ]
+        for finished, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            succeeded[index] = future.result()
+            logger.info(
+                f"[{finished}/{len(notebooks)}] Finished {notebooks[index]} "
+                f"({'ok' if succeeded[index] else 'failed'}) after {time.perf_counter() - start:.1f}s"
+            )
+
+    # For each successfully exported notebook, add its data to the notebook_data list
+    notebook_data = [_display_data(nb) for nb, ok in zip(notebooks, succeeded) if ok]
 
     logger.info(f"Successfully exported {len(notebook_data)} out of {len(notebooks)} files from {folder}")
     return notebook_data
 
+def _parse_shard(shard: str) -> Tuple[int, int]:
+    """Parse a shard like "2/4" into its number and the number of shards.
+
+    Args:
+        shard (str): The shard, numbered from 1
+
+    Returns:
+        Tuple[int, int]: The shard number and the number of shards
+
+    Raises:
+        ValueError: If the shard can't be parsed, or its number is out of range
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", str(shard))
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError(f"Invalid shard {shard!r}, expected i/N with 1 <= i <= N")
+    return int(match.group(1)), int(match.group(2))
+
+
+def _assign_shards(notebooks: List[Path], durations: dict, count: int) -> List[List[Path]]:
+    """Split notebooks into shards with about the same total export time.
+
+    The notebooks are assigned longest first, each to the shard with the least total time so far
+    (the longest processing time rule). Notebooks without a known duration are assumed to take
+    the average time. The assignment only depends on its inputs, so every runner computes the same one.
+
+    Args:
+        notebooks (List[Path]): The notebooks to split
+        durations (dict): Export time in seconds of previous builds, keyed by notebook path
+        count (int): Number of shards
+
+    Returns:
+        List[List[Path]]: The notebooks of each shard, sorted by path
+    """
+    known = [durations[str(nb)] for nb in notebooks if str(nb) in durations]
+    default = sum(known) / len(known) if known else 1.0
+    shards: List[List[Path]] = [[] for _ in range(count)]
+    loads = [0.0] * count
+    for nb in sorted(notebooks, key=lambda nb: (-durations.get(str(nb), default), str(nb))):
+        shard = min(range(count), key=lambda index: (loads[index], index))
+        shards[shard].append(nb)
+        loads[shard] += durations.get(str(nb), default)
+    return [sorted(shard) for shard in shards]
+
+
+def _build(
+    output_dir: Path,
+    template_file: Path,
+    jobs: int = 1,
+    force: bool = False,
+    compress: bool = True,
+    shared_envs: bool = True,
+    backend: str = "subprocess",
+    optimize_parquet: bool = True,
+    service_worker: bool = True,
+    shard: Tuple[int, int] | None = None,
+    minify: bool = False,
+    validate: str = "warn",
+    snapshot: bool = False,
+    wheel_dir: Path | None = None,
+    precompute_locks: bool = True,
+) -> None:
+    """Export all notebooks and apps and generate the index page.
+
+    With a shard, only the notebooks of that shard are exported (see _assign_shards()), and
+    the steps for the whole site are left to _merge(), which combines the output of all shards.
+
+    Args:
+        output_dir (Path): Directory where the exported files will be saved
+        template_file (Path): Path to the template file for the index page
+        jobs (int, optional): Number of notebooks to export in parallel. Defaults to 1.
+        force (bool, optional): Whether to export unchanged notebooks as well. Defaults to False.
+        compress (bool, optional): Whether to write precompressed .gz and .br sidecars. Defaults to True.
+        shared_envs (bool, optional): Whether to export notebooks with the same dependencies in a
+                                      shared environment, instead of a sandbox each. Defaults to True.
+        backend (str, optional): Export backend, "subprocess" or "worker". Defaults to "subprocess".
+        optimize_parquet (bool, optional): Whether to rewrite the exported public/*.parquet files
+                                           for the browser. Defaults to True.
+        service_worker (bool, optional): Whether to write a service worker that caches the runtime
+                                         and data in the browser, and register it. Defaults to True.
+        shard (Tuple[int, int], optional): The shard to build, as its number (from 1) and the
+                                           number of shards. Defaults to building everything.
+        minify (bool, optional): Whether to minify the exported pages. Defaults to False.
+        validate (str, optional): What to do with notebooks whose dataflow is broken (see
+                                  _notebook_problems()): "error" stops the build before
+                                  exporting anything, "warn" only logs them, and "off" skips
+                                  the check. Defaults to "warn".
+        snapshot (bool, optional): Whether to run every notebook once and embed its outputs in
+                                   the page, to show until the kernel in the browser has run.
+                                   Defaults to False.
+        wheel_dir (Path, optional): Directory with wheels to mirror into the site, see
+                                    _mirror_wheels(). Defaults to None.
+        precompute_locks (bool, optional): Whether to resolve the packages the pages install with
+                                           micropip at build time, see _precompute_locks(). Defaults to True.
+
+    Returns:
+        None
+    """
+    # Make sure the output directory exists
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Load the manifest of the previous build, unless a full rebuild is requested
+    manifest = {"notebooks": {}} if force else _load_manifest(output_dir)
+    marimo_version = _marimo_version()
+    logger.info(f"Using marimo version: {marimo_version}")
+    report: dict = {"marimo_version": marimo_version, "notebooks": {}}
+    config = _load_build_config()
+
+    # Show how many environments the notebooks need, when they share them
+    env_root = ENV_DIR.resolve() if shared_envs else None
+    if env_root is not None:
+        notebooks = [nb for folder, _ in NOTEBOOK_FOLDERS if folder.exists() for nb in _notebook_files(folder)]
+        dependency_sets = {_dependency_set(nb) for nb in notebooks}
+        logger.info(f"{len(notebooks)} notebooks share {len(dependency_sets)} distinct dependency sets")
+
+    # Pick the notebooks of this shard, balanced by how long they took in previous builds
+    only = None
+    if shard is not None:
+        number, count = shard
+        notebooks = [nb for folder, _ in NOTEBOOK_FOLDERS if folder.exists() for nb in _notebook_files(folder)]
+        durations = {
+            path: entry["wall_time_s"] for path, entry in manifest["notebooks"].items() if "wall_time_s" in entry
+        }
+        only = set(_assign_shards(notebooks, durations, count)[number - 1])
+        manifest["shard"] = {"number": number, "count": count, "notebooks": sorted(str(nb) for nb in only)}
+        logger.info(f"Building shard {number}/{count} with {len(only)} of {len(notebooks)} notebooks")
+
+    # Check the dataflow of the notebooks, which takes milliseconds, before spending minutes on exports
+    if validate != "off":
+        notebooks = sorted(only) if only is not None else [
+            nb for folder, _ in NOTEBOOK_FOLDERS if folder.exists() for nb in _notebook_files(folder)
+        ]
+        if _validate_notebooks(notebooks, validate, report) and validate == "error":
+            logger.error("Build failed: fix the notebooks above, or pass --validate warn to export them anyway")
+            sys.exit(1)
+
+    # Export notebooks from the notebooks/ directory, and apps from the apps/ directory
+    try:
+        notebooks_data, apps_data = (
+            _export(
+                folder, output_dir, as_app=as_app, jobs=jobs, manifest=manifest, marimo_version=marimo_version,
+                report=report, env_root=env_root, backend=backend, only=only, snapshot=snapshot,
+            )
+            for folder, as_app in NOTEBOOK_FOLDERS
+        )
+    finally:
+        _close_workers()
+
+    # Strip whitespace, comments and unused settings from the exported pages
+    if minify:
+        _minify_pages(output_dir, manifest, report)
+
+    # Give every exported CSV file a Parquet copy, so notebooks don't have to parse CSV in the browser
+    _convert_csv_assets(output_dir, manifest, report)
+
+    # Rewrite the exported Parquet files in a layout that is cheaper to load in the browser
+    if optimize_parquet:
+        _optimize_assets(output_dir, manifest, report, config, jobs=jobs)
+
+    # Split large datasets into partitions, so notebooks can fetch only the rows they need
+    _partition_assets(output_dir, manifest, report, config)
+
+    # A shard stops here, the rest is done once for the whole site when the shards are merged
+    if shard is not None:
+        _save_manifest(output_dir, manifest)
+        _write_report(output_dir, report)
+        logger.info(f"Shard {shard[0]}/{shard[1]} completed. Output directory: {output_dir}")
+        return
+
+    _finish(
+        output_dir, template_file, manifest, report, config, notebooks_data, apps_data, jobs=jobs,
+        compress=compress, service_worker=service_worker, wheel_dir=wheel_dir, precompute_locks=precompute_locks,
+    )
+
+
+def _finish(
+    output_dir: Path,
+    template_file: Path,
+    manifest: dict,
+    report: dict,
+    config: dict,
+    notebooks_data: List[dict],
+    apps_data: List[dict],
+    jobs: int = 1,
+    compress: bool = True,
+    service_worker: bool = True,
+    wheel_dir: Path | None = None,
+    precompute_locks: bool = True,
+) -> None:
+    """Do the steps of the build that cover the whole site, after the notebooks are exported.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        template_file (Path): Path to the template file for the index page
+        manifest (dict): Build manifest, saved at the end
+        report (dict): Build report, written at the end
+        config (dict): The build configuration from pyproject.toml
+        notebooks_data (List[dict]): Template data of the exported notebooks
+        apps_data (List[dict]): Template data of the exported apps
+        jobs (int, optional): Number of processes to compress files with. Defaults to 1.
+        compress (bool, optional): Whether to write precompressed .gz and .br sidecars. Defaults to True.
+        service_worker (bool, optional): Whether to write and register the service worker. Defaults to True.
+        wheel_dir (Path, optional): Directory with wheels to mirror into the site. Defaults to None.
+        precompute_locks (bool, optional): Whether to precompute the pyodide lock files of the pages. Defaults to True.
+
+    Returns:
+        None
+    """
+    # Drop notebooks that no longer exist from the manifest
+    manifest["notebooks"] = {
+        path: entry for path, entry in manifest["notebooks"].items() if Path(path).exists()
+    }
+
+    # Serve the packages of the notebooks from this site, rather than from the CDN and PyPI
+    if wheel_dir is not None:
+        if not service_worker:
+            logger.warning("The pages load mirrored wheels through the service worker, which is turned off")
+        _mirror_wheels(output_dir, wheel_dir, manifest)
+
+    # Resolve the packages the pages install with micropip once, instead of in the browser on every visit.
+    # The pages get the lock files through the service worker.
+    if precompute_locks and service_worker:
+        _precompute_locks(output_dir, manifest, report)
+
+    # Exit if no notebooks or apps were found
+    if not notebooks_data and not apps_data:
+        logger.warning("No notebooks or apps found!")
+        _save_manifest(output_dir, manifest)
+        return
+
+    # Generate the index.html file that lists all notebooks and apps
+    _generate_index(
+        output_dir=output_dir, notebooks_data=notebooks_data, apps_data=apps_data, template_file=template_file,
+        manifest=manifest, service_worker=service_worker,
+    )
+
+    # Write the service worker that caches the runtime and data between visits
+    if service_worker:
+        _write_service_worker(output_dir, manifest)
+
+    # Write .gz and .br sidecars, so servers can serve the site precompressed. Without them, the
+    # sidecars of an earlier build are deleted, as they would be served for outdated files.
+    if compress:
+        _compress_site(output_dir, manifest, jobs=jobs)
+    else:
+        _remove_sidecars(output_dir, manifest.pop("compressed", {}))
+
+    # Check the download size of every page against its budget
+    within_budget = _check_budgets(output_dir, manifest, report, config)
+
+    # Save the manifest for the next build
+    _save_manifest(output_dir, manifest)
+
+    # Save the measurements of all exports, and show which ones dominate the build
+    _write_report(output_dir, report)
+
+    if not within_budget:
+        logger.error("Build failed: one or more pages are over their size budget")
+        sys.exit(1)
+
+    logger.info(f"Build completed successfully. Output directory: {output_dir}")
+
+
+def _merge(
+    output_dir: Path,
+    shard_dirs: List[Path],
+    template_file: Path,
+    jobs: int = 1,
+    compress: bool = True,
+    service_worker: bool = True,
+    wheel_dir: Path | None = None,
+    precompute_locks: bool = True,
+) -> None:
+    """Combine the output of the shards of a build into one site, and finish the build.
+
+    The files of every shard are copied into the output directory. The page of a notebook, and
+    the public/ folder next to it, are taken from the shard it was assigned to, as the other
+    shards may have an outdated copy from an earlier build. The manifests and reports are
+    combined the same way, and then the steps for the whole site are done, as in a build without
+    shards. The merge fails if a notebook in NOTEBOOK_FOLDERS was not exported by any shard.
+
+    Args:
+        output_dir (Path): Directory to save the combined site in
+        shard_dirs (List[Path]): Output directories of the shards
+        template_file (Path): Path to the template file for the index page
+        jobs (int, optional): Number of processes to compress files with. Defaults to 1.
+        compress (bool, optional): Whether to write precompressed .gz and .br sidecars. Defaults to True.
+        service_worker (bool, optional): Whether to write and register the service worker. Defaults to True.
+        wheel_dir (Path, optional): Directory with wheels to mirror into the site. Defaults to None.
+        precompute_locks (bool, optional): Whether to precompute the pyodide lock files of the pages. Defaults to True.
+
+    Returns:
+        None
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Keep the lock files resolved by earlier merges, they only depend on the dependency sets, and
+    # the sidecars written by them, which are reused or deleted when compressing the merged site
+    previous = _load_manifest(output_dir)
+    manifest: dict = {"notebooks": {}, "locks": previous.get("locks", {}), "compressed": previous.get("compressed", {})}
+    report: dict = {"notebooks": {}}
+    shards = []
+    for shard_dir in shard_dirs:
+        shard_manifest = _load_manifest(shard_dir)
+        if "shard" not in shard_manifest:
+            raise ValueError(f"{shard_dir} is not the output of a shard (build it with --shard)")
+        shards.append((shard_dir, shard_manifest))
+    counts = {shard_manifest["shard"]["count"] for _, shard_manifest in shards}
+    numbers = sorted(shard_manifest["shard"]["number"] for _, shard_manifest in shards)
+    if len(counts) != 1 or numbers != list(range(1, counts.pop() + 1)):
+        raise ValueError(f"Expected the output of every shard exactly once, got shards {numbers}")
+
+    owner = {nb: shard_dir for shard_dir, shard_manifest in shards for nb in shard_manifest["shard"]["notebooks"]}
+    pages = {str(Path(nb).with_suffix(".html")): shard_dir for nb, shard_dir in owner.items()}
+    # The exported public/ folder next to the pages in a folder comes from the first shard that
+    # owns a notebook in that folder
+    folders: dict = {}
+    for nb, shard_dir in owner.items():
+        folders.setdefault(str(Path(nb).parent), shard_dir)
+
+    def _taken_from(rel_path: str, shard_dir: Path) -> bool:
+        """Whether a file (or its manifest entry) of a shard goes into the merged site.
+
+        A page and everything in a public/ folder, including the files derived from it (CSV
+        conversions, optimized Parquet files and partitions), are taken from the shard that owns
+        the notebooks, as the other shards may have a stale copy from an earlier build. Other
+        files are the same in every shard.
+        """
+        if rel_path in pages:
+            return pages[rel_path] == shard_dir
+        parts = Path(rel_path).parts
+        if "public" in parts[:-1]:
+            return folders.get(str(Path(*parts[:parts.index("public")]))) == shard_dir
+        return True
+
+    skip_names = {MANIFEST_FILE, REPORT_FILE, PROFILE_FILE, "index.html", SERVICE_WORKER_FILE}
+    for shard_dir, shard_manifest in shards:
+        for path in sorted(shard_dir.rglob("*")):
+            rel_path = str(path.relative_to(shard_dir))
+            if (
+                not path.is_file() or path.suffix in SIDECAR_SUFFIXES or rel_path in skip_names
+                or not _taken_from(rel_path, shard_dir)
+            ):
+                continue
+            target = output_dir / rel_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path, target)
+
+        shard_report = json.loads((shard_dir / REPORT_FILE).read_text()) if (shard_dir / REPORT_FILE).exists() else {}
+        own = set(shard_manifest["shard"]["notebooks"])
+        manifest["notebooks"].update({path: entry for path, entry in shard_manifest["notebooks"].items() if path in own})
+        report["notebooks"].update({path: stats for path, stats in shard_report.get("notebooks", {}).items() if path in own})
+        report.setdefault("marimo_version", shard_report.get("marimo_version", "unknown"))
+        manifest.setdefault("package_sizes", {}).update(shard_manifest.get("package_sizes", {}))
+        for section in ("asset_digests", "columnar", "minified", "parquet", "partitions"):
+            manifest.setdefault(section, {}).update(
+                {path: entry for path, entry in shard_manifest.get(section, {}).items() if _taken_from(path, shard_dir)}
+            )
+        for section in ("columnar", "minified", "parquet", "partitions"):
+            report.setdefault(section, {}).update(
+                {path: stats for path, stats in shard_report.get(section, {}).items() if _taken_from(path, shard_dir)}
+            )
+    logger.info(f"Merged {len(shards)} shards with {len(manifest['notebooks'])} exported notebooks into {output_dir}")
+
+    # Every notebook in the repository has to be in the site, whether a shard skipped it (the
+    # shards split the notebooks differently) or failed to export it
+    discovered = {str(nb) for folder, _ in NOTEBOOK_FOLDERS if folder.exists() for nb in _notebook_files(folder)}
+    missing = sorted(discovered - set(manifest["notebooks"]))
+    if missing:
+        problems = [f"  {nb}: " + (f"failed in {owner[nb]}" if nb in owner else "not built by any shard") for nb in missing]
+        raise ValueError(f"{len(missing)} of {len(discovered)} notebooks are missing from the shards:\n" + "\n".join(problems))
+
+    entries = sorted(manifest["notebooks"].items())
+    _finish(
+        output_dir, template_file, manifest, report, _load_build_config(),
+        notebooks_data=[_display_data(Path(path)) for path, entry in entries if not entry["as_app"]],
+        apps_data=[_display_data(Path(path)) for path, entry in entries if entry["as_app"]],
+        jobs=jobs, compress=compress, service_worker=service_worker, wheel_dir=wheel_dir,
+        precompute_locks=precompute_locks,
+    )
+
+
+def _affected_notebooks(changed: set, template_file: Path, manifest: dict) -> Tuple[List[Tuple[Path, bool]], bool]:
+    """Work out what has to be rebuilt after some files changed.
+
+    A notebook has to be exported again if its source changed, or if a public/ asset it refers
+    to changed. The index has to be generated again if the template changed, or if
+    notebooks were added or removed.
+
+    Args:
+        changed (set): Resolved paths of the changed files
+        template_file (Path): Path to the template file for the index page
+        manifest (dict): Build manifest of the previous build
+
+    Returns:
+        Tuple[List[Tuple[Path, bool]], bool]: The notebooks to export (with whether they are apps),
+        and whether the index has to be generated again
+    """
+    to_export: List[Tuple[Path, bool]] = []
+    regenerate_index = template_file.resolve() in changed
+    for folder, as_app in NOTEBOOK_FOLDERS:
+        if not folder.exists():
+            continue
+        for nb in _notebook_files(folder):
+            if nb.resolve() in changed:
+                to_export.append((nb, as_app))
+                regenerate_index |= str(nb) not in manifest["notebooks"]
+            elif any(path.resolve() in changed for path in _asset_references(nb)):
+                to_export.append((nb, as_app))
+
+    # Forget notebooks that were deleted
+    for path in list(manifest["notebooks"]):
+        if not Path(path).exists():
+            manifest["notebooks"].pop(path)
+            regenerate_index = True
+    return to_export, regenerate_index
+
+
+def _watch(
+    output_dir: Path,
+    template_file: Path,
+    jobs: int = 1,
+    shared_envs: bool = True,
+    backend: str = "subprocess",
+    optimize_parquet: bool = True,
+    service_worker: bool = True,
+    minify: bool = False,
+    validate: str = "warn",
+    snapshot: bool = False,
+    wheel_dir: Path | None = None,
+    precompute_locks: bool = True,
+    compress: bool = True,
+) -> None:
+    """Watch the notebooks, apps and templates, and rebuild what is affected by each change.
+
+    Changes are picked up through filesystem events. Bursts of changes (e.g. an editor saving
+    several files) are coalesced into a single rebuild. Only the affected notebooks are exported
+    again, and the index is only generated again when the template or the set of notebooks changed.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        template_file (Path): Path to the template file for the index page
+        jobs (int, optional): Number of notebooks to export in parallel. Defaults to 1.
+        shared_envs (bool, optional): Whether to export in shared environments. Defaults to True.
+        backend (str, optional): Export backend, "subprocess" or "worker". With "worker", the
+                                 workers are kept warm between rebuilds. Defaults to "subprocess".
+        optimize_parquet (bool, optional): Whether to rewrite the exported public/*.parquet files. Defaults to True.
+        service_worker (bool, optional): Whether to write and register the service worker. Defaults to True.
+        minify (bool, optional): Whether to minify the exported pages. Defaults to False.
+        validate (str, optional): What to do with notebooks whose dataflow is broken: "error"
+                                  skips exporting them, "warn" only logs them, and "off" skips
+                                  the check. Defaults to "warn".
+        snapshot (bool, optional): Whether to embed an output snapshot in the pages. Defaults to False.
+        wheel_dir (Path, optional): Directory with wheels to mirror into the site. Defaults to None.
+        precompute_locks (bool, optional): Whether to precompute the pyodide lock files of the pages. Defaults to True.
+        compress (bool, optional): Whether to write precompressed .gz and .br sidecars. Defaults to True.
+
+    Returns:
+        None
+    """
+    manifest = _load_manifest(output_dir)
+    env_root = ENV_DIR.resolve() if shared_envs else None
+    marimo_version = _marimo_version()
+    watch_paths = [path for path in [folder for folder, _ in NOTEBOOK_FOLDERS] + [template_file.parent] if path.exists()]
+    watch_filter = watchfiles.DefaultFilter(ignore_dirs=(*watchfiles.DefaultFilter.ignore_dirs, "__marimo__"))
+    logger.info(f"Watching {', '.join(map(str, watch_paths))} for changes (press Ctrl+C to stop)")
+
+    for changes in watchfiles.watch(
+        *watch_paths, watch_filter=watch_filter, debounce=WATCH_DEBOUNCE_MS, raise_interrupt=False
+    ):
+        changed = {Path(path).resolve() for _, path in changes}
+        logger.info(f"Detected {len(changed)} changed file(s)")
+        to_export, regenerate_index = _affected_notebooks(changed, template_file, manifest)
+        if validate != "off":
+            invalid = _validate_notebooks([nb for nb, _ in to_export], validate)
+            if validate == "error":
+                to_export = [(nb, as_app) for nb, as_app in to_export if nb not in invalid]
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [
+                executor.submit(
+                    _export_html_wasm, nb, output_dir, as_app=as_app, manifest=manifest, marimo_version=marimo_version,
+                    env_root=env_root, backend=backend, max_workers=max(1, jobs), snapshot=snapshot,
+                )
+                for nb, as_app in to_export
+            ]
+            failed = [nb for (nb, _), future in zip(to_export, futures) if not future.result()]
+        if minify:
+            _minify_pages(output_dir, manifest, {})
+        _convert_csv_assets(output_dir, manifest, {})
+        config = _load_build_config()
+        if optimize_parquet:
+            _optimize_assets(output_dir, manifest, {}, config, jobs=jobs)
+        _partition_assets(output_dir, manifest, {}, config)
+        if wheel_dir is not None:
+            _mirror_wheels(output_dir, wheel_dir, manifest)
+        if precompute_locks and service_worker:
+            _precompute_locks(output_dir, manifest, {})
+
+        if regenerate_index or failed:
+            # Build the index from the manifest, which lists every successfully exported notebook
+            entries = sorted(manifest["notebooks"].items())
+            _generate_index(
+                output_dir=output_dir,
+                template_file=template_file,
+                notebooks_data=[_display_data(Path(path)) for path, entry in entries if not entry["as_app"]],
+                apps_data=[_display_data(Path(path)) for path, entry in entries if entry["as_app"]],
+                manifest=manifest,
+                service_worker=service_worker,
+            )
+        if service_worker:
+            _write_service_worker(output_dir, manifest)
+        # Compress the files that were written again, so no sidecar is left from before the change
+        if compress:
+            _compress_site(output_dir, manifest, jobs=jobs)
+        else:
+            _remove_sidecars(output_dir, manifest.pop("compressed", {}))
+        _save_manifest(output_dir, manifest)
+        logger.info(f"Rebuilt {len(to_export) - len(failed)} out of {len(to_export)} notebook(s), waiting for changes")
+
+
 def main(
     output_dir: Union[str, Path] = "_site",
     template: Union[str, Path] = "templates/tailwind.html.j2",
+    jobs: int = 1,
+    force: bool = False,
+    profile: bool = False,
+    watch: bool = False,
+    compress: bool = True,
+    shared_envs: bool = True,
+    backend: str = "subprocess",
+    optimize_parquet: bool = True,
+    service_worker: bool = True,
+    shard: str | None = None,
+    merge: Union[str, Tuple[str, ...], None] = None,
+    minify: bool = False,
+    validate: str = "warn",
+    snapshot: bool = False,
+    wheel_dir: Union[str, Path, None] = None,
+    precompute_locks: bool = True,
 ) -> None:
     """Main function to export marimo notebooks.
 
@@ -189,6 +3870,49 @@ def main(
     Command line arguments:
         --output-dir: Directory where the exported files will be saved (default: _site)
         --template: Path to the template file (default: templates/index.html.j2)
+        --jobs: Number of notebooks to export in parallel (default: 1)
+        --force: Export all notebooks, even those unchanged since the previous build
+        --profile: Profile the Python side of the build with cProfile, and save the result
+                   to build-profile.prof in the output directory
+        --compress/--nocompress: Whether to write precompressed .gz and .br sidecars next to
+                                 the files in the output directory (default: True)
+        --shared-envs/--noshared-envs: Whether to export notebooks with identical PEP 723
+                                       dependencies in one shared environment (kept in
+                                       .marimo-envs/), instead of a sandbox per notebook (default: True)
+        --backend: How to run the exports: "subprocess" starts marimo for every notebook, "worker"
+                   sends them to long-lived workers with marimo already imported, one set of
+                   workers per shared environment (default: subprocess)
+        --optimize-parquet/--nooptimize-parquet: Whether to rewrite the exported public/*.parquet
+                                                 files with zstd compression, tuned row groups, dictionary
+                                                 encoding and a page index (default: True)
+        --service-worker/--noservice-worker: Whether to write a service worker (sw.js) that caches the
+                                             runtime and data in the browser between visits, and
+                                             register it from the index (default: True)
+        --shard: Build one shard of the notebooks, e.g. "2/4" for the second of four shards. The
+                 notebooks are split by how long they took to export in previous builds, and
+                 the index and other steps for the whole site are left to --merge
+        --merge: Output directories of all shards to combine into the output directory, separated
+                 by commas or as a glob pattern (e.g. "shards/*"), instead of exporting notebooks
+        --minify: Minify the exported pages: remove comments and whitespace, compact the embedded
+                  notebook code and config, and in apps, leave out the comments in the hidden code
+                  and the editor settings. Pages that would change structure are kept as exported
+        --validate: Check the dataflow between the cells of every notebook before exporting: names
+                    used but not defined by any cell, names defined by several cells, and cycles.
+                    "error" stops the build, "warn" logs the problems, "off" skips the check
+                    (default: warn). In --watch, "error" skips exporting the broken notebooks
+        --snapshot: Run every notebook once with `marimo export html` and embed its outputs in
+                    the page, so they show right away and are replaced as the kernel in the browser
+                    catches up. This runs the notebooks at build time, which takes longer
+        --wheel-dir: Directory with wheels for pyodide. The wheels the notebooks need (from their
+                     PEP 723 headers, with their requirements) are copied into wheels/ in the output
+                     directory, each once, and the service worker loads them from there instead of
+                     from the pyodide CDN and PyPI
+        --precompute-locks/--noprecompute-locks: Whether to resolve the packages the pages install with
+                                                 micropip at build time, into a pyodide lock file per
+                                                 dependency set that the service worker gives the pages,
+                                                 so they don't solve dependencies in the browser (default: True)
+        --watch: After the build, keep watching notebooks/, apps/ and the templates, and
+                 rebuild the affected notebooks on every change
 
     Returns:
         None
@@ -199,28 +3923,60 @@ def main(
     output_dir: Path = Path(output_dir)
     logger.info(f"Output directory: {output_dir}")
 
-    # Make sure the output directory exists
-    output_dir.mkdir(parents=True, exist_ok=True)
-
     # Convert template to Path if provided
     template_file: Path = Path(template)
     logger.info(f"Using template file: {template_file}")
+    logger.info(f"Export jobs: {jobs}")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    logger.info(f"Export backend: {backend}")
+    if validate not in VALIDATION_MODES:
+        raise ValueError(f"Unknown validation mode {validate!r}, expected one of {', '.join(VALIDATION_MODES)}")
+    if watch and (shard or merge):
+        raise ValueError("--watch can't be combined with --shard or --merge")
+    wheel_dir = Path(wheel_dir) if wheel_dir is not None else None
+    if wheel_dir is not None and not wheel_dir.is_dir():
+        raise ValueError(f"Wheel directory {wheel_dir} not found")
 
-    # Export notebooks from the notebooks/ directory
-    notebooks_data = _export(Path("notebooks"), output_dir, as_app=False)
-
-    # Export apps from the apps/ directory
-    apps_data = _export(Path("apps"), output_dir, as_app=True)
-
-    # Exit if no notebooks or apps were found
-    if not notebooks_data and not apps_data:
-        logger.warning("No notebooks or apps found!")
-        return
-
-    # Generate the index.html file that lists all notebooks and apps
-    _generate_index(output_dir=output_dir, notebooks_data=notebooks_data, apps_data=apps_data, template_file=template_file)
+    # Profile the build if requested. Only the main thread is profiled, the export
+    # workers spend their time waiting on the marimo subprocesses anyway.
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        if merge:
+            # fire passes "a,b" as a tuple, but a single value as a string
+            patterns = merge.split(",") if isinstance(merge, str) else list(merge)
+            shard_dirs = [Path(path) for pattern in patterns for path in sorted(glob.glob(pattern.strip()))]
+            _merge(
+                output_dir, shard_dirs, template_file, jobs=jobs, compress=compress, service_worker=service_worker,
+                wheel_dir=wheel_dir, precompute_locks=precompute_locks,
+            )
+        else:
+            _build(
+                output_dir, template_file, jobs=jobs, force=force, compress=compress, shared_envs=shared_envs,
+                backend=backend, optimize_parquet=optimize_parquet, service_worker=service_worker,
+                shard=_parse_shard(shard) if shard else None, minify=minify, validate=validate,
+                snapshot=snapshot, wheel_dir=wheel_dir, precompute_locks=precompute_locks,
+            )
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile_path = output_dir / PROFILE_FILE
+            profiler.dump_stats(profile_path)
+            logger.info(f"Saved profile to {profile_path}")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
 
-    logger.info(f"Build completed successfully. Output directory: {output_dir}")
+    if watch:
+        try:
+            _watch(
+                output_dir, template_file, jobs=jobs, shared_envs=shared_envs, backend=backend,
+                optimize_parquet=optimize_parquet, service_worker=service_worker, minify=minify,
+                validate=validate, snapshot=snapshot, wheel_dir=wheel_dir, precompute_locks=precompute_locks,
+                compress=compress,
+            )
+        finally:
+            _close_workers()
 
 
 if __name__ == '__main__':
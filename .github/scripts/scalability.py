@@ -0,0 +1,294 @@
+"""
+Scalability benchmark for the build script.
+
+This script generates synthetic marimo notebooks (N notebooks with M cells each, and K MB of
+public/ data per notebook), exports them with _export() and generates the index with
+_generate_index(), and records the build time, peak memory and output size for each N. The
+results are appended to a history file together with the current git commit, and compared
+with the previous run with the same parameters, so regressions between commits are visible.
+
+By default the exports are done by a stub exporter, a small script that stands in for
+`uvx marimo export html-wasm`, so the benchmark runs offline and measures the build script
+itself. Pass --exporter real to export with marimo, in the shared environments of the build.
+
+The script can be run from the command line with optional arguments:
+    uv run .github/scripts/scalability.py [--notebooks 10,20,40] [--cells 20] [--data-mb 1]
+                                          [--exporter stub|real] [--jobs N]
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "jinja2==3.1.3",
+#     "fire==0.7.0",
+#     "loguru==0.7.0",
+#     "watchfiles==1.1.0",
+#     "brotli==1.1.0",
+#     "pyarrow==21.0.0",
+#     "packaging==25.0"
+# ]
+# ///
+
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import fire
+from loguru import logger
+
+import build
+
+# History of the benchmark results, one JSON object per run
+RESULTS_FILE = Path(__file__).parent.parent / "benchmarks" / "scalability.jsonl"
+
+# A run is reported as a regression when it is this much slower than the previous run
+REGRESSION_RATIO = 1.2
+
+# Stub for `uvx marimo export html-wasm ... NOTEBOOK -o OUTPUT` (and `uvx marimo --version`). Like
+# marimo, it writes an HTML page with the notebook source embedded, and copies the public/ folder
+# next to the notebook.
+STUB_EXPORTER = """
+import shutil, sys, urllib.parse
+from pathlib import Path
+args = sys.argv[1:]
+if "--version" in args:
+    print("stub")
+    sys.exit()
+output = Path(args[args.index("-o") + 1])
+notebook = Path(args[args.index("-o") - 1])
+code = urllib.parse.quote(notebook.read_text(encoding="utf-8"))
+output.write_text(
+    "<!DOCTYPE html><html><head><script type='module' src='./assets/index.js'></script></head><body>"
+    f"<marimo-code hidden>{code}</marimo-code>" + "<!-- frontend -->" * 20000 + "</body></html>"
+)
+if (notebook.parent / "public").is_dir():
+    shutil.copytree(notebook.parent / "public", output.parent / "public", dirs_exist_ok=True)
+"""
+
+
+def _write_notebook(path: Path, index: int, cells: int) -> None:
+    """Write a synthetic marimo notebook, with a chain of cells that depend on each other.
+
+    The first cell loads the notebook's data file from public/, and every other cell uses the
+    variable defined by the cell before it.
+
+    Args:
+        path (Path): Path of the notebook to write
+        index (int): Number of the notebook, used for the name of its data file
+        cells (int): Number of cells
+    """
+    parts = [
+        "import marimo\n\napp = marimo.App()\n\n",
+        "@app.cell\ndef _():\n    import marimo as mo\n\n"
+        f'    x0 = len((mo.notebook_location() / "public" / "data_{index}.bin").read_bytes())\n'
+        "    return (x0,)\n\n",
+    ]
+    for cell in range(1, cells):
+        parts.append(f"@app.cell\ndef _(x{cell - 1}):\n    x{cell} = x{cell - 1} + 1\n    return (x{cell},)\n\n")
+    parts.append('if __name__ == "__main__":\n    app.run()\n')
+    path.write_text("\n".join(parts), encoding="utf-8")
+
+
+def _generate_workspace(root: Path, notebooks: int, cells: int, data_mb: float) -> None:
+    """Generate a workspace with synthetic notebooks in notebooks/ and their data in notebooks/public/.
+
+    Args:
+        root (Path): Directory to generate the workspace in
+        notebooks (int): Number of notebooks
+        cells (int): Number of cells per notebook
+        data_mb (float): Size of the data file of each notebook, in MB
+    """
+    folder = root / "notebooks"
+    (folder / "public").mkdir(parents=True)
+    for index in range(notebooks):
+        _write_notebook(folder / f"notebook_{index:04d}.py", index, cells)
+        # Random data, so it behaves like already compressed data such as Parquet
+        (folder / "public" / f"data_{index}.bin").write_bytes(random.Random(index).randbytes(int(data_mb * 1e6)))
+
+
+def _measure(root: Path, template_file: Path, jobs: int, env_root: Path | None) -> dict:
+    """Export the notebooks in a workspace and generate the index, measuring the time each takes.
+
+    This runs in a process of its own for every measurement, so the peak memory is that of one build.
+
+    Args:
+        root (Path): Workspace generated by _generate_workspace()
+        template_file (Path): Path to the template file for the index page
+        jobs (int): Number of notebooks to export in parallel
+        env_root (Path | None): Directory with the shared environments, or None to export in sandboxes
+
+    Returns:
+        dict: Export and index time in seconds, peak RSS of the build and of the slowest
+        export in bytes, and the size of the output in bytes
+    """
+    os.chdir(root)
+    output_dir = root / "_site"
+    manifest: dict = {"notebooks": {}}
+    report: dict = {"notebooks": {}}
+
+    start = time.perf_counter()
+    try:
+        notebooks_data = build._export(
+            Path("notebooks"), output_dir, as_app=False, jobs=jobs, manifest=manifest,
+            marimo_version=build._marimo_version(), report=report, env_root=env_root,
+        )
+    finally:
+        build._close_workers()
+    export_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build._generate_index(output_dir, template_file, notebooks_data=notebooks_data, apps_data=[], manifest=manifest)
+    index_time = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "exported": len(notebooks_data),
+        "export_s": round(export_time, 3),
+        "index_s": round(index_time, 3),
+        "build_peak_rss_bytes": maxrss if sys.platform == "darwin" else maxrss * 1024,
+        "export_peak_rss_bytes": max((stats["peak_rss_bytes"] for stats in report["notebooks"].values()), default=0),
+        "output_bytes": sum(path.stat().st_size for path in output_dir.rglob("*") if path.is_file()),
+    }
+
+
+def _git_commit() -> str:
+    """Get the current git commit, with a "+dirty" suffix if there are uncommitted changes.
+
+    Returns:
+        str: The commit hash, or "unknown" outside a git repository
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("+dirty" if dirty else "")
+
+
+def _previous_run(results_file: Path, parameters: dict) -> dict | None:
+    """Find the latest run in the history with the same parameters.
+
+    Args:
+        results_file (Path): The history file
+        parameters (dict): Parameters of the current run
+
+    Returns:
+        dict | None: The previous run, or None if there is none
+    """
+    if not results_file.exists():
+        return None
+    runs = [json.loads(line) for line in results_file.read_text().splitlines() if line.strip()]
+    matching = [run for run in runs if run["parameters"] == parameters]
+    return matching[-1] if matching else None
+
+
+def main(
+    notebooks: Union[int, Tuple[int, ...]] = (10, 20, 40),
+    cells: int = 20,
+    data_mb: float = 1.0,
+    exporter: str = "stub",
+    jobs: int = 1,
+    template: Union[str, Path] = "templates/tailwind.html.j2",
+    results: Union[str, Path] = RESULTS_FILE,
+) -> None:
+    """Measure how the build scales with the number of notebooks.
+
+    Command line arguments:
+        --notebooks: Numbers of notebooks to build, separated by commas (default: 10,20,40)
+        --cells: Number of cells per notebook (default: 20)
+        --data-mb: Size of the public/ data of each notebook in MB (default: 1)
+        --exporter: "stub" to export with a stand-in for marimo that runs offline, or "real" to
+                    export with marimo in the shared environments (default: stub)
+        --jobs: Number of notebooks to export in parallel (default: 1)
+        --template: Path to the template file for the index page (default: templates/tailwind.html.j2)
+        --results: History file the results are appended to (default: .github/benchmarks/scalability.jsonl)
+
+    Returns:
+        None
+    """
+    if exporter not in ("stub", "real"):
+        raise ValueError(f"Unknown exporter {exporter!r}, expected stub or real")
+    # fire passes "a,b" as a tuple, but a single number as an int
+    sizes: List[int] = [notebooks] if isinstance(notebooks, int) else list(notebooks)
+    template_file = Path(template).resolve()
+    results_file = Path(results)
+    parameters = {"cells": cells, "data_mb": data_mb, "exporter": exporter, "jobs": jobs, "notebooks": sizes}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env_root = None
+        if exporter == "stub":
+            # Put the stub first on the PATH, where the sandboxed exports look for uvx
+            bin_dir = Path(tmp) / "bin"
+            bin_dir.mkdir()
+            stub = bin_dir / "uvx"
+            stub.write_text(f"#!{sys.executable}\n{STUB_EXPORTER}")
+            stub.chmod(0o755)
+            os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+        else:
+            env_root = build.ENV_DIR.resolve()
+
+        measurements = {}
+        context = multiprocessing.get_context("spawn")
+        try:
+            for size in sizes:
+                root = Path(tmp) / f"n{size}"
+                _generate_workspace(root, size, cells, data_mb)
+                with context.Pool(1) as pool:
+                    measurements[size] = pool.apply(_measure, (root, template_file, jobs, env_root))
+                logger.info(f"{size} notebooks: {measurements[size]}")
+        finally:
+            os.environ.clear()
+            os.environ.update(env)
+
+    previous = _previous_run(results_file, parameters)
+    run = {
+        "commit": _git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parameters": parameters,
+        "results": {str(size): stats for size, stats in measurements.items()},
+    }
+    results_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(results_file, "a") as f:
+        f.write(json.dumps(run, sort_keys=True) + "\n")
+    logger.info(f"Appended the results to {results_file}")
+
+    lines = [
+        f"{'Notebooks':>9}  {'Export (s)':>10}  {'Index (s)':>9}  {'Per notebook (s)':>16}  "
+        f"{'Build RSS (MB)':>14}  {'Output (MB)':>11}  {'Previous (s)':>12}"
+    ]
+    regressions = []
+    for size, stats in measurements.items():
+        total = stats["export_s"] + stats["index_s"]
+        before = previous["results"].get(str(size)) if previous else None
+        before_total = before["export_s"] + before["index_s"] if before else None
+        if before_total and total > REGRESSION_RATIO * before_total:
+            regressions.append(size)
+        lines.append(
+            f"{size:>9}  {stats['export_s']:>10.2f}  {stats['index_s']:>9.3f}  {total / max(1, size):>16.3f}  "
+            f"{stats['build_peak_rss_bytes'] / 1e6:>14.0f}  {stats['output_bytes'] / 1e6:>11.1f}  "
+            + (f"{before_total:>12.2f}" if before_total else f"{'-':>12}")
+        )
+    header = f"{exporter} exporter, {cells} cells and {data_mb} MB of data per notebook, {jobs} job(s)"
+    if previous:
+        header += f", compared with {previous['commit']} ({previous['date']})"
+    logger.info(header + ":\n" + "\n".join(lines))
+    if regressions:
+        logger.warning(
+            f"Build time regressed by more than {REGRESSION_RATIO - 1:.0%} for "
+            f"{', '.join(map(str, regressions))} notebooks since {previous['commit']}"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -17,9 +17,10 @@ with app.setup:
     import marimo as mo
     import polars as pl
     import altair as alt
-    import pyarrow.parquet as pq
-    import requests
-    import os
+    import pyarrow
+
+    # Felles kode for å lese datasettene i public/, se public/dataloader.py
+    import dataloader
 
     file = mo.notebook_location() / "public" / "enheter_alle.parquet"
 
@@ -65,39 +66,13 @@ def _():
 @app.cell
 def _():
     # Les Enhetsregisteret (NB!! Utdatert versjon av registeret!!!), og vis de første linjene
-    # 
-    # Dette er normalt bare to linjer kode, for polars kan lese parquet-filer direkte. Men akkurat 
-    # funksjonen for å lese parquet-filer via http fungerer ikke når polars kjører i nettleseren,
-    # derfor må vi bruke noen ekstra kodelinjer for først å finne ut om denne notatboken kjører 
-    # direkte i nettleseren eller ei. Hvis den kjører i nettleseren må vi laste ned fila vi skal lese
-    # til nettleserens virtuelle filsystem, og bruke pyarrow til å lese fila, før polars kan overta
-
-    if "http" in str(file)[:4]:
-        # filnavnet starter med http, m.a.o. kjører demoen i nettelseren,
-        # og vi må laste ned filen vha requests før den kan leses
-
-        # men først må vi anvende pyodide-prosjektets "lapping" av requests
-        import pyodide_http
-        pyodide_http.patch_all()
-    
-        r = requests.get(str(file), allow_redirects=True)
-        r.raise_for_status()
-        with open('data.parquet', 'wb') as f:
-            f.write(r.content)  # lagrer fila i nettleserens virtuelle filsystem
-
-        df = pl.from_arrow(pq.read_table('data.parquet'))
-
-        # for å redusere minnebruken, fjerner vi den lokale filen når vi har lest inn dataene:
-        try:
-            os.remove('data.parquet')
-            print("Filen ble slettet.")
-        except FileNotFoundError:
-            print("Filen finnes ikke.")
-    else:
-        # dette er den normale måten å gjøre det på med polars, og 
-        # vil antagelig også fungere i fremtiden når python i nettleseren
-        # blir like normalt som å ha python installert på egen maskin
-        df = pl.read_parquet(str(file))
+    #
+    # Normalt kan polars lese parquet-filer direkte, men akkurat funksjonen for å lese parquet-filer
+    # via http fungerer ikke når polars kjører i nettleseren. Derfor bruker vi dataloader, som
+    # laster ned fila rett inn i minnet (uten å lagre den i nettleserens virtuelle filsystem først),
+    # og gir den videre til polars uten å kopiere dataene. Fila leses én radgruppe om gangen, slik at
+    # de første linjene vises mens resten lastes
+    df = dataloader.to_polars(dataloader.read_progressively(file))
 
     df.head() # Viser de første fem postene i datasettet
     return (df,)
@@ -206,6 +181,26 @@ def _(df):
     return
 
 
+@app.cell(hide_code=True)
+def _():
+    mo.md(
+        r"""
+    Spørringen over bruker hele registeret, som først må lastes ned. Skal man bare ha disse enhetene, kan `dataloader.read_table` hente dem direkte fra parquet-fila med et filter. Da lastes først bare metadataene i slutten av fila ned, og deretter bare radgruppene som kan inneholde enheter med 5 ansatte (fila er sortert på antallAnsatte). Med `columns` kan man i tillegg velge hvilke kolonner som skal lastes ned.
+    """
+    )
+    return
+
+
+@app.cell
+def _():
+    df_fem_ansatte = dataloader.to_polars(dataloader.read_table(file, filters=[("antallAnsatte", "=", 5)]))
+    mo.md(f"""Leste {df_fem_ansatte.height} enheter med 5 ansatte
+
+    {mo.as_html(df_fem_ansatte.head())}
+    """)
+    return
+
+
 @app.cell(hide_code=True)
 def _():
     mo.md(
@@ -242,5 +237,40 @@ def _():
     return
 
 
+@app.cell(hide_code=True)
+def _():
+    mo.md(
+        r"""
+    ## Les bare én organisasjonsform
+
+    Ofte trenger en analyse bare en liten del av registeret. Byggescriptet deler derfor parquet-fila opp i én fil pr organisasjonsform, og `dataloader.read_partitions` laster bare ned fila (partisjonen) for organisasjonsformen du velger, i stedet for hele registeret.
+    """
+    )
+    return
+
+
+@app.cell
+def _():
+    organisasjonsform = mo.ui.dropdown(
+        options=["AS", "ASA", "ENK", "NUF", "DA", "ANS", "SA", "STI", "FLI"],
+        value="ASA",
+        label="Organisasjonsform",
+    )
+    organisasjonsform
+    return (organisasjonsform,)
+
+
+@app.cell
+def _(organisasjonsform):
+    df_organisasjonsform = dataloader.to_polars(
+        dataloader.read_partitions(file, organisasjonsform_kode=organisasjonsform.value)
+    )
+    mo.md(f"""Leste {df_organisasjonsform.height} enheter med organisasjonsform {organisasjonsform.value}
+
+    {mo.as_html(df_organisasjonsform.head())}
+    """)
+    return
+
+
 if __name__ == "__main__":
     app.run()
@@ -18,6 +18,10 @@ with app.setup:
     import polars as pl
     import altair as alt
     import pandas as pd # kan kanskje fjerne denne, hvis jeg ikke bruker pandas?
+    import pyarrow
+
+    # Felles kode for å lese datasettene i public/, se public/dataloader.py
+    import dataloader
 
     file = mo.notebook_location() / "public" / "enheter_alle.parquet"
 
@@ -61,8 +65,9 @@ def _():
 @app.cell
 def _():
     # Les Enhetsregisteret (NB!! Utdatert versjon!!!) fra enheter_alle.parquet
-    # Og vis de første linjene
-    df = pl.read_parquet(str(file))
+    # Og vis de første linjene. dataloader leser fila både lokalt og i nettleseren, én radgruppe om
+    # gangen, slik at de første linjene vises mens resten lastes
+    df = dataloader.to_polars(dataloader.read_progressively(file))
     df.head()
     return (df,)
 
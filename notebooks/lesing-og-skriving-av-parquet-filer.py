@@ -10,7 +10,10 @@ def _():
     import pandas as pd
     import polars as pl
     import pyarrow.parquet as pq
-    return mo, pd, pl, pq
+
+    # Felles kode for å lese datasettene i public/, se public/dataloader.py
+    import dataloader
+    return dataloader, mo, pd, pl, pq
 
 
 @app.cell(hide_code=True)
@@ -179,56 +182,13 @@ def _(mo):
 
 
 @app.cell
-def _():
-    import requests
-    return (requests,)
-
-
-@app.cell
-def _(df_polars_http, file, os, pl, pq, requests):
-    if "http" in str(file)[:4]:
-        # filnavnet starter med http, m.a.o. kjører demoen i nettelseren,
-        # og vi må laste ned filen vha requests før den kan leses
-
-        # men først må vi anvende pyodide-prosjektets "lapping" av requeests
-        import pyodide_http
-        pyodide_http.patch_all()
-
-        r = requests.get(str(file),
-                         allow_redirects=True)
-        r.raise_for_status()
-        with open('data.parquet', 'wb') as f:
-            f.write(r.content)  # lagrer fila i nettleserens virtuelle filsystem
-
-        df = pl.from_arrow(pq.read_table('data.parquet'))
-
-        # for å redusere minnebruken, fjerner vi den lokale filen når vi har lest inn dataene:
-        try:
-            os.remove('data.parquet')
-            print("Filen ble slettet.")
-        except FileNotFoundError:
-            print("Filen finnes ikke.")
-    else:
-        # dette er den normale måten å gjøre det på med polars, og 
-        # vil antagelig også fungere i fremtiden når python i nettleseren
-        # blir like normalt som å ha python installert på egen maskin
-        df = pl.read_parquet(str(file))
-
+def _(dataloader):
+    # pyarrow kan ikke lese direkte fra http, så dataloader laster ned fila rett inn i minnet,
+    # uten å skrive den til en lokal fil først, og gir den til polars uten å kopiere dataene
+    df_polars_http = dataloader.to_polars(
+        dataloader.read_table('http://sskagemo.github.io/my-marimos/notebooks/public/enheter_alle.parquet')
+    )
     df_polars_http.head() # Viser de første fem postene i datasettet
-    return
-
-
-@app.cell
-def _(pl, pq, requests):
-    r = requests.get('http://sskagemo.github.io/my-marimos/notebooks/public/enheter_alle.parquet', allow_redirects=True)
-    r.raise_for_status()
-    with open('data.parquet', 'wb') as f:
-        f.write(r.content)
-
-    # table = pq.read_table('data.parquet')
-    # df = pl.from_arrow(table)
-
-    df_polars_http = pl.from_arrow(pq.read_table('data.parquet'))
     return (df_polars_http,)
 
 
@@ -14,22 +14,20 @@ def _():
 def _(mo):
     import pandas as pd
     import pyarrow  # pandas bruker pyarrow for å kunne lese parquet riktig
-    import pyarrow.parquet as pq
-    from pyodide.http import pyfetch  # pyfetch og io brukes for å laste ned fila
-    import io
+
+    # Felles kode for å lese datasettene i public/, se public/dataloader.py
+    import dataloader
 
 
     file = mo.notebook_location() / 'public' / 'enheter_alle.parquet'
-    return file, io, pq, pyfetch
+    return dataloader, file
 
 
 @app.cell
-async def _(file, io, pq, pyfetch):
+def _(dataloader, file):
     # Leser innholdet i parquet-fila i en pandas dataframe
     # Du finner resultatet under "Explore Data Sources" i menyen til venstre
-    df = pq.read_table(
-        io.BytesIO(await (await pyfetch(str(file))).bytes())
-        ).to_pandas()
+    df = dataloader.to_pandas(dataloader.read_table(file))
     return (df,)
 
 
@@ -18,6 +18,10 @@ with app.setup:
     import polars as pl
     import altair as alt
     import pandas as pd
+    import pyarrow
+
+    # Shared code to read the datasets in public/, see public/dataloader.py
+    import dataloader
 
     file = mo.notebook_location() / "public" / "penguins.csv"
 
@@ -36,16 +40,17 @@ def _():
 
 @app.cell
 def _():
-    # Read the penguins dataset
-    df = pl.read_csv(str(file))
+    # Read the penguins dataset, from the Parquet copy of the CSV file the build writes next to it
+    df = dataloader.to_polars(dataloader.read_columnar(file))
     df.head()
     return (df,)
 
 
 @app.cell
-def _():
-    # Try to avoid reading the file with pandas
-    _df = pd.read_csv(str(file))
+def _(df):
+    # Build the pandas version from the polars dataframe, instead of reading the file again.
+    # Both share the Arrow data, so it isn't copied
+    _df = dataloader.to_pandas(df.to_arrow())
     return
 
 
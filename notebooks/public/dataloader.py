@@ -0,0 +1,398 @@
+"""Shared code to read the datasets in public/, both locally and when the notebooks run in the browser.
+
+The notebooks import the module as usual (e.g. notebooks/penguins.py): locally public/ is on the
+Python path through [tool.marimo.runtime] in pyproject.toml, and in the exported pages the build
+downloads the module into the file system of pyodide first. The file lives in public/ so it is
+exported, and downloaded by the browser, like the data.
+
+The data is read straight into an Arrow buffer, without going through a temporary file: local
+files are memory-mapped, and over http they are downloaded directly into the buffer. The tables
+can then be turned into polars or pandas dataframes without copying the data.
+"""
+
+import io
+import json
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Iterator, List, Tuple
+
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.parquet as pq
+
+# Number of bytes from the end of a Parquet file fetched in the first request, to get its metadata
+FOOTER_BYTES = 64 * 1024
+
+# Ranges of a file with less than this between them are downloaded in the same request
+RANGE_GAP = 256 * 1024
+
+
+def _download(url: str, byte_range: str | None = None) -> Tuple[pa.Buffer, str | None]:
+    """Download a URL, or only a range of it, straight into an Arrow buffer.
+
+    byte_range is a Range header without "bytes=", e.g. "0-99" or "-100" (the last 100 bytes).
+    Returns the buffer and the Content-Range header of the response, which is None when the server
+    sent the whole file. A missing file (HTTP 404) raises FileNotFoundError, as for local files.
+    """
+    headers = {"Range": f"bytes={byte_range}"} if byte_range else {}
+    if sys.platform == "emscripten":
+        # pyodide runs in a web worker, where synchronous requests can return an ArrayBuffer. It is
+        # copied once, from JavaScript into the memory of Python, and then used as it is. pyarrow
+        # reads synchronously, so pyfetch (which is asynchronous) can't be used here
+        from js import Uint8Array, XMLHttpRequest
+
+        request = XMLHttpRequest.new()
+        request.open("GET", url, False)
+        request.responseType = "arraybuffer"
+        for name, value in headers.items():
+            request.setRequestHeader(name, value)
+        request.send()
+        if request.status == 404:
+            raise FileNotFoundError(f"Not found: {url}")
+        if request.status >= 400:
+            raise OSError(f"Could not fetch {url}: HTTP {request.status}")
+        content_range = request.getResponseHeader("Content-Range") if request.status == 206 else None
+        return pa.py_buffer(Uint8Array.new(request.response).to_memoryview()), content_range
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            raise FileNotFoundError(f"Not found: {url}") from e
+        raise
+    with response:
+        content_range = response.headers.get("Content-Range") if response.status == 206 else None
+        length = response.headers.get("Content-Length")
+        if length is None:
+            return pa.py_buffer(response.read()), content_range
+        # With a known length, the response is read straight into the buffer
+        buffer = pa.allocate_buffer(int(length))
+        view = memoryview(buffer)
+        received = 0
+        while received < len(view):
+            count = response.readinto(view[received:])
+            if not count:
+                raise OSError(f"Got only {received} of {len(view)} bytes from {url}")
+            received += count
+        return buffer, content_range
+
+
+def read_buffer(path) -> pa.Buffer:
+    """Read a file from public/ into an Arrow buffer, locally or over http when the notebook runs in the browser."""
+    url = str(path)
+    if not url.startswith("http"):
+        # The buffer points straight at the file, which the operating system reads in as it is used
+        return pa.memory_map(url).read_buffer()
+    return _download(url)[0]
+
+
+class _RangeFile(io.RawIOBase):
+    """A Parquet file over http, of which only the ranges pyarrow reads are downloaded.
+
+    The ranges that are needed can be fetched up front with fetch(), so they take as few requests
+    as possible. Anything read outside of them is fetched when it is read.
+    """
+
+    def __init__(self, url: str, size: int):
+        self.url = url
+        self.size = size
+        self.position = 0
+        # (start, buffer) of the downloaded ranges
+        self.chunks: List[Tuple[int, pa.Buffer]] = []
+        self.requests = 0
+        self.downloaded = 0
+
+    def fetch(self, start: int, end: int) -> None:
+        """Download the bytes from start up to (but not including) end."""
+        buffer, _ = _download(self.url, f"{start}-{end - 1}")
+        self.chunks.append((start, buffer))
+        self.requests += 1
+        self.downloaded += buffer.size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = base + offset
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, target) -> int:
+        count = max(0, min(len(target), self.size - self.position))
+        if not count:
+            return 0
+        start, end = self.position, self.position + count
+        chunk = next(
+            ((offset, buffer) for offset, buffer in self.chunks if offset <= start and end <= offset + buffer.size),
+            None,
+        )
+        if chunk is None:
+            self.fetch(start, end)
+            chunk = self.chunks[-1]
+        offset, buffer = chunk
+        memoryview(target).cast("B")[:count] = memoryview(buffer).cast("B")[start - offset : end - offset]
+        self.position = end
+        return count
+
+
+def _may_match(statistics, operator: str, value) -> bool:
+    """Check whether a column in a row group can have values that match a filter, by its min and max."""
+    if statistics is None or not statistics.has_min_max:
+        return True
+    low, high = statistics.min, statistics.max
+    try:
+        if operator in ("=", "=="):
+            return low <= value <= high
+        if operator == "!=":
+            return not low == high == value
+        if operator == "<":
+            return low < value
+        if operator == "<=":
+            return low <= value
+        if operator == ">":
+            return high > value
+        if operator == ">=":
+            return high >= value
+        if operator == "in":
+            return any(low <= item <= high for item in value)
+        if operator == "not in":
+            return not (low == high and low in value)
+    except TypeError:
+        # The value can't be compared with the statistics (e.g. a date with a string)
+        pass
+    return True
+
+
+def _open_remote(url: str) -> Tuple[pq.ParquetFile, "_RangeFile | None"]:
+    """Open a Parquet file over http, by fetching the end of the file with its metadata (the footer).
+
+    Returns the file and the _RangeFile it reads from. If the server doesn't support range requests,
+    the whole file has been downloaded, and it is read from memory instead (and the _RangeFile is None).
+    """
+    tail, content_range = _download(url, f"-{FOOTER_BYTES}")
+    if content_range is None:
+        return pq.ParquetFile(pa.BufferReader(tail)), None
+    size = int(content_range.rsplit("/", 1)[1])
+    # The file ends with the length of the metadata (4 bytes) and "PAR1"
+    footer = int.from_bytes(tail[-8:-4].to_pybytes(), "little") + 8
+    file = _RangeFile(url, size)
+    file.chunks.append((size - tail.size, tail))
+    file.requests, file.downloaded = 1, tail.size
+    if footer > tail.size:
+        # The metadata is larger than what was fetched, and is fetched again as a whole
+        file.fetch(size - footer, size)
+    return pq.ParquetFile(file), file
+
+
+def _fetch_row_groups(file: _RangeFile, metadata, row_groups: List[int], wanted) -> None:
+    """Download the columns in wanted (all if None) of the row groups to read.
+
+    Ranges with less than RANGE_GAP bytes between them are fetched in the same request.
+    """
+    ranges = []
+    for index in row_groups:
+        row_group = metadata.row_group(index)
+        for position in range(row_group.num_columns):
+            chunk = row_group.column(position)
+            if wanted is not None and chunk.path_in_schema.split(".")[0] not in wanted:
+                continue
+            start = chunk.data_page_offset
+            if chunk.has_dictionary_page and chunk.dictionary_page_offset:
+                start = min(start, chunk.dictionary_page_offset)
+            ranges.append((start, start + chunk.total_compressed_size))
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] <= RANGE_GAP:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    for start, end in merged:
+        file.fetch(start, end)
+
+
+def _read_ranges(url: str, columns=None, filters=None) -> pa.Table:
+    """Read a Parquet file over http with range requests, downloading only what is needed.
+
+    First the end of the file with the metadata (the footer) is fetched. From the min and max values
+    in the metadata, the row groups that can have rows matching the filters are picked, and of those
+    only the columns to read or filter on are fetched. Ranges close to each other are merged into
+    one request. If the server doesn't support range requests, the whole file is read.
+    """
+    parquet_file, file = _open_remote(url)
+    metadata = parquet_file.metadata
+
+    disjunction = [] if not filters else filters if isinstance(filters[0], list) else [filters]
+    names = [metadata.schema.column(index).path for index in range(metadata.num_columns)]
+    row_groups = [
+        index for index in range(metadata.num_row_groups)
+        if not disjunction or any(
+            all(
+                column not in names
+                or _may_match(metadata.row_group(index).column(names.index(column)).statistics, operator, value)
+                for column, operator, value in conjunction
+            )
+            for conjunction in disjunction
+        )
+    ]
+    # The columns to read, and those filtered on
+    wanted = None if columns is None else set(columns) | {column for conjunction in disjunction for column, _, _ in conjunction}
+
+    if file is not None:
+        _fetch_row_groups(file, metadata, row_groups, wanted)
+
+    read_columns = None if wanted is None else [name for name in parquet_file.schema_arrow.names if name in wanted]
+    if row_groups:
+        table = parquet_file.read_row_groups(row_groups, columns=read_columns)
+    else:
+        schema = parquet_file.schema_arrow
+        table = schema.empty_table() if read_columns is None else schema.empty_table().select(read_columns)
+    if filters:
+        table = table.filter(pq.filters_to_expression(filters))
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def read_table(path, columns=None, filters=None) -> pa.Table:
+    """Read a Parquet file from public/ as an Arrow table.
+
+    columns are the columns to read (all if None), and filters are filters as pyarrow.parquet takes
+    them, e.g. [("antallAnsatte", "=", 5)]. Over http, only the parts of the file that are needed
+    are then downloaded, with range requests (see _read_ranges).
+    """
+    url = str(path)
+    if url.startswith("http") and (columns is not None or filters):
+        return _read_ranges(url, columns=columns, filters=filters)
+    return pq.read_table(pa.BufferReader(read_buffer(path)), columns=columns, filters=filters)
+
+
+def _row_groups(path, columns=None) -> Tuple[int, Iterator[pa.Table]]:
+    """Open a Parquet file from public/ to be read one row group at a time.
+
+    Returns the number of rows in the file, and an iterator over the row groups. Over http, each
+    row group is downloaded with a range request right before it is read.
+    """
+    url = str(path)
+    if url.startswith("http"):
+        parquet_file, file = _open_remote(url)
+    else:
+        parquet_file, file = pq.ParquetFile(pa.memory_map(url)), None
+
+    def _batches():
+        # The ranges with the metadata are kept, the rest is released when the row group is read
+        kept = 0 if file is None else len(file.chunks)
+        for index in range(parquet_file.num_row_groups):
+            if file is not None:
+                _fetch_row_groups(file, parquet_file.metadata, [index], None if columns is None else set(columns))
+            yield parquet_file.read_row_group(index, columns=columns)
+            if file is not None:
+                del file.chunks[kept:]
+
+    return parquet_file.metadata.num_rows, _batches()
+
+
+def read_batches(path, columns=None) -> Iterator[pa.Table]:
+    """Read a Parquet file from public/ one row group at a time, as Arrow tables."""
+    return _row_groups(path, columns=columns)[1]
+
+
+def read_progressively(path, columns=None, preview_rows: int = 5) -> pa.Table:
+    """Read a Parquet file from public/ one row group at a time, showing the progress in the cell output.
+
+    As soon as the first row group is read, its first rows are shown below the progress bar, while
+    the rest of the file loads. They stay until the cell shows something else, e.g. df.head(). The
+    row groups are put together into one table without copying (each row group becomes a chunk of
+    the columns), which to_polars() and to_pandas() keep as they are too.
+    """
+    import marimo as mo
+
+    total, batches = _row_groups(path, columns=columns)
+    tables: List[pa.Table] = []
+    with mo.status.progress_bar(total=total, title="Laster inn data", remove_on_exit=True) as bar:
+        for table in batches:
+            tables.append(table)
+            if len(tables) == 1:
+                mo.output.append(mo.vstack([
+                    mo.md(f"De første {min(preview_rows, table.num_rows)} av {total} rader:"),
+                    mo.ui.table(table.slice(0, preview_rows).to_pylist(), selection=None),
+                ]))
+            bar.update(increment=table.num_rows)
+    if not tables:
+        return read_table(path, columns=columns)
+    return pa.concat_tables(tables)
+
+
+def csv_convert_options(column_types: pa.Schema | None = None) -> pyarrow.csv.ConvertOptions:
+    """The options CSV files are read with, both here and when the build script writes the Parquet copy.
+
+    Empty values are null, as in polars. column_types gives the types of the columns, otherwise they are inferred.
+    """
+    return pyarrow.csv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+
+
+def read_columnar(path) -> pa.Table:
+    """Read a CSV file from public/, preferably from the Parquet copy the build script writes next to it."""
+    try:
+        return read_table(path.with_suffix(".parquet"))
+    except FileNotFoundError:
+        return pyarrow.csv.read_csv(pa.BufferReader(read_buffer(path)), convert_options=csv_convert_options())
+
+
+def read_partitions(path, **filters) -> pa.Table:
+    """Read the rows of a Parquet file in public/ that have the given values (column=value).
+
+    The build script splits large files into partitions, described by a manifest.json in a folder
+    next to the file. Then only the partitions that can have the rows are downloaded, by the min
+    and max values of each column in the manifest. Without partitions, the whole file is read.
+    """
+    conditions = [(column, "=", value) for column, value in filters.items()] or None
+    folder = path.parent / path.stem
+    try:
+        manifest = json.loads(read_buffer(folder / "manifest.json").to_pybytes())
+    except FileNotFoundError:
+        return read_table(path, filters=conditions)
+
+    def _url(partition):
+        # The file names are URL-encoded, and have to be encoded once more to be fetched over http
+        name = partition["path"]
+        return folder / (urllib.parse.quote(name) if str(folder).startswith("http") else name)
+
+    needed = [
+        partition for partition in manifest["partitions"]
+        if all(
+            column not in partition["stats"]
+            or partition["stats"][column]["min"] is not None
+            and partition["stats"][column]["min"] <= value <= partition["stats"][column]["max"]
+            for column, value in filters.items()
+        )
+    ]
+    if not needed:
+        # Without matches, the smallest partition is read to get the columns
+        smallest = min(manifest["partitions"], key=lambda partition: partition["bytes"])
+        return read_table(_url(smallest)).slice(0, 0)
+    return pa.concat_tables([read_table(_url(partition), filters=conditions) for partition in needed])
+
+
+def to_polars(table: pa.Table):
+    """Turn an Arrow table into a polars dataframe, without copying the data."""
+    import polars as pl
+
+    return pl.from_arrow(table, rechunk=False)
+
+
+def to_pandas(table: pa.Table):
+    """Turn an Arrow table into a pandas dataframe, without copying the data.
+
+    The columns keep their Arrow types, as with pd.read_parquet(..., dtype_backend="pyarrow"), so
+    that e.g. categories are kept.
+    """
+    import pandas as pd
+
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
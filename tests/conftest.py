@@ -0,0 +1,43 @@
+"""Shared setup for the tests of the build script and the notebooks' data loader."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+# The build script is a standalone script, not a package
+sys.path.insert(0, str(ROOT / ".github" / "scripts"))
+
+# The data loader lives in the notebooks' public/ folder, where the notebooks import it from. No
+# bytecode is written there, as the build would export it with the rest of public/.
+sys.path.insert(0, str(ROOT / "notebooks" / "public"))
+sys.dont_write_bytecode = True
+
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    """A workspace with one notebook, and an output directory with a marimo-like export of it.
+
+    The export has a page that loads the frontend bundle, and a web worker with the pyodide
+    version in it, like the ones marimo writes. Returns the output directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "notebooks").mkdir()
+    (tmp_path / "notebooks" / "demo.py").write_text(
+        "import marimo\n\napp = marimo.App()\n\n\n@app.cell\ndef _():\n    return\n", encoding="utf-8"
+    )
+    output_dir = tmp_path / "_site"
+    assets = output_dir / "notebooks" / "assets"
+    assets.mkdir(parents=True)
+    (assets / "index-abc123.js").write_text("console.log('frontend')", encoding="utf-8")
+    (assets / "worker-def456.js").write_text('const Xe="0.27.5";const url=`v${Xe}`;', encoding="utf-8")
+    (output_dir / "notebooks" / "demo.html").write_text(
+        "<!DOCTYPE html><html><head>\n"
+        "<script type=\"module\" crossorigin src=\"./assets/index-abc123.js\"></script>\n"
+        "<marimo-version data-version=\"0.13.15\" hidden></marimo-version>\n"
+        "</head><body><div id=\"root\"></div></body></html>\n",
+        encoding="utf-8",
+    )
+    return output_dir
@@ -0,0 +1,528 @@
+"""Tests for the build script, .github/scripts/build.py."""
+
+import hashlib
+import io
+import json
+import re
+import shutil
+import sys
+import textwrap
+import zipfile
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import build
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_generate_index_without_manifest(export):
+    # The index can be generated without a build manifest, as on the first build
+    notebooks_data = [{"display_name": "Demo", "html_path": "notebooks/demo.html"}]
+    build._generate_index(export, ROOT / "templates" / "tailwind.html.j2", notebooks_data=notebooks_data)
+
+    assert (export / "index.html").is_file()
+    hrefs = [resource["href"] for resource in notebooks_data[0]["resources"]]
+    assert hrefs[0] == "notebooks/demo.html"
+    # Without a precomputed lock file, the page's hint is the lock file on the pyodide CDN
+    assert any(href.startswith("https://wasm.marimo.app/pyodide-lock.json") for href in hrefs)
+
+
+def _wheel(name: str, version: str, requires: list[str], top_level: list[str] | None = None) -> bytes:
+    """Build a pure Python wheel with the given requirements, and a top_level.txt if given."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as wheel:
+        dist_info = f"{name}-{version}.dist-info"
+        metadata = f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+        wheel.writestr(f"{dist_info}/METADATA", metadata + "".join(f"Requires-Dist: {r}\n" for r in requires))
+        if top_level is not None:
+            wheel.writestr(f"{dist_info}/top_level.txt", "\n".join(top_level))
+        wheel.writestr(f"{name.replace('-', '_')}/__init__.py", "")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pypi(monkeypatch):
+    """A fake PyPI: releases added with add(name, version, requires) are served by build's urlopen."""
+    files: dict = {}
+    projects: dict = {}
+
+    def add(name, version, requires=(), top_level=None):
+        data = _wheel(name, version, list(requires), top_level)
+        filename = f"{name.replace('-', '_')}-{version}-py3-none-any.whl"
+        files[f"https://files.example/{filename}"] = data
+        project = projects.setdefault(name, {"info": {"name": name, "version": version}, "releases": {}})
+        project["releases"][version] = [{
+            "filename": filename, "url": f"https://files.example/{filename}",
+            "digests": {"sha256": hashlib.sha256(data).hexdigest()},
+        }]
+
+    def urlopen(url, timeout=None):
+        if url.startswith(build.PYODIDE_LOCK_URL.split("?")[0]):
+            return io.BytesIO(json.dumps(BASE_LOCK).encode())
+        if url.startswith("https://pypi.org/pypi/"):
+            name = url.split("/")[-2]
+            if name not in projects:
+                raise OSError(f"404 {url}")
+            return io.BytesIO(json.dumps(projects[name]).encode())
+        return io.BytesIO(files[url])
+
+    monkeypatch.setattr(build.urllib.request, "urlopen", urlopen)
+    return add
+
+
+# A pyodide lock file, as marimo serves it for a page
+BASE_LOCK = {
+    "info": {"arch": "wasm32", "platform": "emscripten_3_1_58", "version": "0.27.5", "python": "3.12.7"},
+    "packages": {"numpy": {"name": "numpy", "version": "2.0.2", "imports": ["numpy"], "depends": []}},
+}
+
+ENVIRONMENT = build._lock_marker_environment({"python": "3.12.7", "platform": "emscripten_3_1_58"})
+
+
+def test_resolve_lock(pypi):
+    pypi("toolz", "0.12.0")
+    pypi("toolz", "1.0.0")
+    pypi("toolz", "1.1.0rc1")
+    pypi("pysocks", "1.7.1", top_level=["socks", "sockshandler"])
+    pypi("colorama", "0.4.6")
+    pypi("demo", "2.0.0", [
+        "toolz>=0.12",
+        "numpy>=1.20",
+        'colorama; sys_platform == "win32"',
+        'pysocks; extra == "socks"',
+        'toolz<0.12; python_version < "3.8"',
+    ])
+
+    resolved, requests = build._resolve_lock(["demo[socks]"], {"numpy": {"version": "2.0.2"}}, ENVIRONMENT)
+
+    assert {name: entry["version"] for name, entry in resolved.items()} == {
+        "demo": "2.0.0", "toolz": "1.0.0", "pysocks": "1.7.1",
+    }
+    assert resolved["demo"]["depends"] == ["numpy", "pysocks", "toolz"]
+    assert resolved["pysocks"]["imports"] == ["socks", "sockshandler"]
+    # One metadata request per package looked up, the wheel downloads are not counted
+    assert requests == 3
+
+
+def test_resolve_lock_fails_when_not_exact(pypi):
+    pypi("toolz", "0.12.0")
+    pypi("toolz", "1.0.0")
+    pypi("demo", "2.0.0", ["toolz<1"])
+    pypi("native", "1.0.0")
+
+    # micropip would have to backtrack from toolz 1.0.0
+    with pytest.raises(ValueError, match="conflicts with toolz 1.0.0"):
+        build._resolve_lock(["toolz", "demo"], {}, ENVIRONMENT)
+    # The lock file of the page has another version
+    with pytest.raises(ValueError, match="conflicts with numpy 2.0.2"):
+        build._resolve_lock(["numpy<2"], {"numpy": {"version": "2.0.2"}}, ENVIRONMENT)
+    # Not on PyPI, or only built for other platforms
+    with pytest.raises(ValueError, match="No pure Python wheel"):
+        build._resolve_lock(["native>=2"], {}, ENVIRONMENT)
+
+
+def test_precompute_locks(export, pypi):
+    pypi("toolz", "1.0.0")
+    manifest = {"notebooks": {"notebooks/demo.py": {"html_path": "notebooks/demo.html"}}}
+    report: dict = {}
+    for dependencies, lock in ((["toolz"], True), (["toolz<1"], False)):
+        Path("notebooks/demo.py").write_text(
+            "# /// script\n# dependencies = " + json.dumps(["marimo", *dependencies]) + "\n# ///\n", encoding="utf-8"
+        )
+        build._precompute_locks(export, manifest, report)
+        entry = manifest["notebooks"]["notebooks/demo.py"]
+        if lock:
+            content = json.loads((export / entry["lock"]).read_text(encoding="utf-8"))
+            assert sorted(content["packages"]) == ["numpy", "toolz"]
+            assert report["locks"]["notebooks/demo.py"]["packages"] == {"toolz": "1.0.0"}
+        else:
+            # No exact resolution, so no lock file: the page installs its packages with micropip
+            assert "lock" not in entry
+            assert not list((export / build.LOCKS_DIR).iterdir())
+
+
+def test_convert_csv_reads_like_the_loader(tmp_path):
+    # The Parquet copy has the same columns and nulls as the loader's CSV fallback
+    source = ROOT / "notebooks" / "public" / "penguins.csv"
+    schema = build._convert_csv(source, tmp_path / "penguins.parquet", None)
+
+    copy = pq.read_table(tmp_path / "penguins.parquet")
+    assert copy.schema == schema
+    assert copy.equals(build.dataloader.read_columnar(source))
+    assert copy["sex"].null_count == 11
+
+
+def test_minify_html_keeps_space_between_inline_elements():
+    page = (
+        "<!DOCTYPE html>\n<html>\n<head>\n  <title>Demo</title>\n</head>\n<body>\n  <div>\n"
+        "    <p><span>a</span> <b>b</b>\n    <em>c</em></p>\n  </div>\n</body>\n</html>\n"
+    )
+
+    result = build._minify_html(page, as_app=False)
+
+    assert "<p><span>a</span> <b>b</b> <em>c</em></p>" in result
+    assert "<body><div><p>" in result
+    assert build._page_structure(result, as_app=False) == build._page_structure(page, as_app=False)
+    # Losing the space changes the structure, so such a page would be kept as exported
+    squashed = result.replace("</span> <b>", "</span><b>")
+    assert build._page_structure(squashed, as_app=False) != build._page_structure(page, as_app=False)
+
+
+def test_compress_site_deletes_outdated_sidecars(export):
+    manifest: dict = {}
+    page = export / "notebooks" / "demo.html"
+    build._compress_site(export, manifest)
+    assert (export / "notebooks" / "demo.html.gz").is_file()
+    assert (export / "notebooks" / "demo.html.br").is_file()
+
+    # The sidecars of a removed file go with it, the others are kept
+    script = export / "notebooks" / "assets" / "index-abc123.js"
+    script.write_text("console.log('frontend');" * 100, encoding="utf-8")
+    build._compress_site(export, manifest)
+    page.unlink()
+    build._compress_site(export, manifest)
+    assert not (export / "notebooks" / "demo.html.gz").exists()
+    assert not (export / "notebooks" / "demo.html.br").exists()
+    assert "notebooks/demo.html" not in manifest["compressed"]
+    assert (export / "notebooks" / "assets" / "index-abc123.js.gz").is_file()
+
+    # Without compression, the sidecars of the earlier builds are deleted
+    build._remove_sidecars(export, manifest.pop("compressed"))
+    assert not list(export.rglob("*.gz")) and not list(export.rglob("*.br"))
+
+
+def test_merge_fails_when_a_notebook_is_missing(export, tmp_path):
+    # Shard 1 was assigned the notebook but failed to export it, so the site would lack its page
+    for number, notebooks in ((1, ["notebooks/demo.py"]), (2, [])):
+        shard_dir = tmp_path / "shards" / f"shard-{number}"
+        shard_dir.mkdir(parents=True)
+        manifest = {"notebooks": {}, "shard": {"number": number, "count": 2, "notebooks": notebooks}}
+        (shard_dir / build.MANIFEST_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+
+    with pytest.raises(ValueError, match="notebooks/demo.py: failed in"):
+        build._merge(
+            tmp_path / "merged", sorted((tmp_path / "shards").iterdir()), ROOT / "templates" / "tailwind.html.j2",
+            compress=False, service_worker=False,
+        )
+
+
+def test_merge_takes_public_files_from_the_owning_shard(export, tmp_path):
+    # Shard 2 doesn't own the notebook, but has a stale copy of its data from an earlier build.
+    # It is merged last, and must not replace the fresh data of shard 1.
+    for number, notebooks, data in ((1, ["notebooks/demo.py"], "x\n2\n"), (2, [], "x\n1\n")):
+        shard_dir = tmp_path / "shards" / f"shard-{number}"
+        shutil.copytree(export, shard_dir)
+        (shard_dir / "notebooks" / "public").mkdir()
+        (shard_dir / "notebooks" / "public" / "data.csv").write_text(data, encoding="utf-8")
+        manifest = {
+            "notebooks": {"notebooks/demo.py": {"key": "abc", "as_app": False, "html_path": "notebooks/demo.html"}},
+            "shard": {"number": number, "count": 2, "notebooks": notebooks},
+            "columnar": {"notebooks/public/data.csv": {"sha256": hashlib.sha256(data.encode()).hexdigest()}},
+        }
+        (shard_dir / build.MANIFEST_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+        stats = {"wall_time_s": 1.0, "cached": False, "peak_rss_bytes": 0, "html_bytes": 0, "asset_bytes": 0}
+        report = {"notebooks": {"notebooks/demo.py": stats}}
+        (shard_dir / build.REPORT_FILE).write_text(json.dumps(report), encoding="utf-8")
+
+    merged = tmp_path / "merged"
+    build._merge(
+        merged, sorted((tmp_path / "shards").iterdir()), ROOT / "templates" / "tailwind.html.j2",
+        compress=False, service_worker=False, precompute_locks=False,
+    )
+
+    assert (merged / "notebooks" / "public" / "data.csv").read_text(encoding="utf-8") == "x\n2\n"
+    manifest = json.loads((merged / build.MANIFEST_FILE).read_text())
+    assert manifest["columnar"]["notebooks/public/data.csv"]["sha256"] == hashlib.sha256(b"x\n2\n").hexdigest()
+
+
+def test_check_budgets_counts_wheels_from_the_lock_file(export, monkeypatch):
+    # numpy is needed by pandas and by the notebook, and is only counted once
+    lock = {
+        "info": BASE_LOCK["info"],
+        "packages": {
+            "pandas": {"name": "pandas", "file_name": "pandas-2.2.3-cp312-cp312-pyodide_2024_0_wasm32.whl", "depends": ["numpy"]},
+            "numpy": {"name": "numpy", "file_name": "numpy-2.0.2-cp312-cp312-pyodide_2024_0_wasm32.whl", "depends": []},
+            "polars": {"name": "polars", "file_name": "https://files.example/polars-1.0.0-py3-none-any.whl", "depends": []},
+        },
+    }
+    sizes = {
+        "https://cdn.jsdelivr.net/pyodide/v0.27.5/full/pandas-2.2.3-cp312-cp312-pyodide_2024_0_wasm32.whl": 10_000_000,
+        "https://cdn.jsdelivr.net/pyodide/v0.27.5/full/numpy-2.0.2-cp312-cp312-pyodide_2024_0_wasm32.whl": 5_000_000,
+        "https://files.example/polars-1.0.0-py3-none-any.whl": 30_000_000,
+    }
+    requests = []
+
+    def urlopen(url, timeout=None):
+        if isinstance(url, build.urllib.request.Request):
+            requests.append(url.full_url)
+            response = io.BytesIO()
+            response.headers = {"Content-Length": str(sizes[url.full_url])}
+            return response
+        if url.startswith(build.PYODIDE_LOCK_URL.split("?")[0]):
+            return io.BytesIO(json.dumps(lock).encode())
+        raise OSError(f"404 {url}")
+
+    monkeypatch.setattr(build.urllib.request, "urlopen", urlopen)
+    Path("notebooks/demo.py").write_text(
+        '# /// script\n# dependencies = ["marimo", "pandas", "polars", "numpy", "mystery"]\n'
+        '#\n# [tool.marimo-build]\n# budget = "40 MB"\n# ///\n',
+        encoding="utf-8",
+    )
+    manifest = {"notebooks": {"notebooks/demo.py": {"html_path": "notebooks/demo.html"}}}
+    html_bytes = (export / "notebooks" / "demo.html").stat().st_size
+
+    for _ in range(2):
+        report: dict = {"notebooks": {}}
+        assert not build._check_budgets(export, manifest, report, {})
+        assert report["notebooks"]["notebooks/demo.py"]["payload_bytes"] == html_bytes + 45_000_000
+
+    # The wheel sizes are cached in the manifest, and only looked up once
+    assert sorted(requests) == sorted(sizes)
+    breakdown = build._page_breakdown(Path("notebooks/demo.py"), export, {}, manifest, {})
+    # mystery is neither in the lock file nor on PyPI, so its size is unknown
+    assert breakdown["packages"] == {"pandas": 15_000_000, "polars": 30_000_000, "numpy": 0, "mystery": None}
+
+
+def test_snapshot_outputs_of_a_static_export():
+    # Exported with `marimo export html` by marimo 0.13.15, from a notebook with a markdown cell,
+    # a cell that prints and a cell that ends with an expression
+    page = (ROOT / "tests" / "data" / "static-export-0.13.15.html").read_text(encoding="utf-8")
+
+    outputs = build._snapshot_outputs(page)
+
+    assert [cell_id for cell_id, _ in outputs] == ["MJUe", "bkHC"]
+    assert "Hello" in outputs[0][1]
+    assert outputs[1][1].endswith(">2</pre>")
+
+    # Newer versions of marimo pass the state to Object.defineProperty()
+    state = re.search(r"notebookState = (\{.*\});", page).group(1)
+    newer = f'Object.defineProperty(window, "__MARIMO_STATIC__", {{value: {{"notebookState": {state}}}}});'
+    assert build._snapshot_outputs(newer) == outputs
+    # A page without the state is an error, not an empty snapshot
+    with pytest.raises(ValueError, match="no notebook state"):
+        build._snapshot_outputs(page.replace("notebookState", "otherState"))
+
+
+def test_bootstrap_public_modules(export):
+    # The notebook imports a module from its public/ folder, which counts as one of its assets
+    (export.parent / "notebooks" / "public").mkdir()
+    (export.parent / "notebooks" / "public" / "helpers.py").write_text("ANSWER = 42\n", encoding="utf-8")
+    code = (
+        "import marimo\n\napp = marimo.App()\n\n\n@app.cell\ndef _():\n"
+        "    import helpers\n    import json\n    return (helpers,)\n"
+    )
+    Path("notebooks/demo.py").write_text(code, encoding="utf-8")
+    assert build._asset_references(Path("notebooks/demo.py")) == [Path("notebooks/public/helpers.py")]
+
+    page = f"<html><body><marimo-code hidden>{build.urllib.parse.quote(code)}</marimo-code></body></html>"
+    result = build._bootstrap_public_modules(page, Path("notebooks/demo.py"))
+
+    content = re.search(r"<marimo-code hidden>(.*)</marimo-code>", result, re.S).group(1)
+    bootstrapped = build.urllib.parse.unquote(content)
+    bootstrap = build.PUBLIC_MODULE_BOOTSTRAP.format(module="helpers")
+    assert bootstrapped == code.replace("    import helpers\n", textwrap.indent(bootstrap, "    ") + "    import helpers\n")
+    # It only does something in pyodide, so the code still runs locally
+    exec(compile(bootstrap, "bootstrap", "exec"), {})
+
+
+@pytest.mark.skipif(not Path("/proc/self/status").exists(), reason="needs /proc")
+def test_run_measured_reports_the_peak_of_the_child_itself():
+    # The build process is much larger than the child, which must not inherit its peak
+    ballast = bytearray(300 * 10**6)
+    code = "x = bytearray(50 * 10**6); import time; time.sleep(0.2)"
+
+    _, _, peak_rss = build._run_measured([sys.executable, "-c", code])
+
+    assert 50 * 10**6 < peak_rss < len(ballast)
+
+
+def test_create_environment_upgrades_unpinned_requirements(tmp_path, monkeypatch):
+    commands = []
+    monkeypatch.setattr(build.subprocess, "run", lambda cmd, **kwargs: commands.append(cmd))
+    old = build.time.time() - build.ENV_MAX_AGE_S - 60
+    for dependencies in (("marimo==0.13.15", "polars==1.30.0"), ("marimo", "polars==1.30.0")):
+        env_dir = tmp_path / "-".join(dependencies)
+        env_dir.mkdir()
+        (env_dir / ".complete").touch()
+        build.os.utime(env_dir / ".complete", (old, old))
+        assert build._create_environment(dependencies, env_dir) is not None
+
+    # The pinned environment is reused as it is, the other one is upgraded in place
+    assert commands == [[
+        "uv", "pip", "install", "--quiet", "--upgrade", "--python", str(tmp_path / "marimo-polars==1.30.0"),
+        "marimo", "polars==1.30.0",
+    ]]
+    assert build.time.time() - (tmp_path / "marimo-polars==1.30.0" / ".complete").stat().st_mtime < 60
+
+
+def test_cache_key_changes_with_its_inputs(export):
+    notebook = Path("notebooks/demo.py")
+    body = (
+        "import marimo\n\napp = marimo.App()\n\n\n@app.cell\ndef _(mo):\n"
+        '    path = mo.notebook_location() / "public" / "data.csv"\n    return\n'
+    )
+    notebook.write_text("# /// script\n# dependencies = [\"polars\"]\n# ///\n" + body, encoding="utf-8")
+    Path("notebooks/public").mkdir()
+    Path("notebooks/public/data.csv").write_text("x\n1\n", encoding="utf-8")
+    digests: dict = {}
+    key = build._cache_key(notebook, False, "0.13.15", digests)
+    assert build._cache_key(notebook, False, "0.13.15", digests) == key
+
+    keys = {key}
+    keys.add(build._cache_key(notebook, False, "0.14.0", digests))
+    keys.add(build._cache_key(notebook, True, "0.13.15", digests))
+    keys.add(build._cache_key(notebook, False, "0.13.15", digests, snapshot=True))
+    Path("notebooks/public/data.csv").write_text("x\n10\n", encoding="utf-8")
+    keys.add(build._cache_key(notebook, False, "0.13.15", digests))
+    notebook.write_text("# /// script\n# dependencies = [\"pandas\"]\n# ///\n" + body, encoding="utf-8")
+    keys.add(build._cache_key(notebook, False, "0.13.15", digests))
+    notebook.write_text("# /// script\n# dependencies = [\"pandas\"]\n# ///\n" + body.replace("path =", "data ="), encoding="utf-8")
+    keys.add(build._cache_key(notebook, False, "0.13.15", digests))
+    assert len(keys) == 7
+
+
+def test_affected_notebooks_follows_asset_changes(export):
+    Path("notebooks/demo.py").write_text(
+        'import marimo\n\napp = marimo.App()\n\n\n@app.cell\ndef _(mo):\n'
+        '    path = mo.notebook_location() / "public" / "data.csv"\n    return\n',
+        encoding="utf-8",
+    )
+    Path("notebooks/other.py").write_text("import marimo\n\napp = marimo.App()\n", encoding="utf-8")
+    Path("notebooks/public").mkdir()
+    Path("notebooks/public/data.csv").write_text("x\n1\n", encoding="utf-8")
+    template = Path("index.html.j2")
+    template.write_text("{{ notebooks }}", encoding="utf-8")
+    manifest = {"notebooks": {"notebooks/demo.py": {}, "notebooks/other.py": {}, "notebooks/removed.py": {}}}
+
+    # Only the notebook that uses the asset is exported again, and the removed notebook is forgotten
+    to_export, regenerate_index = build._affected_notebooks(
+        {Path("notebooks/public/data.csv").resolve()}, template, manifest
+    )
+    assert to_export == [(Path("notebooks/demo.py"), False)]
+    assert regenerate_index
+    assert sorted(manifest["notebooks"]) == ["notebooks/demo.py", "notebooks/other.py"]
+
+    # A changed notebook is exported again, and the index only follows a new notebook or the template
+    assert build._affected_notebooks({Path("notebooks/other.py").resolve()}, template, manifest) == (
+        [(Path("notebooks/other.py"), False)], False
+    )
+    assert build._affected_notebooks({template.resolve()}, template, manifest) == ([], True)
+    Path("notebooks/new.py").write_text("import marimo\n\napp = marimo.App()\n", encoding="utf-8")
+    assert build._affected_notebooks({Path("notebooks/new.py").resolve()}, template, manifest) == (
+        [(Path("notebooks/new.py"), False)], True
+    )
+
+
+def test_notebook_problems(tmp_path):
+    notebook = tmp_path / "broken.py"
+    notebook.write_text(
+        "import marimo\n\napp = marimo.App()\n\n\n"
+        "@app.cell\ndef _():\n    x = 1\n    _private = 2\n    return (x,)\n\n\n"
+        "@app.cell\ndef _():\n    x = 2\n    _private = 3\n    return (x,)\n\n\n"
+        "@app.cell\ndef _(x):\n    print(x + y, len([x]))\n    return\n\n\n"
+        "@app.cell\ndef _(b):\n    a = b\n    return (a,)\n\n\n"
+        "@app.cell\ndef _(a):\n    b = a\n    return (b,)\n",
+        encoding="utf-8",
+    )
+
+    problems = build._notebook_problems(notebook)
+
+    # Private names can be defined by several cells, and builtins need no cell
+    assert problems == [
+        f"{notebook}:14: 'x' is also defined by the cell at line 7",
+        f"{notebook}:21: 'y' is used, but no cell defines it",
+        f"{notebook}:27: the cells at lines 27 -> 33 -> 27 depend on each other in a cycle",
+    ]
+    clean = ROOT / "notebooks" / "penguins.py"
+    assert build._notebook_problems(clean) == []
+    assert build._validate_notebooks([notebook, clean], "warn") == {notebook}
+
+
+def test_partitions_are_read_back_by_the_loader(tmp_path, monkeypatch):
+    table = pa.table({
+        "kommune": ["0301", "4601", "0301", "a/b", None],
+        "ansatte": [5, 50, 7, 1, 3],
+    })
+    path = tmp_path / "data.parquet"
+    pq.write_table(table, path)
+
+    manifest = build._partition_parquet(path, "kommune")
+
+    assert [(partition["value"], partition["rows"]) for partition in manifest["partitions"]] == [
+        ("0301", 2), ("4601", 1), ("a/b", 1), (None, 1),
+    ]
+    assert manifest["partitions"][0]["stats"]["ansatte"] == {"min": 5, "max": 7}
+    assert sum(partition["rows"] for partition in manifest["partitions"]) == table.num_rows
+
+    # Only the partitions whose statistics can match are read
+    read = []
+    read_table = build.dataloader.read_table
+    monkeypatch.setattr(build.dataloader, "read_table", lambda path, **kwargs: read.append(path.name) or read_table(path, **kwargs))
+    assert build.dataloader.read_partitions(path, kommune="0301").to_pylist() == [
+        {"kommune": "0301", "ansatte": 5}, {"kommune": "0301", "ansatte": 7},
+    ]
+    assert read == ["kommune=0301.parquet"]
+    assert build.dataloader.read_partitions(path, kommune="a/b")["ansatte"].to_pylist() == [1]
+    # Without a match the result is empty, but has the columns
+    empty = build.dataloader.read_partitions(path, kommune="9999")
+    assert empty.num_rows == 0 and empty.column_names == ["kommune", "ansatte"]
+
+
+
+def test_assign_shards():
+    notebooks = [Path(f"notebooks/nb{index}.py") for index in range(7)]
+    durations = {"notebooks/nb0.py": 100.0, "notebooks/nb1.py": 30.0, "notebooks/nb2.py": 30.0, "notebooks/nb3.py": 10.0}
+
+    shards = build._assign_shards(notebooks, durations, 3)
+
+    # Every notebook is in exactly one shard, and the order of the input doesn't matter
+    assert sorted(nb for shard in shards for nb in shard) == notebooks
+    assert build._assign_shards(list(reversed(notebooks)), dict(reversed(durations.items())), 3) == shards
+    # The longest notebook gets a shard of its own, and the others (42.5s, the average, if unknown) share the rest
+    assert shards == [
+        [Path("notebooks/nb0.py")],
+        [Path("notebooks/nb3.py"), Path("notebooks/nb4.py"), Path("notebooks/nb6.py")],
+        [Path("notebooks/nb1.py"), Path("notebooks/nb2.py"), Path("notebooks/nb5.py")],
+    ]
+    # More shards than notebooks leaves some empty
+    assert build._assign_shards(notebooks[:2], {}, 3)[2] == []
+
+
+def test_write_service_worker(export):
+    public = export / "notebooks" / "public"
+    public.mkdir()
+    (public / "data.csv").write_text("x\n1\n", encoding="utf-8")
+    (public / "data.csv.gz").write_bytes(b"sidecar")
+    (export / build.LOCKS_DIR).mkdir()
+    (export / build.LOCKS_DIR / "0123456789abcdef.json").write_text("{}", encoding="utf-8")
+    lock = f"{build.LOCKS_DIR}/0123456789abcdef.json"
+    manifest = {"notebooks": {"notebooks/demo.py": {"html_path": "notebooks/demo.html", "lock": lock}}}
+
+    def _build_constants():
+        script = (export / build.SERVICE_WORKER_FILE).read_text(encoding="utf-8")
+        prefix = build.SERVICE_WORKER_SCRIPT.split("__BUILD__")[0]
+        assert script.startswith(prefix)
+        return json.JSONDecoder().raw_decode(script, len(prefix))[0]
+
+    build._write_service_worker(export, manifest)
+    constants = _build_constants()
+
+    # Files without a version in their URL are cached by content hash, the sidecars are left to the server
+    script_digest = hashlib.sha256(b"console.log('frontend')").hexdigest()[:16]
+    assert constants["runtime"]["notebooks/assets/index-abc123.js"] == script_digest
+    cdn = build.PYODIDE_CDN_URL.format(version="0.27.5")
+    assert constants["runtime"][cdn + "pyodide.asm.wasm"] == cdn + "pyodide.asm.wasm"
+    assert constants["data"] == {"notebooks/public/data.csv": hashlib.sha256(b"x\n1\n").hexdigest()[:16]}
+    assert {"notebooks/assets/", cdn, f"{build.LOCKS_DIR}/"} <= set(constants["immutable"])
+    assert constants["locks"] == {"notebooks/demo.html": lock}
+
+    # A new deploy only changes the hash of the file that changed
+    (public / "data.csv").write_text("x\n2\n", encoding="utf-8")
+    build._write_service_worker(export, manifest)
+    changed = _build_constants()
+    assert changed["data"]["notebooks/public/data.csv"] != constants["data"]["notebooks/public/data.csv"]
+    assert changed["runtime"] == constants["runtime"]
@@ -0,0 +1,161 @@
+"""Tests for the notebooks' data loader, notebooks/public/dataloader.py."""
+
+import functools
+import http.server
+import io
+import random
+import re
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import dataloader
+
+PUBLIC = Path(__file__).parent.parent / "notebooks" / "public"
+
+
+def test_read_columnar_falls_back_to_csv():
+    # There is no Parquet copy next to the CSV outside a build, so the CSV itself is read,
+    # with empty values as null like in polars
+    table = dataloader.read_columnar(PUBLIC / "penguins.csv")
+
+    assert table.num_rows == 344
+    assert table["sex"].null_count == 11
+
+
+class _RangeHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves the files in a folder, with single byte ranges like GitHub Pages does."""
+
+    def send_head(self):
+        self.server.requests.append(self.headers.get("Range"))
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range") or "")
+        path = Path(self.translate_path(self.path))
+        if match is None or not path.is_file():
+            return super().send_head()
+        size = path.stat().st_size
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(size - 1, int(last) if last else size - 1)
+        else:
+            start, end = max(0, size - int(last)), size - 1
+        with path.open("rb") as file:
+            file.seek(start)
+            data = file.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        return io.BytesIO(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _WholeFileHandler(_RangeHandler):
+    """Serves the files in a folder, ignoring the Range header like a plain static server."""
+
+    def send_head(self):
+        self.server.requests.append(self.headers.get("Range"))
+        return http.server.SimpleHTTPRequestHandler.send_head(self)
+
+
+@pytest.fixture(scope="module")
+def data(tmp_path_factory):
+    """A Parquet file sorted by "n", with 10 row groups of 5 000 rows each. Returns its path."""
+    count = 50_000
+    generator = random.Random(0)
+    table = pa.table({
+        "n": pa.array(range(count), pa.int64()),
+        "x": pa.array([generator.random() for _ in range(count)]),
+        "s": pa.array([f"rad {i}" for i in range(count)]),
+    })
+    path = tmp_path_factory.mktemp("public") / "data.parquet"
+    pq.write_table(table, path, row_group_size=5_000, compression="none")
+    return path
+
+
+@pytest.fixture(params=[_RangeHandler, _WholeFileHandler], ids=["ranges", "whole-file"])
+def server(request, data):
+    """An http server for the folder of the data file. Returns it; its .requests lists the Range headers."""
+    handler = functools.partial(request.param, directory=str(data.parent))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/{data.name}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_read_table_over_http(server, data):
+    # Filters and columns give the same rows as reading the whole file locally, with or without ranges
+    filters = [("n", ">=", 12_000), ("n", "<", 26_000)]
+
+    table = dataloader.read_table(server.url, columns=["s"], filters=filters)
+
+    assert table.equals(pq.read_table(data, columns=["s"], filters=filters))
+
+
+def test_read_table_prunes_row_groups(server, data):
+    # Only row group 3 can contain n = 17 000, so only its columns are downloaded, after the footer
+    table = dataloader.read_table(server.url, filters=[("n", "=", 17_000)])
+
+    assert table.to_pylist() == [{"n": 17_000, "x": pq.read_table(data)["x"][17_000].as_py(), "s": "rad 17000"}]
+    if server.RequestHandlerClass.func is _RangeHandler:
+        row_group = pq.read_metadata(data).row_group(3)
+        chunks = [row_group.column(i) for i in range(row_group.num_columns)]
+        start = min(chunk.dictionary_page_offset if chunk.has_dictionary_page else chunk.data_page_offset for chunk in chunks)
+        end = start + sum(chunk.total_compressed_size for chunk in chunks)
+        assert server.requests == [f"bytes=-{dataloader.FOOTER_BYTES}", f"bytes={start}-{end - 1}"]
+    else:
+        # Without range support, the first request gets the whole file and nothing more is fetched
+        assert server.requests == [f"bytes=-{dataloader.FOOTER_BYTES}"]
+
+
+def test_read_table_without_matching_row_groups(server):
+    # No row group can contain the value, so nothing but the footer is downloaded
+    table = dataloader.read_table(server.url, columns=["s"], filters=[("n", "=", -1)])
+
+    assert table.num_rows == 0
+    assert table.column_names == ["s"]
+    assert server.requests == [f"bytes=-{dataloader.FOOTER_BYTES}"]
+
+
+@pytest.mark.parametrize("server", [_RangeHandler], indirect=True, ids=["ranges"])
+def test_read_table_coalesces_ranges(server, data, monkeypatch):
+    # The "x" columns of the row groups are close enough to be fetched in one request, unless
+    # the allowed gap is smaller than the "s" and "n" columns between them
+    dataloader.read_table(server.url, columns=["x"])
+    assert len(server.requests) == 2
+
+    server.requests.clear()
+    monkeypatch.setattr(dataloader, "RANGE_GAP", 0)
+    table = dataloader.read_table(server.url, columns=["x"])
+    assert len(server.requests) == 1 + pq.read_metadata(data).num_row_groups
+    assert table.equals(pq.read_table(data, columns=["x"]))
+
+
+def test_read_batches_reads_one_row_group_at_a_time(server, data):
+    # Each row group is fetched right before it is read, after the footer
+    batches = list(dataloader.read_batches(server.url, columns=["n"]))
+
+    assert [batch.num_rows for batch in batches] == [5_000] * 10
+    assert pa.concat_tables(batches).equals(pq.read_table(data, columns=["n"]))
+    if server.RequestHandlerClass.func is _RangeHandler:
+        assert len(server.requests) == 1 + len(batches)
+    else:
+        assert server.requests == [f"bytes=-{dataloader.FOOTER_BYTES}"]
+
+
+def test_read_progressively_keeps_the_row_groups(data):
+    pytest.importorskip("marimo")
+
+    table = dataloader.read_progressively(data, preview_rows=3)
+
+    # The row groups become the chunks of the columns, without being copied into one
+    assert table.equals(pq.read_table(data))
+    assert table["n"].num_chunks == 10